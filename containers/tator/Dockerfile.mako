@@ -43,7 +43,7 @@ RUN pip3 --no-cache-dir --timeout=1000 install \
         requests==2.22.0 python-dateutil==2.8.1 ujson==1.35 slackclient==2.3.1 \
         google-auth==1.6.3 elasticsearch==7.1.0 progressbar2==3.47.0 \
         gevent==1.4.0 uritemplate==3.0.1 pylint pylint-django \
-        django-cognito-jwt==0.0.3 boto3==1.16.41
+        django-cognito-jwt==0.0.3 boto3==1.16.41 av==8.0.3
 
 # Get acme_tiny.py for certificate renewal
 WORKDIR /
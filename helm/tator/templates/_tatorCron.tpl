@@ -48,6 +48,14 @@ spec:
                   value: {{ .Values.redisHost }}
                 - name: ELASTICSEARCH_HOST
                   value: {{ .Values.elasticsearchHost }}
+                - name: ASYNC_INDEXING
+                  value: {{ .Values.asyncIndexing | default false | quote }}
+                - name: MAX_INDEX_LAG
+                  value: {{ .Values.maxIndexLag | default 2.0 | quote }}
+                - name: ELASTICSEARCH_READ_MODEL
+                  value: {{ .Values.readModel | default false | quote }}
+                - name: ELASTICSEARCH_READ_MODEL_MAX_LAG
+                  value: {{ .Values.readModelMaxLag | default 5.0 | quote }}
                 - name: MAIN_HOST
                   value: {{ .Values.domain }}
                 - name: DOCKER_USERNAME
@@ -36,6 +36,114 @@ class TatorCache:
         group = f'creds_{project_id}'
         self.rds.delete(group)
 
+    def get_mapping_version(self, index):
+        """ Returns the current version of the cached mapping for an index.
+        """
+        version = self.rds.get(f'mapping_version_{index}')
+        if version is not None:
+            version = int(version)
+        else:
+            version = 0
+        return version
+
+    def get_mapping_cache(self, index, version):
+        """ Returns cached mapping properties for an index, or None if there are no
+            properties cached for the given version.
+        """
+        val = self.rds.get(f'mapping_{index}')
+        if val is not None:
+            val = json.loads(val)
+            if val['version'] == version:
+                val = val['properties']
+            else:
+                val = None
+        return val
+
+    def set_mapping_cache(self, index, version, properties):
+        self.rds.set(f'mapping_{index}', json.dumps({'version': version,
+                                                     'properties': properties}))
+
+    def invalidate_mapping_cache(self, index):
+        self.rds.incr(f'mapping_version_{index}')
+        self.rds.delete(f'mapping_{index}')
+
+    def get_registry_version(self, project_id):
+        """ Returns the current version of the type registry for a project.
+        """
+        version = self.rds.get(f'registry_version_{project_id}')
+        if version is not None:
+            version = int(version)
+        else:
+            version = 0
+        return version
+
+    def invalidate_registry(self, project_id):
+        self.rds.incr(f'registry_version_{project_id}')
+
+    def get_segment_index_version(self, media_id):
+        """ Returns the current version of the cached segment indexes for a media.
+        """
+        version = self.rds.get(f'segment_index_version_{media_id}')
+        if version is not None:
+            version = int(version)
+        else:
+            version = 0
+        return version
+
+    def get_segment_index(self, media_id, field):
+        return self.rds.hget(f'segment_index_{media_id}', field)
+
+    def set_segment_index(self, media_id, field, val, ttl):
+        """ Stores a segment index. Indexes of a media expire ttl seconds after the last
+            one was stored.
+        """
+        key = f'segment_index_{media_id}'
+        pipe = self.rds.pipeline()
+        pipe.hset(key, field, val)
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    def invalidate_segment_index(self, media_id):
+        self.rds.incr(f'segment_index_version_{media_id}')
+        self.rds.delete(f'segment_index_{media_id}')
+
+    def incr_render_cache_stat(self, stat):
+        """ Increments a render cache counter (local_hit, storage_hit, miss or
+            not_modified).
+        """
+        self.rds.hincrby('render_cache_stats', stat)
+
+    def get_render_cache_stats(self):
+        return {key.decode(): int(val)
+                for key, val in self.rds.hgetall('render_cache_stats').items()}
+
+    def add_reindex_deletes(self, project_id, queries):
+        """ Records queries matching documents deleted while a project is reindexed.
+        """
+        if queries:
+            self.rds.rpush(f'reindex_deletes_{project_id}',
+                           *[json.dumps(query) for query in queries])
+
+    def get_reindex_deletes(self, project_id):
+        return [json.loads(val)
+                for val in self.rds.lrange(f'reindex_deletes_{project_id}', 0, -1)]
+
+    def clear_reindex_deletes(self, project_id):
+        self.rds.delete(f'reindex_deletes_{project_id}')
+
+    def set_search_task(self, task_id, project_id, description):
+        """ Stores the project and description of an elasticsearch task so that its
+            progress can be retrieved through the REST API.
+        """
+        self.rds.hset('search_tasks', task_id, json.dumps({'project': project_id,
+                                                           'description': description}))
+
+    def get_search_task(self, task_id):
+        val = self.rds.hget('search_tasks', task_id)
+        if val is not None:
+            val = json.loads(val)
+        return val
+
     def set_upload_permission_cache(self, upload_uid, token):
         self.rds.hset('uploads', upload_uid, token)
 
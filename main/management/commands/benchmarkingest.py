@@ -0,0 +1,88 @@
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import force_authenticate
+
+from main.models import Localization
+from main.models import LocalizationType
+from main.models import Media
+from main.models import User
+from main.rest.localization import LocalizationListAPI
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Measures sustained localization ingest throughput by posting batches of boxes '
+            'to the localization list endpoint. Created localizations are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', type=int, required=True,
+                            help='ID of a box localization type.')
+        parser.add_argument('--media', type=int, required=True,
+                            help='ID of the media to annotate.')
+        parser.add_argument('--user', type=int, required=True,
+                            help='ID of the user making the requests.')
+        parser.add_argument('--count', type=int, default=50000,
+                            help='Number of localizations per request.')
+        parser.add_argument('--requests', type=int, default=5,
+                            help='Number of requests to make.')
+        parser.add_argument('--parents', action='store_true',
+                            help='Give each localization a parent created by the previous '
+                                 'request.')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the created localizations.')
+
+    def _specs(self, entity_type, media, count, parents):
+        specs = []
+        for idx in range(count):
+            spec = {
+                'type': entity_type.pk,
+                'media_id': media.pk,
+                'frame': idx % max(media.num_frames or 1, 1),
+                'x': random.uniform(0.0, 0.5),
+                'y': random.uniform(0.0, 0.5),
+                'width': random.uniform(0.0, 0.5),
+                'height': random.uniform(0.0, 0.5),
+            }
+            if parents:
+                spec['parent'] = parents[idx % len(parents)]
+            for attr_type in entity_type.attribute_types:
+                if 'default' in attr_type:
+                    spec[attr_type['name']] = attr_type['default']
+            specs.append(spec)
+        return specs
+
+    def handle(self, **options):
+        entity_type = LocalizationType.objects.get(pk=options['type'])
+        media = Media.objects.get(pk=options['media'])
+        user = User.objects.get(pk=options['user'])
+        factory = APIRequestFactory()
+        view = LocalizationListAPI.as_view()
+        created = []
+        parents = []
+        elapsed = 0.0
+        for idx in range(options['requests']):
+            specs = self._specs(entity_type, media, options['count'],
+                                parents if options['parents'] else [])
+            request = factory.post(f'/rest/Localizations/{entity_type.project.pk}', specs,
+                                   format='json')
+            force_authenticate(request, user=user)
+            start = time.time()
+            response = view(request, project=entity_type.project.pk)
+            duration = time.time() - start
+            if response.status_code != 201:
+                raise Exception(f"Request failed: {response.data}")
+            elapsed += duration
+            parents = response.data['id']
+            created += parents
+            self.stdout.write(f"Request {idx}: {len(specs)} localizations in {duration:.2f}s "
+                              f"({len(specs) / duration:.0f}/s)")
+        self.stdout.write(f"Sustained ingest throughput: {len(created) / elapsed:.0f} "
+                          f"localizations/s over {len(created)} localizations.")
+        if not options['keep']:
+            qs = Localization.objects.filter(pk__in=created)
+            qs.update(parent=None)
+            qs.delete()
@@ -2,12 +2,21 @@ from django.core.management.base import BaseCommand
 from main.util import buildSearchIndices
 
 class Command(BaseCommand):
+    help = 'Builds search indices for a project section, optionally for a single ID range chunk.'
+
     def add_arguments(self, parser):
         parser.add_argument('project_id', type=int)
         parser.add_argument('section', type=str)
-        parser.add_argument('chunk', type=int)
-        parser.add_argument('max_age_days', type=int)
+        parser.add_argument('chunk', type=str, nargs='?', default=None,
+                            help='ID range "min_id:max_id" from getindexchunks. If omitted, '
+                                 'all chunks are built.')
+        parser.add_argument('max_age_days', type=int, nargs='?', default=None)
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes used when building all chunks.')
 
     def handle(self, **options):
-        buildSearchIndices(options['project_id'], options['section'], 'index', options['chunk'],
-                           options['max_age_days'])
+        chunk = options['chunk']
+        if chunk is not None:
+            chunk = tuple(int(bound) for bound in chunk.split(':'))
+        buildSearchIndices(options['project_id'], options['section'], 'index', chunk,
+                           options['max_age_days'], options['processes'])
@@ -1,5 +1,7 @@
+import json
+
 from django.core.management.base import BaseCommand
-from main.util import get_num_index_chunks
+from main.util import get_index_chunks
 
 class Command(BaseCommand):
     def add_arguments(self, parser):
@@ -8,4 +10,5 @@ class Command(BaseCommand):
         parser.add_argument('max_age_days', type=int)
 
     def handle(self, **options):
-        print(list(range(get_num_index_chunks(options['project_id'], options['section'], options['max_age_days']))))
+        chunks = get_index_chunks(options['project_id'], options['section'], options['max_age_days'])
+        print(json.dumps([f'{min_id}:{max_id}' for min_id, max_id in chunks]))
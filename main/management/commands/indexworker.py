@@ -0,0 +1,34 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from main.util import getIndexQueueLag
+from main.util import processIndexQueue
+from main.util import waitForMigrations
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Drains the search index queue, writing queued entities to elasticsearch in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=1000)
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty.')
+
+    def handle(self, **options):
+        waitForMigrations()
+        while True:
+            count = processIndexQueue(options['batch_size'])
+            if count > 0:
+                logger.info(f"Indexed {count} queued entities.")
+            lag = getIndexQueueLag()
+            if lag > settings.MAX_INDEX_LAG:
+                logger.warning(f"Index queue lag is {lag:.1f} seconds, exceeding "
+                               f"MAX_INDEX_LAG of {settings.MAX_INDEX_LAG} seconds!")
+            if count == 0:
+                if options['once']:
+                    break
+                # Poll at half the lag limit so idle queues are drained within it.
+                time.sleep(settings.MAX_INDEX_LAG / 2)
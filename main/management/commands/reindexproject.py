@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from main.util import reindexProject
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search index for a project into a new index version without downtime.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes used to build documents.')
+        parser.add_argument('--shards', type=int, default=None,
+                            help='Number of shards for the new index. Computed from row '
+                                 'counts if omitted.')
+
+    def handle(self, **options):
+        reindexProject(options['project_id'], options['processes'], options['shards'])
@@ -0,0 +1,14 @@
+import json
+
+from django.core.management.base import BaseCommand
+from main.render_cache import get_render_cache_stats
+
+class Command(BaseCommand):
+    help = 'Prints render cache lookup counts by outcome and the overall hit rate.'
+
+    def handle(self, **options):
+        stats = get_render_cache_stats()
+        hits = stats.get('local_hit', 0) + stats.get('storage_hit', 0) + stats.get('not_modified', 0)
+        total = hits + stats.get('miss', 0)
+        stats['hit_rate'] = hits / total if total else None
+        print(json.dumps(stats, indent=4))
@@ -1,5 +1,6 @@
 import os
 import traceback
+from copy import deepcopy
 
 from django.contrib.gis.db.models import Model
 from django.contrib.gis.db.models import ForeignKey
@@ -27,9 +28,12 @@ from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import UserManager
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.fields import JSONField
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator
 from django.core.validators import RegexValidator
 from django.db.models import FloatField, Transform,UUIDField
+from django.db.models import Index
+from django.db.models import QuerySet
 from django.db.models.signals import post_save
 from django.db.models.signals import pre_delete
 from django.db.models.signals import post_delete
@@ -42,6 +46,9 @@ from django_ltree.fields import PathField
 from django.db import transaction
 
 from .search import TatorSearch
+from .registry import invalidate_project_types
+from .segment_index import invalidate_segment_indexes
+from .render_cache import delete_renders
 from .download import download_file
 from .s3 import TatorS3
 
@@ -67,6 +74,25 @@ class Depth(Transform):
 
 PathField.register_lookup(Depth)
 
+class LowerNameIndex(Index):
+    """ Index on the project, lower case name and ID of media, with names compared by code
+        point. Serves the order and keyset predicates of media lists. Django 2.2 does not
+        support indexes on expressions, so the statement is written here.
+    """
+    def __init__(self, name):
+        super().__init__(fields=['project', 'name', 'id'], name=name)
+
+    def deconstruct(self):
+        path, _, kwargs = super().deconstruct()
+        return path, (), {'name': kwargs['name']}
+
+    def create_sql(self, model, schema_editor, using=''):
+        quote = schema_editor.quote_name
+        project = model._meta.get_field('project').column
+        name = model._meta.get_field('name').column
+        return (f'CREATE INDEX {quote(self.name)} ON {quote(model._meta.db_table)} '
+                f'({quote(project)}, lower({quote(name)}) COLLATE "C", "id")')
+
 FileFormat= [('mp4','mp4'), ('webm','webm'), ('mov', 'mov')]
 ImageFileFormat= [('jpg','jpg'), ('png','png'), ('bmp', 'bmp'), ('raw', 'raw')]
 
@@ -249,6 +275,7 @@ def make_default_version(instance):
 @receiver(post_save, sender=Project)
 def project_save(sender, instance, created, **kwargs):
     TatorSearch().create_index(instance.pk)
+    invalidate_project_types(instance.pk)
     if created:
         make_default_version(instance)
     if instance.thumb:
@@ -434,6 +461,11 @@ class MediaType(Model):
 @receiver(post_save, sender=MediaType)
 def media_type_save(sender, instance, **kwargs):
     TatorSearch().create_mapping(instance)
+    invalidate_project_types(instance.project_id)
+
+@receiver(post_delete, sender=MediaType)
+def media_type_delete(sender, instance, **kwargs):
+    invalidate_project_types(instance.project_id)
 
 class LocalizationType(Model):
     dtype = CharField(max_length=16,
@@ -479,6 +511,11 @@ class LocalizationType(Model):
 @receiver(post_save, sender=LocalizationType)
 def localization_type_save(sender, instance, **kwargs):
     TatorSearch().create_mapping(instance)
+    invalidate_project_types(instance.project_id)
+
+@receiver(post_delete, sender=LocalizationType)
+def localization_type_delete(sender, instance, **kwargs):
+    invalidate_project_types(instance.project_id)
 
 class StateType(Model):
     dtype = CharField(max_length=16, choices=[('state', 'state')], default='state')
@@ -531,6 +568,11 @@ class StateType(Model):
 @receiver(post_save, sender=StateType)
 def state_type_save(sender, instance, **kwargs):
     TatorSearch().create_mapping(instance)
+    invalidate_project_types(instance.project_id)
+
+@receiver(post_delete, sender=StateType)
+def state_type_delete(sender, instance, **kwargs):
+    invalidate_project_types(instance.project_id)
 
 class LeafType(Model):
     dtype = CharField(max_length=16, choices=[('leaf', 'leaf')], default='leaf')
@@ -570,7 +612,97 @@ class LeafType(Model):
 @receiver(post_save, sender=LeafType)
 def leaf_type_save(sender, instance, **kwargs):
     TatorSearch().create_mapping(instance)
+    invalidate_project_types(instance.project_id)
+
+@receiver(post_delete, sender=LeafType)
+def leaf_type_delete(sender, instance, **kwargs):
+    invalidate_project_types(instance.project_id)
+
 
+class IndexQueue(Model):
+    """ Transactional outbox of entities awaiting search indexing. Rows are written in the same
+        transaction as the entity and drained in batches by the `indexworker` command.
+    """
+    project = IntegerField()
+    entity_type = CharField(max_length=16,
+                            choices=[('media', 'media'), ('localization', 'localization'),
+                                     ('state', 'state'), ('leaf', 'leaf')])
+    entity_id = IntegerField()
+    created_datetime = DateTimeField(auto_now_add=True, db_index=True)
+    attempts = IntegerField(default=0)
+    """ Number of failed attempts to index the entity.
+    """
+
+def index_entity(instance, entity_type):
+    """ Indexes an entity in elasticsearch. If asynchronous indexing is enabled the entity is
+        queued for the index worker, unless the caller set `_wait_for_index` on the instance
+        because it needs to read its own write.
+    """
+    if settings.ASYNC_INDEXING and not getattr(instance, '_wait_for_index', False):
+        if instance.project_id is not None:
+            IndexQueue.objects.create(project=instance.project_id,
+                                      entity_type=entity_type,
+                                      entity_id=instance.pk)
+    else:
+        TatorSearch().create_document(instance, getattr(instance, '_wait_for_index', False))
+
+def queue_entity_ids(project_id, entity_type, ids):
+    """ Queues entities for the index worker with a single insert. IDs may be a list or a
+        queryset of IDs; a queryset is inserted as a subquery, so the IDs are never read.
+    """
+    from django.db import connection
+    if isinstance(ids, QuerySet):
+        sql, params = ids.query.sql_with_params()
+        select = f'SELECT %s, %s, entity_id, now(), 0 FROM ({sql}) AS ids (entity_id)'
+        params = [project_id, entity_type, *params]
+    else:
+        select = 'SELECT %s, %s, unnest(%s::integer[]), now(), 0'
+        params = [project_id, entity_type, list(ids)]
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO "{IndexQueue._meta.db_table}" '
+                       f'(project, entity_type, entity_id, created_datetime, attempts) '
+                       f'{select}', params)
+
+def index_entities(project_id, entity_type, instances, wait=False):
+    """ Indexes entities created in bulk. If asynchronous indexing is enabled they are
+        queued for the index worker with a single insert, otherwise documents are written
+        to elasticsearch in batches. If wait is true, documents are written immediately and
+        this returns once they are visible to searches.
+    """
+    if settings.ASYNC_INDEXING and not wait:
+        queue_entity_ids(project_id, entity_type, [instance.pk for instance in instances])
+    else:
+        ts = TatorSearch()
+        documents = []
+        for instance in instances:
+            documents += ts.build_document(instance)
+            if len(documents) > 1000:
+                ts.bulk_add_documents(documents, wait)
+                documents = []
+        ts.bulk_add_documents(documents, wait)
+
+def index_bulk_update(project_id, entity_type, ids):
+    """ Rewrites documents of entities changed by a queryset update or bulk_update, which
+        bypass the save signals. Only needed if the read model is enabled, as it stores the
+        REST representation of entities; other indexed fields changed by bulk updates are
+        written by the update by query script.
+
+        IDs are given as a queryset of IDs. They are queued with a single insert from the
+        queryset, or documents are rebuilt one batch of IDs at a time.
+    """
+    from .rest._util import chunked
+    from .rest._util import filter_by_ids
+    if not settings.READ_MODEL:
+        return
+    if settings.ASYNC_INDEXING:
+        queue_entity_ids(project_id, entity_type, ids)
+    else:
+        model = {'media': Media, 'localization': Localization, 'state': State}[entity_type]
+        for batch in chunked(ids.iterator(), 1000):
+            qs = filter_by_ids(model.objects.filter(project__isnull=False, meta__isnull=False),
+                               batch)
+            index_entities(project_id, entity_type,
+                           qs.select_related('project', 'meta').iterator())
 
 # Entities (stores actual data)
 
@@ -674,6 +806,29 @@ class Media(Model):
     recycled_from = ForeignKey(Project, on_delete=SET_NULL, null=True, blank=True,
                                related_name='recycled_from')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept so saves can tell whether media files changed.
+        if 'media_files' in field_names:
+            instance._loaded_media_files = deepcopy(instance.media_files)
+        return instance
+
+    def media_files_changed(self):
+        """ Returns true if media files differ from those last loaded or saved. Media not
+            loaded from the database, or loaded without media files, are assumed changed.
+        """
+        if not hasattr(self, '_loaded_media_files'):
+            return True
+        return self._loaded_media_files != self.media_files
+
+    class Meta:
+        indexes = [
+            # Supports keyset pagination of media lists, which are ordered by lower case
+            # name and id. See `order_by_name` in main/rest/_media_query.py.
+            LowerNameIndex(name='media_project_lname_id_idx'),
+        ]
+
 class Resource(Model):
     path = CharField(db_index=True, max_length=256)
     media = ManyToManyField(Media, related_name='resource_media')
@@ -717,8 +872,12 @@ class Resource(Model):
                 s3.delete_object(Bucket=os.getenv('BUCKET_NAME'), Key=path)
 
 @receiver(post_save, sender=Media)
-def media_save(sender, instance, created, **kwargs):
-    TatorSearch().create_document(instance)
+def media_save(sender, instance, created, update_fields, **kwargs):
+    index_entity(instance, 'media')
+    if (update_fields is None) or ('media_files' in update_fields):
+        if instance.media_files_changed() and not created:
+            invalidate_segment_indexes(instance.pk)
+        instance._loaded_media_files = deepcopy(instance.media_files)
     if instance.file and created:
         Resource.add_resource(instance.file.path, instance)
     if instance.media_files and created:
@@ -727,6 +886,8 @@ def media_save(sender, instance, created, **kwargs):
                 Resource.add_resource(fp['path'], instance)
                 if key == 'streaming':
                     Resource.add_resource(fp['segment_info'], instance)
+                    if 'seek_index' in fp:
+                        Resource.add_resource(fp['seek_index'], instance)
 
 def safe_delete(path):
     try:
@@ -756,6 +917,9 @@ def media_delete(sender, instance, **kwargs):
 
 @receiver(post_delete, sender=Media)
 def media_post_delete(sender, instance, **kwargs):
+    invalidate_segment_indexes(instance.pk)
+    if settings.RENDER_CACHE_STORAGE:
+        delete_renders(instance.pk)
     if instance.file:
         safe_delete(instance.file.path)
     if instance.original != None:
@@ -774,6 +938,8 @@ def media_post_delete(sender, instance, **kwargs):
                 if key == 'streaming':
                     path = obj['segment_info']
                     safe_delete(path)
+                    if 'seek_index' in obj:
+                        safe_delete(obj['seek_index'])
     instance.thumbnail.delete(False)
     instance.thumbnail_gif.delete(False)
 
@@ -824,7 +990,7 @@ class Localization(Model):
 @receiver(post_save, sender=Localization)
 def localization_save(sender, instance, created, **kwargs):
     if getattr(instance,'_inhibit', False) == False:
-        TatorSearch().create_document(instance)
+        index_entity(instance, 'localization')
     else:
         pass
 
@@ -877,12 +1043,24 @@ class State(Model):
 
 @receiver(post_save, sender=State)
 def state_save(sender, instance, created, **kwargs):
-    TatorSearch().create_document(instance)
+    index_entity(instance, 'state')
 
 @receiver(pre_delete, sender=State)
 def state_delete(sender, instance, **kwargs):
     TatorSearch().delete_document(instance)
 
+@receiver(m2m_changed, sender=State.media.through)
+def state_media_changed(sender, instance, action, reverse, **kwargs):
+    # State documents are routed to the shards of their media, so documents indexed
+    # under the old media are removed and the state is indexed under its new media.
+    if reverse or not (instance.project and instance.meta):
+        return
+    if action in ['pre_add', 'pre_remove', 'pre_clear']:
+        if instance.media.exists():
+            TatorSearch().delete_document(instance)
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        index_entity(instance, 'state')
+
 @receiver(m2m_changed, sender=State.localizations.through)
 def calc_segments(sender, **kwargs):
     instance=kwargs['instance']
@@ -957,7 +1135,7 @@ class Leaf(Model):
 
 @receiver(post_save, sender=Leaf)
 def leaf_save(sender, instance, **kwargs):
-    TatorSearch().create_document(instance)
+    index_entity(instance, 'leaf')
 
 @receiver(pre_delete, sender=Leaf)
 def leaf_delete(sender, instance, **kwargs):
@@ -1061,3 +1239,43 @@ def database_query_ids(table, ids, order):
              f'(VALUES ({"), (".join([str(id_) for id_ in ids])})) '
              f'ORDER BY {order}')
     return database_query(query)
+
+class JsonText(str):
+    """ JSON text rendered by the database. Views return it to have it written to the
+        response without being decoded and encoded again.
+    """
+
+def _select_ids(table, columns, extra_columns):
+    if columns is None:
+        select = f'"{table}".*'
+    else:
+        select = ', '.join([f'"{table}"."{column}"' for column in columns])
+    if extra_columns is not None:
+        for name, expression in extra_columns.items():
+            select += f', ({expression}) AS "{name}"'
+    return f'SELECT {select} FROM "{table}" WHERE "{table}"."id" = ANY(%s::integer[])'
+
+def database_query_ids_json(table, ids, order, columns=None, extra_columns=None):
+    """ Like `database_query_ids`, but the rows are rendered as a JSON array by postgres.
+        Selects the given columns (all columns by default) plus extra columns, given as a
+        dict of names to SQL expressions.
+    """
+    from django.db import connection
+    query = (f'SELECT COALESCE(json_agg(row_to_json(t) ORDER BY t."{order}"), \'[]\'::json)::text '
+             f'FROM ({_select_ids(table, columns, extra_columns)}) t')
+    with connection.cursor() as cursor:
+        cursor.execute(query, [list(ids)])
+        text = cursor.fetchone()[0]
+    return JsonText(text)
+
+def database_query_id_json(table, id_, columns=None, extra_columns=None):
+    """ Returns a single row rendered as a JSON object by postgres.
+    """
+    from django.db import connection
+    query = f'SELECT row_to_json(t)::text FROM ({_select_ids(table, columns, extra_columns)}) t'
+    with connection.cursor() as cursor:
+        cursor.execute(query, [[id_]])
+        row = cursor.fetchone()
+    if row is None:
+        raise ObjectDoesNotExist(f"No object with ID {id_} in {table}!")
+    return JsonText(row[0])
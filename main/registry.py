@@ -0,0 +1,82 @@
+""" In-memory registry of the entity types defined in each project.
+
+    Type definitions are loaded once per project and reused by query builders, attribute
+    validation and document indexing. Each process keeps its own copy, which is reloaded
+    when the project version stored in redis changes. Versions are bumped by the type and
+    project save signals.
+"""
+import time
+
+from django.apps import apps
+from django.db import transaction
+
+from .cache import TatorCache
+
+# Seconds between checks of the registry version in redis.
+REGISTRY_CHECK_INTERVAL = 1
+
+TYPE_MODELS = ['MediaType', 'LocalizationType', 'StateType', 'LeafType']
+
+# Maps project ID to registry version, time of last version check and ProjectTypes.
+_registry = {}
+
+class ProjectTypes:
+    """ Entity type definitions and attribute UUIDs of a project.
+    """
+    def __init__(self, project):
+        Project = apps.get_model('main', 'Project')
+        uuids = Project.objects.filter(pk=project).values_list('attribute_type_uuids', flat=True)
+        self.attribute_type_uuids = next(iter(uuids), None) or {}
+        self.attribute_types = {}
+        self.child_attribute_names = set()
+        for model_name in TYPE_MODELS:
+            qs = apps.get_model('main', model_name).objects.filter(project=project)
+            for type_id, attribute_types in qs.values_list('id', 'attribute_types'):
+                attribute_types = {attr['name']: attr for attr in attribute_types or []}
+                self.attribute_types[(model_name, type_id)] = attribute_types
+                if model_name in ['LocalizationType', 'StateType']:
+                    self.child_attribute_names.update(attribute_types)
+
+    def get_attribute_names(self, model_name, type_id=None):
+        """ Returns names of the attributes defined by an entity type, or by all entity
+            types of a model if no type ID is given, in definition order.
+        """
+        names = {}
+        for (type_model_name, type_pk), attribute_types in self.attribute_types.items():
+            if (type_model_name == model_name) and (type_id in [None, type_pk]):
+                names.update(dict.fromkeys(attribute_types))
+        return list(names)
+
+    def get_attribute_types(self, entity_type):
+        """ Returns dict of attribute types by name for an entity type object.
+        """
+        key = (type(entity_type).__name__, entity_type.pk)
+        if key not in self.attribute_types:
+            # Type was created after the registry was loaded.
+            return {attr['name']: attr for attr in entity_type.attribute_types or []}
+        return self.attribute_types[key]
+
+def get_project_types(project):
+    """ Returns ProjectTypes for a project, reloading it if it has been invalidated.
+    """
+    now = time.time()
+    cached = _registry.get(project)
+    if (cached is not None) and (now - cached[1] < REGISTRY_CHECK_INTERVAL):
+        return cached[2]
+    version = TatorCache().get_registry_version(project)
+    if (cached is None) or (cached[0] != version):
+        cached = (version, now, ProjectTypes(project))
+    else:
+        cached = (version, now, cached[2])
+    _registry[project] = cached
+    return cached[2]
+
+def invalidate_project_types(project):
+    """ Invalidates the registry of a project in this process immediately and in all
+        processes once the current transaction commits.
+    """
+    _registry.pop(project, None)
+    def _invalidate():
+        _registry.pop(project, None)
+        TatorCache().invalidate_registry(project)
+    transaction.on_commit(_invalidate)
@@ -0,0 +1,175 @@
+""" Content addressed cache of rendered frames, tiles and animations.
+
+    Renders are keyed by a hash of the media files and the render parameters, so edits to
+    media files or localizations produce new keys instead of stale hits. Rendered files
+    are kept in a bounded disk LRU local to each pod and optionally in object storage,
+    where they are shared between pods. Renders in object storage are stored under a
+    prefix per media and deleted with the media.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from .cache import TatorCache
+from .s3 import TatorS3
+
+logger = logging.getLogger(__name__)
+
+# Bytes written to the disk cache by this process since it was last trimmed.
+_written = 0
+_lock = threading.Lock()
+
+class RenderedImage(bytes):
+    """ Rendered file contents and the ETag identifying the render. If `not_modified` is
+        set, the client already has the render and contents are empty.
+    """
+    def __new__(cls, data, etag, not_modified=False):
+        obj = super().__new__(cls, data)
+        obj.etag = etag
+        obj.not_modified = not_modified
+        return obj
+
+def render_key(media, **params):
+    """ Returns the cache key of a render of a media with the given parameters.
+    """
+    parts = {'media': media.pk,
+             'media_files': media.media_files,
+             'file': media.file.name if media.file else None,
+             'original': media.original,
+             **params}
+    encoded = json.dumps(parts, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+def _local_path(key, render_format):
+    return os.path.join(settings.RENDER_CACHE_DIR, key[:2], f'{key}.{render_format}')
+
+def _storage_prefix(media_id):
+    return f'render_cache/{media_id}/'
+
+def _storage_key(media_id, key, render_format):
+    return f'{_storage_prefix(media_id)}{key}.{render_format}'
+
+def _read_local(key, render_format):
+    path = _local_path(key, render_format)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Mark as recently used.
+        os.utime(path)
+    except OSError:
+        data = None
+    return data
+
+def _write_local(key, render_format, data):
+    global _written
+    path = _local_path(key, render_format)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+    except OSError:
+        logger.warning(f"Failed to write render {key} to disk cache!", exc_info=True)
+        return
+    with _lock:
+        _written += len(data)
+        trim = _written > settings.RENDER_CACHE_MAX_BYTES // 20
+        if trim:
+            _written = 0
+    if trim:
+        _trim_local()
+
+def _trim_local():
+    """ Deletes least recently used renders until the disk cache is under 90% of its
+        maximum size.
+    """
+    entries = []
+    for root, _, files in os.walk(settings.RENDER_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(entry[1] for entry in entries)
+    target = settings.RENDER_CACHE_MAX_BYTES * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def _read_storage(media_id, key, render_format):
+    try:
+        response = TatorS3().s3.get_object(Bucket=os.getenv('BUCKET_NAME'),
+                                           Key=_storage_key(media_id, key, render_format))
+        data = response['Body'].read()
+    except ClientError as exc:
+        if exc.response['Error']['Code'] not in ['NoSuchKey', '404']:
+            logger.warning(f"Failed to read render {key} from object storage!", exc_info=True)
+        data = None
+    return data
+
+def _write_storage(media_id, key, render_format, data):
+    try:
+        TatorS3().s3.put_object(Bucket=os.getenv('BUCKET_NAME'),
+                                Key=_storage_key(media_id, key, render_format),
+                                Body=data)
+    except ClientError:
+        logger.warning(f"Failed to write render {key} to object storage!", exc_info=True)
+
+def get_render(request, media_id, key, render_format, render):
+    """ Returns a `RenderedImage` for a cache key of a media, calling `render` to produce
+        the file contents if it is not cached.
+    """
+    etag = f'"{key}"'
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        TatorCache().incr_render_cache_stat('not_modified')
+        return RenderedImage(b'', etag, not_modified=True)
+    data = _read_local(key, render_format)
+    if data is not None:
+        stat = 'local_hit'
+    elif settings.RENDER_CACHE_STORAGE:
+        data = _read_storage(media_id, key, render_format)
+        if data is not None:
+            stat = 'storage_hit'
+            _write_local(key, render_format, data)
+    if data is None:
+        stat = 'miss'
+        data = render()
+        _write_local(key, render_format, data)
+        if settings.RENDER_CACHE_STORAGE:
+            _write_storage(media_id, key, render_format, data)
+    logger.info(f"Render cache {stat} for {key}.{render_format}")
+    TatorCache().incr_render_cache_stat(stat)
+    return RenderedImage(data, etag)
+
+def delete_renders(media_id):
+    """ Deletes renders of a media from object storage. Renders in disk caches are left to
+        be evicted, as their keys are no longer requested.
+    """
+    s3 = TatorS3().s3
+    bucket = os.getenv('BUCKET_NAME')
+    paginator = s3.get_paginator('list_objects_v2')
+    try:
+        for page in paginator.paginate(Bucket=bucket, Prefix=_storage_prefix(media_id)):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                s3.delete_objects(Bucket=bucket, Delete={'Objects': objects})
+    except ClientError:
+        logger.warning(f"Failed to delete renders of media {media_id}!", exc_info=True)
+
+def get_render_cache_stats():
+    """ Returns counts of render cache lookups by outcome, across all processes.
+    """
+    return TatorCache().get_render_cache_stats()
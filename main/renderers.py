@@ -1,7 +1,9 @@
 from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
 
 import csv
 import io
+import json
 import ujson
 
 from collections import OrderedDict
@@ -40,6 +42,37 @@ class CsvRenderer(BaseRenderer):
         finally:
             return return_value
 
+class _Echo:
+    """ File-like object that returns what is written to it, so rows formatted by a csv
+        writer can be yielded.
+    """
+    def write(self, value):
+        return value
+
+class CsvStream:
+    """ Rows of a CSV response, streamed by `GetMixin` instead of being rendered by
+        `CsvRenderer`. Column names are given up front, so rows can be written as they
+        are read. Attribute values of each row are written to columns of the same name.
+    """
+    def __init__(self, field_names, rows, chunk_size=1000):
+        self.field_names = field_names
+        self.rows = rows
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        writer = csv.DictWriter(_Echo(), fieldnames=self.field_names, extrasaction='ignore')
+        chunk = [writer.writerow(dict(zip(self.field_names, self.field_names)))]
+        for row in self.rows:
+            attributes = row.pop('attributes', None)
+            if attributes:
+                row.update(attributes)
+            chunk.append(writer.writerow(row))
+            if len(chunk) == self.chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
 class PprintRenderer(BaseRenderer):
     """ renders an object (list of objects) to a CSV file """
     media_type = 'application/json'
@@ -52,6 +85,27 @@ class PprintRenderer(BaseRenderer):
         return temp_file.getvalue()
 
 
+class NdjsonRenderer(BaseRenderer):
+    """ Renders a list of objects as newline delimited JSON. Lists returned by list
+        endpoints are streamed, see `GetMixin`.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(json.dumps(obj, cls=JSONEncoder) + '\n' for obj in data)
+
+class ColumnarRenderer(BaseRenderer):
+    """ Renders annotation lists converted to parallel arrays by the list endpoints.
+    """
+    media_type = 'application/vnd.tator.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return json.dumps(data, cls=JSONEncoder)
+
 class UJsonRenderer(BaseRenderer):
     """ Uses ujson instead of json to serialize an object """
     media_type = 'application/json'
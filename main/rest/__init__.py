@@ -20,6 +20,8 @@ from .get_clip import GetClipAPI
 from .get_frame import GetFrameAPI
 from .image_file import ImageFileListAPI
 from .image_file import ImageFileDetailAPI
+from .ingest import LocalizationIngestAPI
+from .ingest import StateIngestAPI
 from .job import JobListAPI
 from .job import JobDetailAPI
 from .leaf import LeafSuggestionAPI
@@ -52,6 +54,7 @@ from .project import ProjectDetailAPI
 from .section import SectionListAPI
 from .section import SectionDetailAPI
 from .section_analysis import SectionAnalysisAPI
+from .search_task import SearchTaskDetailAPI
 from .state import StateListAPI
 from .state import StateDetailAPI
 from .state_count import StateCountAPI
@@ -2,6 +2,8 @@
 from collections import defaultdict
 import logging
 
+from django.db import connection
+from django.db import transaction
 from django.db.models import Subquery
 
 from ..models import Localization
@@ -12,6 +14,10 @@ from ._media_query import query_string_to_media_ids
 from ._attribute_query import get_attribute_es_query
 from ._attribute_query import get_attribute_filter_ops
 from ._attribute_query import get_attribute_psql_queryset
+from ._util import paginate_count
+from ._util import filter_by_ids
+from ._util import chunked
+from ._util import decode_cursor
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +37,9 @@ def get_annotation_es_query(project, params, annotation_type):
     start = params.get('start')
     stop = params.get('stop')
     after = params.get('after')
+    cursor = params.get('cursor')
+    if cursor is not None:
+        after, = decode_cursor(cursor)
 
     if exclude_parents and (start or stop):
         raise Exception("Elasticsearch based queries with pagination are incompatible with "
@@ -108,8 +117,15 @@ def _get_annotation_psql_queryset(project, filter_ops, params, annotation_type):
     exclude_parents = params.get('excludeParents')
     start = params.get('start')
     stop = params.get('stop')
+    after = params.get('after')
+    cursor = params.get('cursor')
+    if cursor is not None:
+        after, = decode_cursor(cursor)
 
     qs = ANNOTATION_LOOKUP[annotation_type].objects.filter(project=project)
+    if after is not None:
+        # Keyset pagination on id.
+        qs = qs.filter(pk__gt=after)
     if media_id is not None:
         qs = qs.filter(media__in=media_id)
 
@@ -141,8 +157,26 @@ def _get_annotation_psql_queryset(project, filter_ops, params, annotation_type):
 
     return qs
 
+def _count_excluding_parents(project, query):
+    """ Counts localizations matching an elasticsearch query, excluding localizations that
+        are the parent of another matching localization. Matching IDs are streamed into a
+        temporary table one page at a time so the full result set is never held in memory.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS count_ids')
+        cursor.execute('CREATE TEMPORARY TABLE count_ids (id integer PRIMARY KEY) ON COMMIT DROP')
+        for ids in TatorSearch().unique_id_pages(project, query):
+            cursor.execute('INSERT INTO count_ids SELECT unnest(%s::integer[])', [ids])
+        cursor.execute('SELECT COUNT(*) FROM count_ids WHERE NOT EXISTS ('
+                       'SELECT 1 FROM main_localization '
+                       'INNER JOIN count_ids AS child ON main_localization.id = child.id '
+                       'WHERE main_localization.parent = count_ids.id)')
+        count = cursor.fetchone()[0]
+        cursor.execute('DROP TABLE count_ids')
+    return count
+
 def _use_es(project, params):
-    ES_ONLY_PARAMS = ['search', 'after', 'media_query']
+    ES_ONLY_PARAMS = ['search', 'media_query']
     use_es = False
     for es_param in ES_ONLY_PARAMS:
         if es_param in params:
@@ -155,27 +189,62 @@ def _use_es(project, params):
 
     return use_es, filter_ops
         
-def get_annotation_queryset(project, params, annotation_type):
+def _exclude_parents(project, query, qs):
+    """ Excludes localizations in a page of search results that are the parent of another
+        localization matching the elasticsearch query. Only the children of the page are
+        checked against the index, so other pages need not be loaded.
+    """
+    children = dict(Localization.objects.filter(parent__in=qs.values('id'))\
+                                        .values_list('id', 'parent'))
+    parents = set()
+    for child_ids in chunked(children.keys(), 10000):
+        child_query = {'query': {'bool': {'filter': [
+            query.get('query', {'match_all': {}}),
+            {'terms': {'_postgres_id': child_ids}},
+        ]}}}
+        for ids in TatorSearch().iter_ids(project, child_query):
+            parents.update(children[id_] for id_ in ids)
+    return qs.exclude(pk__in=parents)
+
+def get_annotation_querysets(project, params, annotation_type):
+    """ Generator yielding querysets of annotations matching a query, in list order. Results
+        of an elasticsearch query are hydrated one page of IDs at a time, so the IDs of an
+        unbounded query are never held in memory at once. A postgres query yields a single
+        queryset.
+    """
     # Determine whether to use ES or not.
     use_es, filter_ops = _use_es(project, params)
 
     if use_es:
-        # If using ES, do the search and construct the queryset.
+        # If using ES, construct a queryset for each page of search results.
         query = get_annotation_es_query(project, params, annotation_type)
-        annotation_ids, _  = TatorSearch().search(project, query)
-        qs = ANNOTATION_LOOKUP[annotation_type].objects.filter(pk__in=annotation_ids)
+        exclude_parents = params.get('excludeParents') and annotation_type == 'localization'
+        for annotation_ids in TatorSearch().iter_ids(project, query):
+            qs = filter_by_ids(ANNOTATION_LOOKUP[annotation_type].objects.all(), annotation_ids)
 
-        # Apply excludeParents if no pagination.
-        exclude_parents = params.get('excludeParents')
-        if exclude_parents:
-            parent_set = ANNOTATION_LOOKUP[annotation_type].objects.filter(pk__in=Subquery(qs.values('parent')))
-            qs = qs.difference(parent_set)
+            # Apply excludeParents if no pagination.
+            if exclude_parents:
+                qs = _exclude_parents(project, query, qs)
 
-        qs = qs.order_by('id')
+            yield qs.order_by('id')
     else:
         # If using PSQL, construct the queryset.
-        qs = _get_annotation_psql_queryset(project, filter_ops, params, annotation_type)
-    return qs
+        yield _get_annotation_psql_queryset(project, filter_ops, params, annotation_type)
+
+def get_annotation_read_model(project, params, annotation_type):
+    """ Returns a list of localizations read from the search index, or None if the request
+        should be served from postgres.
+    """
+    if (annotation_type != 'localization') or params.get('excludeParents'):
+        return None
+    use_es, _ = _use_es(project, params)
+    if not use_es:
+        return None
+    ts = TatorSearch()
+    if not ts.is_read_model_fresh(project):
+        return None
+    query = get_annotation_es_query(project, params, annotation_type)
+    return ts.search_read_model(project, query)
 
 def get_annotation_count(project, params, annotation_type):
     # Determine whether to use ES or not.
@@ -184,17 +253,17 @@ def get_annotation_count(project, params, annotation_type):
     if use_es:
         # If using ES, do the search and get the count.
         query = get_annotation_es_query(project, params, annotation_type)
-        annotation_ids, _  = TatorSearch().search(project, query)
 
-        # Apply excludeParents if no pagination.
+        # Apply excludeParents if no pagination. Queries with excludeParents and start or
+        # stop are rejected by get_annotation_es_query, but the count is paginated in both
+        # cases so it always agrees with the list response.
         exclude_parents = params.get('excludeParents')
-        if exclude_parents:
-            qs = ANNOTATION_LOOKUP[annotation_type].objects.filter(pk__in=annotation_ids)
-            parent_set = ANNOTATION_LOOKUP[annotation_type].objects.filter(pk__in=Subquery(qs.values('parent')))
-            qs = qs.difference(parent_set)
-            count = qs.count()
+        if exclude_parents and annotation_type == 'localization':
+            count = _count_excluding_parents(project, query)
         else:
-            count = len(annotation_ids)
+            # States may have one document per associated media, so count unique IDs.
+            count = TatorSearch().count(project, query, unique=(annotation_type == 'state'))
+        count = paginate_count(query, count)
     else:
         # If using PSQL, construct the queryset.
         qs = _get_annotation_psql_queryset(project, filter_ops, params, annotation_type)
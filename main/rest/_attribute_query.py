@@ -5,8 +5,7 @@ import logging
 
 from dateutil.parser import parse as dateutil_parse
 
-from ..models import LocalizationType
-from ..models import StateType
+from ..registry import get_project_types
 from ..search import TatorSearch
 
 from ._attributes import KV_SEPARATOR
@@ -30,12 +29,7 @@ def get_attribute_es_query(query_params, query, bools, project,
         'attribute_distance': query_params.get('attribute_distance', None),
         'attribute_null': query_params.get('attribute_null', None),
     }
-    child_attrs = []
-    for state_type in StateType.objects.filter(project=project).iterator():
-        child_attrs += state_type.attribute_types
-    for localization_type in LocalizationType.objects.filter(project=project).iterator():
-        child_attrs += localization_type.attribute_types
-    child_attrs = [attr['name'] for attr in child_attrs]
+    child_attrs = get_project_types(project).child_attribute_names
     attr_query = {
         'media': {
             'must_not': [],
@@ -231,10 +225,7 @@ def get_attribute_filter_ops(project, params):
     filter_ops = []
     use_es = False
     if any([(filt in params) for filt in ALLOWED_TYPES.keys()]):
-        search = TatorSearch()
-        index_name = search.index_name(project)
-        mappings = TatorSearch().es.indices.get_mapping(index=index_name)
-        mappings = mappings[index_name]['mappings']['properties']
+        mappings = TatorSearch().get_mapping_properties(project)
 
         for op in ALLOWED_TYPES.keys():
             if op in params:
@@ -8,6 +8,8 @@ from django.contrib.gis.geos import Point
 from django.shortcuts import get_object_or_404
 from dateutil.parser import parse as dateutil_parse
 
+from ..registry import get_project_types
+
 logger = logging.getLogger(__name__)
 
 # Separator for key value pairs in attribute queries
@@ -205,13 +207,53 @@ def convert_attribute(attr_type, attr_val): #pylint: disable=too-many-branches
         val = Point(lon, lat) # Lon goes first in postgis
     return val
 
+def attribute_validator(attr_type):
+    """ Returns a function that validates values of an attribute type, raising the same
+        exceptions as `convert_attribute`. Lookups into the attribute type are done once,
+        so this should be used when validating many values of the same type.
+    """
+    dtype = attr_type['dtype']
+    name = attr_type['name']
+    minimum = attr_type.get('minimum')
+    maximum = attr_type.get('maximum')
+    if dtype == 'string':
+        return lambda attr_val: None
+    elif dtype == 'enum':
+        choices = attr_type['choices']
+        def validate(attr_val):
+            if attr_val not in choices:
+                raise Exception(f"Invalid attribute value {attr_val} for enum attribute {name}. "
+                                f"Valid choices are: {choices}.")
+    elif dtype == 'bool':
+        def validate(attr_val):
+            if not isinstance(attr_val, bool) and attr_val.lower() not in ['false', 'true']:
+                raise Exception(f"Invalid attribute value {attr_val} for boolean attribute {name}")
+    elif dtype in ['int', 'float']:
+        convert = int if dtype == 'int' else float
+        label = 'integer' if dtype == 'int' else 'float'
+        def validate(attr_val):
+            try:
+                val = convert(attr_val)
+            except:
+                raise Exception(f"Invalid attribute value {attr_val} for {label} attribute {name}")
+            if (minimum is not None) and (val < minimum):
+                raise Exception(f"{attr_val} is below minimum {minimum} for "
+                                f"{dtype} attribute {name}!")
+            if (maximum is not None) and (val > maximum):
+                raise Exception(f"{attr_val} is above maximum {maximum} for "
+                                f"{dtype} attribute {name}!")
+    else:
+        def validate(attr_val):
+            convert_attribute(attr_type, attr_val)
+    return validate
+
 def validate_attributes(params, obj):
     """Validates attributes by looking up attribute type and attempting
        a type conversion.
     """
     attributes = params.get("attributes", None)
     if attributes:
-        attr_types = {a['name']:a for a in obj.meta.attribute_types}
+        attr_types = get_project_types(obj.meta.project_id).get_attribute_types(obj.meta)
         for attr_name in attributes:
             if attr_name == 'tator_user_sections':
                 # This is a built-in attribute used for organizing media sections.
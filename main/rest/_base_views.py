@@ -1,18 +1,32 @@
 """ TODO: add documentation for this """
 import traceback
 import logging
+import json
+import types
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework import status
 from django.core.exceptions import ObjectDoesNotExist
 from django.http import response
+from django.http import StreamingHttpResponse
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.functional import cached_property
+from django.conf import settings
 
 from ..schema import parse
+from ..renderers import CsvStream
+from ..models import JsonText
+from ..render_cache import RenderedImage
 
 logger = logging.getLogger(__name__)
 
+# Number of objects serialized per chunk of a streaming response.
+STREAM_CHUNK_SIZE = 1000
+
 """ TODO: add documentation for this """
 def process_exception(exc):
     """ TODO: add documentation for this """
@@ -35,16 +49,91 @@ def process_exception(exc):
                          'details': traceback.format_exc()},
                         status=status.HTTP_400_BAD_REQUEST)
     return resp
+def _json_chunks(objects, ndjson):
+    """ Generator yielding a JSON array or newline delimited JSON, a few objects at a time.
+    """
+    encoder = JSONEncoder()
+    chunk = []
+    first = True
+    if not ndjson:
+        yield '['
+    for obj in objects:
+        chunk.append(encoder.encode(obj))
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield _join_chunk(chunk, ndjson, first)
+            chunk = []
+            first = False
+    if chunk:
+        yield _join_chunk(chunk, ndjson, first)
+    if not ndjson:
+        yield ']'
+
+def _join_chunk(chunk, ndjson, first):
+    if ndjson:
+        return '\n'.join(chunk) + '\n'
+    elif first:
+        return ','.join(chunk)
+    return ',' + ','.join(chunk)
+
+class JsonTextResponse(HttpResponse):
+    """ Response containing JSON rendered by the database. Like a rest framework response,
+        the decoded content is available as `data`; it is only decoded when accessed.
+    """
+    def __init__(self, content, status_code):
+        super().__init__(content, status=status_code, content_type='application/json')
+
+    @cached_property
+    def data(self):
+        return json.loads(self.content)
+
+def _respond(request, response_data, status_code):
+    """ Returns a response, writing JSON rendered by the database directly when JSON
+        was requested.
+    """
+    if isinstance(response_data, JsonText):
+        if request.accepted_renderer.format == 'json':
+            return JsonTextResponse(response_data, status_code)
+        response_data = json.loads(response_data)
+    return Response(response_data, status=status_code)
+
 class GetMixin:
     #pylint: disable=redefined-builtin,unused-argument
     """ TODO: add documentation for this """
     def get(self, request, format=None, **kwargs):
-        """ TODO: add documentation for this """
-        resp = Response({})
+        """ Calls `_get`. If it returns a generator, the objects it yields are streamed as
+            a JSON array or newline delimited JSON. Other formats are rendered from a list.
+            If it returns a `CsvStream`, its rows are streamed as CSV. If it returns a
+            `RenderedImage`, caching headers are set.
+        """
         params = parse(request)
         response_data = self._get(params)
-        resp = Response(response_data, status=status.HTTP_200_OK)
-        return resp
+        if isinstance(response_data, RenderedImage):
+            if response_data.not_modified:
+                resp = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                resp = Response(response_data, status=status.HTTP_200_OK)
+            resp['ETag'] = response_data.etag
+            patch_cache_control(resp, private=True, max_age=settings.RENDER_CACHE_MAX_AGE)
+            return resp
+        if isinstance(response_data, CsvStream):
+            return StreamingHttpResponse(iter(response_data),
+                                         content_type=request.accepted_media_type)
+        if isinstance(response_data, types.GeneratorType):
+            renderer_format = request.accepted_renderer.format
+            if renderer_format in ['json', 'ndjson']:
+                ndjson = renderer_format == 'ndjson'
+                return StreamingHttpResponse(_json_chunks(response_data, ndjson),
+                                             content_type=request.accepted_media_type)
+            response_data = list(response_data)
+        return _respond(request, response_data, status.HTTP_200_OK)
+
+    def _streaming(self, params):
+        """ Returns true if a list should be streamed instead of rendered at once. Views
+            return a generator from `_get` to stream a list.
+        """
+        renderer_format = self.request.accepted_renderer.format
+        return (renderer_format == 'ndjson') or (renderer_format == 'json'
+                                                 and params.get('stream', False))
 
 class PostMixin:
     #pylint: disable=redefined-builtin,unused-argument
@@ -81,8 +170,7 @@ class PutMixin:
     def put(self, request, format=None, **kwargs):
         params = parse(request)
         response_data = self._put(params)
-        resp = Response(response_data, status=status.HTTP_200_OK)
-        return resp
+        return _respond(request, response_data, status.HTTP_200_OK)
 
 class BaseListView(APIView, GetMixin, PostMixin, PatchMixin, DeleteMixin, PutMixin):
     """ Base class for list views.
@@ -0,0 +1,51 @@
+""" Columnar representation of annotation lists. """
+import base64
+
+import numpy as np
+
+# Little endian dtypes of columns that can be encoded as typed buffers.
+BUFFER_DTYPES = {
+    'id': 'int32',
+    'media': 'int32',
+    'frame': 'int32',
+    'meta': 'int32',
+    'version': 'int32',
+    'x': 'float32',
+    'y': 'float32',
+    'u': 'float32',
+    'v': 'float32',
+    'width': 'float32',
+    'height': 'float32',
+}
+
+def _encode_buffer(values, dtype):
+    """ Encodes a column as a base64 typed buffer. Missing values are encoded as -1 for
+        integer columns and NaN for float columns.
+    """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    missing = -1 if dtype.kind == 'i' else np.nan
+    array = np.array([missing if value is None else value for value in values], dtype=dtype)
+    return base64.b64encode(array.tobytes()).decode()
+
+def get_columns(rows, fields, attribute_names, buffer_fields=None):
+    """ Converts rows of a list into parallel arrays, one per field and one per attribute.
+        Fields in `buffer_fields` are encoded as base64 little endian typed buffers; their
+        dtypes are included in the response.
+    """
+    columns = {field: [] for field in fields}
+    attributes = {name: [] for name in attribute_names}
+    count = 0
+    for row in rows:
+        for field in fields:
+            columns[field].append(row[field])
+        row_attributes = row.get('attributes') or {}
+        for name in attribute_names:
+            attributes[name].append(row_attributes.get(name))
+        count += 1
+    response_data = {'count': count, 'columns': columns, 'attributes': attributes}
+    if buffer_fields is not None:
+        dtypes = {field: BUFFER_DTYPES[field] for field in buffer_fields}
+        for field, dtype in dtypes.items():
+            columns[field] = _encode_buffer(columns[field], dtype)
+        response_data['dtypes'] = dtypes
+    return response_data
@@ -0,0 +1,174 @@
+""" Pool of in-process video decoders used for frame extraction.
+
+    Each decoder holds the bytes of an initialization segment and the fragments needed
+    for a set of frames, and keeps a PyAV container open on them between requests. As
+    decoded frames are returned in order, requests for later frames in the same fragments
+    continue decoding where the last request stopped instead of starting over. Decoders
+    are evicted least recently used first once the buffers they hold exceed
+    DECODER_POOL_MAX_BYTES.
+
+    Decoding runs on native threads, as PyAV releases the GIL while decoding. Under gevent,
+    where threads started by the thread module are greenlets, gevent's pool of native
+    threads is used instead so decoding does not block the hub. Fetching and eviction are
+    done by the calling greenlet or thread.
+
+    If PyAV is not installed or DECODER_POOL is disabled, frames are extracted with
+    ffmpeg subprocesses instead.
+"""
+from collections import defaultdict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import io
+import logging
+import threading
+
+from django.conf import settings
+
+try:
+    import av
+except ImportError:
+    av = None
+
+try:
+    from gevent import monkey
+    from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+except ImportError:
+    monkey = None
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _gevent_patched():
+    return (monkey is not None) and monkey.is_module_patched('threading')
+
+def _native_lock():
+    """ Returns a lock that can be held by native threads under gevent.
+    """
+    if _gevent_patched():
+        return monkey.get_original('threading', 'Lock')()
+    return threading.Lock()
+
+def _native_executor(workers):
+    """ Returns an executor running tasks on native threads.
+    """
+    if _gevent_patched():
+        return GeventThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+class _Decoder:
+    """ Decoder of an in-memory video.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.lock = _native_lock()
+        self._open()
+
+    def _open(self):
+        self._container = av.open(io.BytesIO(self.data))
+        self._frames = self._container.decode(video=0)
+        self._position = 0
+        self._closed = False
+
+    def decode(self, index):
+        """ Returns the frame at an index of the video as an RGB array.
+        """
+        if self._closed:
+            # Evicted from the pool after this request got it.
+            self._open()
+        elif index < self._position:
+            self.close()
+            self._open()
+        for frame in self._frames:
+            self._position += 1
+            if self._position > index:
+                return frame.to_ndarray(format='rgb24')
+        raise ValueError(f"Frame {index} is past the end of the decoded segments!")
+
+    def close(self):
+        self._container.close()
+        self._closed = True
+
+class DecoderPool:
+    """ Least recently used set of decoders, with a pool of native threads that decodes
+        frames from different decoders concurrently.
+    """
+    def __init__(self, max_bytes, workers):
+        self._max_bytes = max_bytes
+        self._decoders = OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        self._executor = _native_executor(workers)
+
+    def _get_decoder(self, key, load):
+        with self._lock:
+            decoder = self._decoders.get(key)
+            if decoder is not None:
+                self._decoders.move_to_end(key)
+                return decoder
+        decoder = _Decoder(load())
+        evicted = []
+        with self._lock:
+            if key in self._decoders:
+                # Another thread opened the same video first.
+                evicted.append(decoder)
+                decoder = self._decoders[key]
+            else:
+                self._decoders[key] = decoder
+                self._num_bytes += len(decoder.data)
+                while (self._num_bytes > self._max_bytes) and (len(self._decoders) > 1):
+                    _, old = self._decoders.popitem(last=False)
+                    self._num_bytes -= len(old.data)
+                    evicted.append(old)
+        for old in evicted:
+            # Closed on a decoding thread, as it waits for any decode in progress.
+            self._executor.submit(self._close, old)
+        return decoder
+
+    @staticmethod
+    def _close(decoder):
+        with decoder.lock:
+            decoder.close()
+
+    def get_data(self, key):
+        """ Returns the bytes held by the decoder of a video, or None if it is not open.
+        """
+        with self._lock:
+            decoder = self._decoders.get(key)
+        return None if decoder is None else decoder.data
+
+    @staticmethod
+    def _decode(decoder, indices):
+        with decoder.lock:
+            return {index: decoder.decode(index) for index in sorted(set(indices))}
+
+    def decode(self, requests):
+        """ Decodes frames given a list of (key, load, index), where key identifies the
+            video, load returns its bytes if no decoder is open for it and index is the
+            frame within it. Returns a list of RGB arrays in request order.
+        """
+        by_key = defaultdict(list)
+        loads = {}
+        for key, load, index in requests:
+            by_key[key].append(index)
+            loads[key] = load
+        decoders = {key: self._get_decoder(key, loads[key]) for key in by_key}
+        futures = {key: self._executor.submit(self._decode, decoders[key], indices)
+                   for key, indices in by_key.items()}
+        decoded = {key: future.result() for key, future in futures.items()}
+        return [decoded[key][index] for key, _, index in requests]
+
+def decoder_pool_enabled():
+    """ Returns true if frames should be decoded in-process.
+    """
+    return (av is not None) and settings.DECODER_POOL
+
+def get_decoder_pool():
+    """ Returns the decoder pool of this process.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DecoderPool(settings.DECODER_POOL_MAX_BYTES, settings.DECODER_POOL_WORKERS)
+    return _pool
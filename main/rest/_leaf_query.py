@@ -8,6 +8,8 @@ from ..models import Leaf
 from ._attribute_query import get_attribute_filter_ops
 from ._attribute_query import get_attribute_psql_queryset
 from ._attributes import KV_SEPARATOR
+from ._util import paginate_count
+from ._util import filter_by_ids
 
 logger = logging.getLogger(__name__)
 
@@ -171,29 +173,33 @@ def _use_es(project, params):
 
     return use_es, filter_ops
         
-def get_leaf_queryset(project, params):
+def get_leaf_querysets(project, params):
+    """ Generator yielding querysets of leaves matching a query, in list order. Results of
+        an elasticsearch query are hydrated one page of IDs at a time, so the IDs of an
+        unbounded query are never held in memory at once. A postgres query yields a single
+        queryset.
+    """
     # Determine whether to use ES or not.
     use_es, filter_ops = _use_es(project, params)
 
     if use_es:
-        # If using ES, do the search and construct the queryset.
+        # If using ES, construct a queryset for each page of search results.
         query = get_leaf_es_query(params)
-        leaf_ids, _  = TatorSearch().search(project, query)
-        qs = Leaf.objects.filter(pk__in=leaf_ids).order_by('id')
+        for leaf_ids in TatorSearch().iter_ids(project, query):
+            yield filter_by_ids(Leaf.objects.all(), leaf_ids).order_by('id')
     else:
         # If using PSQL, construct the queryset.
-        qs = _get_leaf_psql_queryset(project, filter_ops, params)
-    return qs
+        yield _get_leaf_psql_queryset(project, filter_ops, params)
 
 def get_leaf_count(project, params):
     # Determine whether to use ES or not.
-    use_es, filter_ops = _use_es(params)
+    use_es, filter_ops = _use_es(project, params)
 
     if use_es:
         # If using ES, do the search and get the count.
         query = get_leaf_es_query(params)
-        leaf_ids, _  = TatorSearch().search(project, query)
-        count = len(leaf_ids)
+        count = TatorSearch().count(project, query)
+        count = paginate_count(query, count)
     else:
         # If using PSQL, construct the queryset.
         qs = _get_leaf_psql_queryset(project, filter_ops, params)
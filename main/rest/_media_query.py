@@ -3,6 +3,8 @@ from collections import defaultdict
 import logging
 from urllib import parse as urllib_parse
 
+from django.db.models.expressions import RawSQL
+
 from ..search import TatorSearch
 from ..models import Section
 from ..models import Media
@@ -11,9 +13,23 @@ from ._attribute_query import get_attribute_es_query
 from ._attribute_query import get_attribute_filter_ops
 from ._attribute_query import get_attribute_psql_queryset
 from ._attributes import KV_SEPARATOR
+from ._util import paginate_count
+from ._util import filter_by_ids
+from ._util import decode_cursor
 
 logger = logging.getLogger(__name__)
 
+# Media are listed in order of lower case name and ID. Names are compared by code point,
+# which matches the order of the lower_normalizer keyword in elasticsearch, except that
+# elasticsearch also folds accented characters to ASCII. The expression must match the
+# one indexed by `LowerNameIndex` for the index to be used.
+LOWER_NAME_SQL = 'lower("main_media"."name") COLLATE "C"'
+
+def order_by_name(qs):
+    """ Orders a media queryset the same way media are sorted by elasticsearch.
+    """
+    return qs.order_by(RawSQL(LOWER_NAME_SQL, ()).asc(), 'id')
+
 def get_media_es_query(project, params):
     """ Constructs an elasticsearch query.
     """
@@ -29,9 +45,11 @@ def get_media_es_query(project, params):
     start = params.get('start')
     stop = params.get('stop')
     after = params.get('after')
+    cursor = params.get('cursor')
 
     query = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict))))
     query['sort']['_exact_name'] = 'asc'
+    query['sort']['_postgres_id'] = 'asc'
     bools = [{'bool': {
         'should': [
             {'match': {'_dtype': 'image'}},
@@ -104,7 +122,19 @@ def get_media_es_query(project, params):
             raise ValueError("Parameter 'stop' must be less than 10000! Try using "
                              "'after'.")
 
-    if after is not None:
+    if cursor is not None:
+        after_name, after_id = decode_cursor(cursor)
+        bools.append({'bool': {
+            'should': [
+                {'range': {'_exact_name': {'gt': after_name}}},
+                {'bool': {'filter': [
+                    {'term': {'_exact_name': after_name}},
+                    {'range': {'_postgres_id': {'gt': after_id}}},
+                ]}},
+            ],
+            'minimum_should_match': 1,
+        }})
+    elif after is not None:
         bools.append({'range': {'_exact_name': {'gt': after}}})
 
     query = get_attribute_es_query(params, query, bools, project, is_media=True,
@@ -124,8 +154,19 @@ def _get_media_psql_queryset(project, section_uuid, filter_ops, params):
     uid = params.get('uid')
     start = params.get('start')
     stop = params.get('stop')
+    after = params.get('after')
+    cursor = params.get('cursor')
 
     qs = Media.objects.filter(project=project)
+    if cursor is not None:
+        # Keyset pagination on (lower case name, id).
+        after_name, after_id = decode_cursor(cursor)
+        qs = qs.extra(where=[f'({LOWER_NAME_SQL}, "main_media"."id") > '
+                             f'(lower(%s) COLLATE "C", %s)'],
+                      params=[after_name, after_id])
+    elif after is not None:
+        qs = qs.extra(where=[f'{LOWER_NAME_SQL} > lower(%s) COLLATE "C"'], params=[after])
+
     if media_id is not None:
         qs = qs.filter(pk__in=media_id)
 
@@ -152,7 +193,7 @@ def _get_media_psql_queryset(project, section_uuid, filter_ops, params):
 
     qs = get_attribute_psql_queryset(qs, params, filter_ops)
 
-    qs = qs.order_by('name')
+    qs = order_by_name(qs)
     if start is not None and stop is not None:
         qs = qs[start:stop]
     elif start is not None:
@@ -163,7 +204,7 @@ def _get_media_psql_queryset(project, section_uuid, filter_ops, params):
     return qs
 
 def _use_es(project, params):
-    ES_ONLY_PARAMS = ['search', 'after']
+    ES_ONLY_PARAMS = ['search']
     use_es = False
     for es_param in ES_ONLY_PARAMS:
         if es_param in params:
@@ -184,19 +225,36 @@ def _use_es(project, params):
 
     return use_es, section_uuid, filter_ops
         
-def get_media_queryset(project, params):
+def get_media_querysets(project, params):
+    """ Generator yielding querysets of media matching a query, in list order. Results of
+        an elasticsearch query are hydrated one page of IDs at a time, so the IDs of an
+        unbounded query are never held in memory at once. A postgres query yields a single
+        queryset.
+    """
     # Determine whether to use ES or not.
     use_es, section_uuid, filter_ops = _use_es(project, params)
 
     if use_es:
-        # If using ES, do the search and construct the queryset.
+        # If using ES, construct a queryset for each page of search results.
         query = get_media_es_query(project, params)
-        media_ids, _  = TatorSearch().search(project, query)
-        qs = Media.objects.filter(pk__in=media_ids).order_by('name')
+        for media_ids in TatorSearch().iter_ids(project, query):
+            yield order_by_name(filter_by_ids(Media.objects.all(), media_ids))
     else:
         # If using PSQL, construct the queryset.
-        qs = _get_media_psql_queryset(project, section_uuid, filter_ops, params)
-    return qs
+        yield _get_media_psql_queryset(project, section_uuid, filter_ops, params)
+
+def get_media_read_model(project, params):
+    """ Returns a list of media read from the search index, or None if the request should
+        be served from postgres.
+    """
+    use_es, _, _ = _use_es(project, params)
+    if not use_es:
+        return None
+    ts = TatorSearch()
+    if not ts.is_read_model_fresh(project):
+        return None
+    query = get_media_es_query(project, params)
+    return ts.search_read_model(project, query)
 
 def get_media_count(project, params):
     # Determine whether to use ES or not.
@@ -205,8 +263,8 @@ def get_media_count(project, params):
     if use_es:
         # If using ES, do the search and get the count.
         query = get_media_es_query(project, params)
-        media_ids, _  = TatorSearch().search(project, query)
-        count = len(media_ids)
+        count = TatorSearch().count(project, query)
+        count = paginate_count(query, count)
     else:
         # If using PSQL, construct the queryset.
         qs = _get_media_psql_queryset(project, section_uuid, filter_ops, params)
@@ -216,5 +274,6 @@ def get_media_count(project, params):
 def query_string_to_media_ids(project_id, url):
     """ TODO: add documentation for this """
     params = dict(urllib_parse.parse_qsl(urllib_parse.urlsplit(url).query))
-    media_ids = get_media_queryset(project_id, params).values_list('id', flat=True)
+    media_ids = [id_ for qs in get_media_querysets(project_id, params)
+                 for id_ in qs.values_list('id', flat=True)]
     return media_ids
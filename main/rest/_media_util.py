@@ -1,28 +1,51 @@
 """ TODO: add documentation for this """
 import logging
 import os
-import json
 import subprocess
 import math
 import io
 import textwrap
 import mmap
 import sys
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from django.conf import settings
 
 from ..s3 import TatorS3
+from ..segment_index import get_segment_index
+from ..segment_index import get_seek_index
+from ._decoder_pool import decoder_pool_enabled
+from ._decoder_pool import get_decoder_pool
 
 logger = logging.getLogger(__name__)
 
+# Byte ranges closer than this are fetched with a single request.
+RANGE_MERGE_GAP = 64 * 1024
+
+# Maximum size of a single range request to object storage.
+RANGE_FETCH_PART_SIZE = 8 * 1024 * 1024
+
+# Concurrent range requests to object storage across all requests in a process. Under
+# gevent the executor's threads are greenlets, which suits these I/O bound requests;
+# decoding runs on native threads in the decoder pool.
+RANGE_FETCH_WORKERS = 8
+
+_fetch_executor = ThreadPoolExecutor(max_workers=RANGE_FETCH_WORKERS)
+
+# Render formats that can be written in-process, with their PIL format names.
+PIL_FORMATS = {'jpg': 'jpeg', 'png': 'png', 'gif': 'gif'}
+
 class MediaUtil:
     """ TODO: add documentation for this """
     def __init__(self, video, temp_dir, quality=None):
         self._temp_dir = temp_dir
         # If available we only attempt to fetch
         # the part of the file we need to
-        self._segment_info = None
+        self._segments = None
+        self._seek = None
 
         if video.media_files:
             self._s3 = TatorS3().s3
@@ -45,16 +68,9 @@ class MediaUtil:
                 self._video_file = video.media_files["streaming"][quality_idx]["path"]
                 self._height = video.media_files["streaming"][quality_idx]["resolution"][0]
                 self._width = video.media_files["streaming"][quality_idx]["resolution"][1]
-                segment_file = video.media_files["streaming"][quality_idx]["segment_info"]
-                if segment_file.startswith('/'):
-                    with open(segment_file, 'r') as f_p:
-                        self._segment_info = json.load(f_p)
-                else:
-                    f_p = io.BytesIO()
-                    self._s3.download_fileobj(self._bucket_name, segment_file, f_p)
-                    self._segment_info = json.loads(f_p.getvalue().decode('utf-8'))
-                self._moof_data = [(i,x) for i,x in enumerate(self._segment_info
-                                                              ['segments']) if x['name'] == 'moof']
+                media_def = video.media_files["streaming"][quality_idx]
+                self._segments = get_segment_index(video.pk, media_def)
+                self._seek = get_seek_index(video.pk, media_def)
             elif "image" in video.media_files:
                 if quality is None:
                     # Select highest quality if not specified
@@ -93,50 +109,39 @@ class MediaUtil:
         self._fps = video.fps
 
     def _get_impacted_segments(self, frames):
-        """ TODO: add documentation for this """
-        if self._segment_info is None:
+        """ Returns a list of (frame, segment indexes) needed to decode each frame. The
+            header segments are always included, followed by the fragments from the last
+            keyframe up to the fragment containing the frame. Frames near the end of a
+            fragment also include the next fragment. Frames past the end of the video are
+            skipped.
+        """
+        if (self._seek is None) or (len(self._seek) == 0):
             return None
 
-        segment_list = []
-        for frame_str in frames:
-            frame_seg = set()
-            frame_seg.add(0)
-            frame_seg.add(1)
-            # We already load the header so ignore those segments
-            frame = int(frame_str)
-            min_idx = 0
-            max_idx = len(self._moof_data)-1
-            # Handle frames and files with frame biases
-            if frame < self._moof_data[0][1]['frame_start']:
-                frame_seg.add(self._moof_data[0][0])
-                continue
+        frames = np.array([int(frame) for frame in frames], dtype=np.int64)
+        starts = self._seek['frame_start']
+        samples = self._seek['frame_samples']
+        # Frames before the first fragment (frame biases) resolve to the first fragment.
+        found = np.maximum(np.searchsorted(starts, frames, side='right') - 1, 0)
+        offsets = frames - starts[found]
+        in_range = offsets < samples[found]
+        # Index of the closest keyframe fragment at or before each fragment.
+        keyframes = np.maximum.accumulate(np.where(self._seek['keyframe'],
+                                                   np.arange(len(self._seek)), 0))
+        first = keyframes[found]
+        last = np.where(offsets > samples[found] - 5,
+                        np.minimum(found + 1, len(self._seek) - 1), found)
 
-            last_segment = self._moof_data[max_idx][1] #Frame start/stop is in the moof
-            if frame >= last_segment['frame_start'] + last_segment['frame_samples']:
+        segment_list = []
+        for frame, valid, begin, end in zip(frames.tolist(), in_range.tolist(),
+                                            first.tolist(), last.tolist()):
+            if not valid:
                 continue
-
-            # Do a binary search for the segment in question
-            while min_idx <= max_idx:
-                guess_idx = math.floor((max_idx + min_idx) / 2)
-                moof = self._moof_data[guess_idx][1]
-                if frame < moof['frame_start']:
-                    max_idx = max_idx - 1
-                elif frame >= moof['frame_start'] + moof['frame_samples']:
-                    min_idx = min_idx + 1
-                else:
-                    frame_seg.add(self._moof_data[guess_idx][0])
-                    frame_seg.add(self._moof_data[guess_idx][0]+1)
-                    if frame - moof['frame_start'] > moof['frame_samples'] - 5:
-                        # Handle boundary conditions
-                        if guess_idx + 1 in self._moof_data:
-                            frame_seg.add(self._moof_data[guess_idx+1][0])
-                            frame_seg.add(self._moof_data[guess_idx+1][0]+1)
-                    break
-
-            frame_seg = list(frame_seg)
-            frame_seg.sort()
-            segment_list.append((frame, frame_seg))
-        logger.info(f"Given {frames}, we need {segment_list}")
+            frame_seg = [0, 1]
+            for moof in self._seek['segment'][begin:end+1].tolist():
+                frame_seg += [moof, moof + 1]
+            segment_list.append((frame, sorted(set(frame_seg))))
+        logger.info(f"Given {frames.tolist()}, we need {segment_list}")
         return segment_list
 
     def _get_impacted_segments_from_ranges(self, frame_ranges):
@@ -162,54 +167,101 @@ class MediaUtil:
         logger.info(f"Range-based segment list: {segment_list}")
         return segment_list
 
+    def _segment_frames(self, segments):
+        """ Returns the first frame in the given segments and the frame ranges of the
+            fragments among them.
+        """
+        segment_frame_start = sys.maxsize
+        segment_info = []
+        for segment_idx in segments:
+            _, _, frame_start, frame_samples, _ = self._segments[segment_idx].tolist()
+            if 0 <= frame_start < segment_frame_start:
+                segment_frame_start = frame_start
+
+            if frame_samples >= 0:
+                segment_info.append({
+                    'frame_start': frame_start,
+                    'num_frames': frame_samples})
+        return segment_frame_start, segment_info
+
+    def _coalesce(self, segments):
+        """ Returns byte ranges (start, stop) covering the given segments. Ranges that
+            overlap, touch or are separated by less than RANGE_MERGE_GAP bytes are merged.
+        """
+        ranges = []
+        for segment_idx in sorted(set(segments)):
+            offset = int(self._segments['offset'][segment_idx])
+            stop = offset + int(self._segments['size'][segment_idx])
+            if ranges and (offset - ranges[-1][1] <= RANGE_MERGE_GAP):
+                ranges[-1][1] = max(ranges[-1][1], stop)
+            else:
+                ranges.append([offset, stop])
+        return ranges
+
+    def _get_range(self, byte_range):
+        start, stop = byte_range
+        response = self._s3.get_object(Bucket=self._bucket_name,
+                                       Key=self._video_file,
+                                       Range=f'bytes={start}-{stop-1}') # Byte range is inclusive
+        return response['Body'].read()
+
+    def _fetch_segments(self, segments):
+        """ Returns a dict of segment bytes by segment index. Each byte range is read
+            once; ranges in object storage are fetched concurrently in parts of at most
+            RANGE_FETCH_PART_SIZE bytes.
+        """
+        ranges = self._coalesce(segments)
+        logger.info(f"Fetching byte ranges {ranges}")
+        if self._video_file.startswith('/'):
+            with open(self._video_file, "rb") as vid_fp:
+                m_m = mmap.mmap(vid_fp.fileno(), 0, access=mmap.ACCESS_READ)
+                blocks = [m_m[start:stop] for start, stop in ranges]
+        else:
+            parts = [[(part, min(part + RANGE_FETCH_PART_SIZE, stop))
+                      for part in range(start, stop, RANGE_FETCH_PART_SIZE)]
+                     for start, stop in ranges]
+            fetched = iter(_fetch_executor.map(self._get_range,
+                                               [part for block in parts for part in block]))
+            blocks = [b''.join(next(fetched) for _ in block) for block in parts]
+        segment_data = {}
+        block_idx = 0
+        for segment_idx in sorted(set(segments)):
+            offset = int(self._segments['offset'][segment_idx])
+            while offset >= ranges[block_idx][1]:
+                block_idx += 1
+            start = offset - ranges[block_idx][0]
+            size = int(self._segments['size'][segment_idx])
+            segment_data[segment_idx] = blocks[block_idx][start:start+size]
+        return segment_data
+
     def make_temporary_videos(self, segment_list):
         """ Return a temporary mp4 for each impacted segment to limit IO to
-            cloud storage """
+            cloud storage. Segments shared between frames are fetched once, and frames
+            needing the same segments share a file. Videos already held by the decoder
+            pool are not fetched again. """
         lookup = {}
         segment_info = []
+        pool = get_decoder_pool() if decoder_pool_enabled() else None
+        to_fetch = set()
+        for _, segments in segment_list:
+            if (pool is None) or (pool.get_data((self._video_file, tuple(segments))) is None):
+                to_fetch.update(segments)
+        segment_data = self._fetch_segments(to_fetch) if to_fetch else {}
+        temp_videos = {}
         for frame, segments in segment_list:
-            temp_video = os.path.join(self._temp_dir, f"{frame}.mp4")
-            preferred_block_size = 16*1024
-            sc_graph = [(0, 0)]
-            segment_frame_start = sys.maxsize
-            segment_num_frames = 0
-            # create a scatter/gather
-            for segment_idx in segments:
-                segment = self._segment_info['segments'][segment_idx]
-                last_io = sc_graph[len(sc_graph)-1]
-                if segment.get('frame_start', sys.maxsize) < segment_frame_start:
-                    segment_frame_start = segment['frame_start']
-
-                if 'frame_samples' in segment:
-                    segment_info.append({
-                        'frame_start': segment['frame_start'],
-                        'num_frames': segment['frame_samples']})
-
-                if last_io[0] + last_io[1] == segment['offset']:
-                    # merge contigous blocks
-                    sc_graph[len(sc_graph)-1] = (last_io[0], last_io[1] + segment['size'])
-                else:
-                    # A new block
-                    sc_graph.append((segment['offset'], segment['size']))
-
-            lookup[frame] = (segment_frame_start, temp_video)
-
-            logger.info(f"Scatter gather graph = {sc_graph}")
-            if self._video_file.startswith('/'):
-                with open(self._video_file, "r+b") as vid_fp:
-                    m_m = mmap.mmap(vid_fp.fileno(), 0)
-                    with open(temp_video, "wb") as out_fp:
-                        for scatter in sc_graph:
-                            out_fp.write(m_m[scatter[0]:scatter[0]+scatter[1]])
-            else:
-                with open(temp_video, "wb") as out_fp:
-                    for scatter in sc_graph:
-                        start = scatter[0]
-                        stop = scatter[0] + scatter[1] - 1 # Byte range is inclusive
-                        response = self._s3.get_object(Bucket=self._bucket_name,
-                                                       Key=self._video_file,
-                                                       Range=f'bytes={start}-{stop}')
-                        out_fp.write(response['Body'].read())
+            segment_frame_start, frame_segment_info = self._segment_frames(segments)
+            segment_info += frame_segment_info
+            key = tuple(segments)
+            if key not in temp_videos:
+                temp_videos[key] = os.path.join(self._temp_dir, f"{frame}.mp4")
+                data = None
+                if pool is not None:
+                    data = pool.get_data((self._video_file, key))
+                if data is None:
+                    data = b''.join(segment_data[segment_idx] for segment_idx in segments)
+                with open(temp_videos[key], "wb") as out_fp:
+                    out_fp.write(data)
+            lookup[frame] = (segment_frame_start, temp_videos[key])
 
         return lookup, segment_info
 
@@ -223,8 +275,92 @@ class MediaUtil:
         seconds = total_seconds % 60
         return f"{hours}:{minutes}:{seconds}"
 
+    def _in_process(self, render_format):
+        """ Returns true if frames can be decoded and rendered without ffmpeg.
+        """
+        return (self._segments is not None) and decoder_pool_enabled() \
+               and (render_format in PIL_FORMATS)
+
+    def get_frame_arrays(self, frames):
+        """ Returns the given frames as RGB arrays of shape (height, width, 3), decoded
+            with the decoder pool. Segments of videos not yet open in the pool are
+            fetched together before decoding.
+        """
+        pool = get_decoder_pool()
+        impacted_segments = self._get_impacted_segments(frames) or []
+        to_fetch = set()
+        for _, segments in impacted_segments:
+            if pool.get_data((self._video_file, tuple(segments))) is None:
+                to_fetch.update(segments)
+        segment_data = self._fetch_segments(to_fetch) if to_fetch else {}
+        requests = []
+        request_idx = {}
+        for frame, segments in impacted_segments:
+            segment_frame_start, _ = self._segment_frames(segments)
+            requests.append(((self._video_file, tuple(segments)),
+                             functools.partial(self._join_segments, segment_data, segments),
+                             frame - segment_frame_start))
+            request_idx[frame] = len(requests) - 1
+        arrays = pool.decode(requests)
+        frame_arrays = []
+        for frame in frames:
+            if int(frame) not in request_idx:
+                raise ValueError(f"Failed to find frame {frame} in segmented mp4!")
+            frame_arrays.append(arrays[request_idx[int(frame)]])
+        return frame_arrays
+
+    def _join_segments(self, segment_data, segments):
+        """ Returns the bytes of the given segments, fetching any that are missing from
+            segment_data (e.g. if a decoder was evicted since segments were fetched).
+        """
+        missing = [segment_idx for segment_idx in segments if segment_idx not in segment_data]
+        if missing:
+            segment_data = {**segment_data, **self._fetch_segments(missing)}
+        return b''.join(segment_data[segment_idx] for segment_idx in segments)
+
+    def _save_image(self, img, path, render_format):
+        if render_format == "jpg":
+            img.save(path, "jpeg", quality=95)
+        else:
+            img.save(path, PIL_FORMATS[render_format])
+
+    def _generate_frame_images_in_process(self, frames, rois, render_format, force_scale):
+        """ Decodes frames with the decoder pool and crops and scales them with PIL.
+        """
+        for frame_idx, array in enumerate(self.get_frame_arrays(frames)):
+            img = Image.fromarray(array)
+            if rois:
+                c = rois[frame_idx] #pylint: disable=invalid-name
+                w = max(0,min(round(c[0]*self._width),self._width)) #pylint: disable=invalid-name
+                h = max(0,min(round(c[1]*self._height),self._height)) #pylint: disable=invalid-name
+                x = max(0,min(round(c[2]*self._width),self._width)) #pylint: disable=invalid-name
+                y = max(0,min(round(c[3]*self._height),self._height)) #pylint: disable=invalid-name
+                img = img.crop((x, y, min(x+w, self._width), min(y+h, self._height)))
+                if force_scale:
+                    img = img.resize((int(force_scale[0]), int(force_scale[1])))
+            self._save_image(img, os.path.join(self._temp_dir, f"{frame_idx}.{render_format}"),
+                             render_format)
+        return True
+
+    def _tile_images(self, num_images, tile_size, render_format):
+        """ Combines the images generated for each frame into a grid with PIL.
+        """
+        columns, rows = [int(comp) for comp in tile_size.split('x')]
+        images = [Image.open(os.path.join(self._temp_dir, f"{idx}.{render_format}"))
+                  for idx in range(num_images)]
+        width, height = images[0].size
+        tile = Image.new('RGB', (width * columns, height * rows))
+        for idx, img in enumerate(images):
+            tile.paste(img, ((idx % columns) * width, (idx // columns) * height))
+        output_file = os.path.join(self._temp_dir, f"tile.{render_format}")
+        self._save_image(tile, output_file, render_format)
+        return output_file
+
     def _generate_frame_images(self, frames, rois=None, render_format="jpg", force_scale=None):
         """ Generate a jpg for each requested frame and store in the working directory """
+        if self._in_process(render_format):
+            return self._generate_frame_images_in_process(frames, rois, render_format,
+                                                          force_scale)
         BATCH_SIZE = 30
         frame_idx = 0
         procs = []
@@ -397,7 +533,9 @@ class MediaUtil:
             return None
 
         output_file = None
-        if len(frames) > 1:
+        if len(frames) > 1 and self._in_process(render_format):
+            output_file = self._tile_images(len(frames), tile_size, render_format)
+        elif len(frames) > 1:
             # Make a tiled jpeg
             tile_args = ["ffmpeg",
                          "-i", os.path.join(self._temp_dir, f"%d.{render_format}"),
@@ -48,6 +48,11 @@ class ProjectPermissionBase(BasePermission):
             project = self._project_from_object(obj)
             if project is None:
                 raise Http404
+        elif 'task_id' in view.kwargs:
+            task = TatorCache().get_search_task(view.kwargs['task_id'])
+            if task is None:
+                raise Http404
+            project = get_object_or_404(Project, pk=task['project'])
         elif 'uid' in view.kwargs:
             uid = view.kwargs['uid']
             try:
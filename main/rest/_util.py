@@ -1,14 +1,19 @@
 import datetime
 import logging
+import base64
+import json
+import itertools
 
 from django.utils.http import urlencode
 from django.db.models.expressions import Subquery
+from django.db.models.expressions import RawSQL
 from rest_framework.reverse import reverse
 from rest_framework.exceptions import APIException
 
 from ..models import type_to_obj
 
-from ._attributes import convert_attribute
+from ._attributes import attribute_validator
+from ._base_views import STREAM_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +21,79 @@ class Array(Subquery):
     """ Class to expose ARRAY SQL function to ORM """
     template = 'ARRAY(%(subquery)s)'
 
+def filter_by_ids(qs, ids):
+    """ Restricts a queryset to a list of primary keys, such as the results of an
+        elasticsearch query. The IDs are sent to postgres as a single array literal and
+        joined with unnest, which avoids parsing and planning an IN clause with one
+        constant per ID.
+    """
+    id_array = '{' + ','.join(str(int(id_)) for id_ in ids) + '}'
+    return qs.filter(pk__in=RawSQL('SELECT unnest(%s::integer[])', (id_array,)))
+
+def iter_values(querysets, fields, chunk_size=STREAM_CHUNK_SIZE):
+    """ Generator yielding a dict of field values for each row of a sequence of querysets,
+        such as the pages of an elasticsearch query.
+    """
+    for qs in querysets:
+        yield from qs.values(*fields).iterator(chunk_size=chunk_size)
+
+def chunked(iterable, size):
+    """ Generator yielding lists of at most `size` items from an iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+def update_lookup(lookup, model, ids, fields):
+    """ Adds field values of model instances to a dict keyed by primary key. Only instances
+        that are not already in the dict are queried.
+    """
+    missing = set(ids) - lookup.keys() - {None}
+    if missing:
+        for obj in model.objects.filter(pk__in=missing).values('id', *fields):
+            lookup[obj['id']] = obj
+
+def get_fields(params, properties, required=['id']):
+    """ Returns the properties selected with the `fields` parameter in the order they are
+        defined, or all properties if it is not given. Required properties are always
+        included.
+    """
+    fields = params.get('fields')
+    if fields is None:
+        return properties
+    return [prop for prop in properties if (prop in fields) or (prop in required)]
+
+def select_fields(response_data, fields):
+    """ Removes properties that were not selected from a list of objects.
+    """
+    return [{field: obj.get(field) for field in fields} for obj in response_data]
+
+def encode_cursor(values):
+    """ Encodes the sort key of the last result on a page as an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    """ Decodes a cursor returned by `encode_cursor`.
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'!")
+
+def get_next_cursor(params, response_data, fields):
+    """ Returns a cursor for the page following a page of results, or None if the page was
+        not limited by `stop` or is the last page.
+    """
+    start = params.get('start', 0)
+    stop = params.get('stop')
+    if (stop is None) or (len(response_data) == 0) or (len(response_data) < stop - start):
+        return None
+    return encode_cursor([response_data[-1][field] for field in fields])
+
 def reverse_queryArgs(viewname, kwargs=None, queryargs=None):
     """
     Regular reverse doesn't handle query args
@@ -52,35 +130,61 @@ def check_required_fields(datafields, attr_types, body):
         fields exist and that attributes are present. Fill in default values if they exist.
         Returns a dictionary containing attribute values.
     """
-    # Check for required fields.
-    for field in datafields:
-        if field not in body:
-            raise Exception(f'Missing required field in request body "{field}".')
-
-    # Check for required attributes. Fill in defaults if available.
-    attrs = {}
-    for attr_type in attr_types:
-        field = attr_type['name']
-        if field in body:
-            convert_attribute(attr_type, body[field]) # Validates attr value
-            attrs[field] = body[field];
-        elif attr_type['dtype'] == 'datetime':
-            if 'use_current' in attr_type and attr_type['use_current']:
-                # Fill in current datetime.
-                attrs[field] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-            elif attr_type.get('required', True):
-                # Missing a datetime.
+    return make_required_fields_check(datafields, attr_types)(body)
+
+def _missing_attribute(attr_type):
+    """ Returns a function giving the value of an attribute that is missing from a request
+        body, or raising if it is required. Returns None if the attribute is left unset.
+    """
+    field = attr_type['name']
+    if attr_type['dtype'] == 'datetime':
+        if 'use_current' in attr_type and attr_type['use_current']:
+            # Fill in current datetime.
+            return lambda: datetime.datetime.now(datetime.timezone.utc).isoformat()
+        elif attr_type.get('required', True):
+            # Missing a datetime.
+            def missing():
                 raise Exception(f'Missing attribute value for "{field}". Set `use_current` to '
                                 f'True or supply a value.')
-        else:
-            if 'default' in attr_type:
-                # Fill in default for missing field.
-                attrs[field] = attr_type['default']
-            elif attr_type.get('required', True):
-                # Missing a field and no default.
+            return missing
+    else:
+        if 'default' in attr_type:
+            # Fill in default for missing field.
+            default = attr_type['default']
+            return lambda: default
+        elif attr_type.get('required', True):
+            # Missing a field and no default.
+            def missing():
                 raise Exception(f'Missing attribute value for "{field}". Set a `default` on '
                                 f'the attribute type or supply a value.')
-    return attrs
+            return missing
+    return None
+
+def make_required_fields_check(datafields, attr_types):
+    """ Compiles the output of computeRequiredFields into a function that does the same
+        checks as `check_required_fields` on a request body. Use this to check many bodies
+        of the same entity type.
+    """
+    datafields = list(datafields)
+    checks = [(attr_type['name'], attribute_validator(attr_type), _missing_attribute(attr_type))
+              for attr_type in attr_types]
+
+    def check(body):
+        # Check for required fields.
+        for field in datafields:
+            if field not in body:
+                raise Exception(f'Missing required field in request body "{field}".')
+
+        # Check for required attributes. Fill in defaults if available.
+        attrs = {}
+        for field, validate, missing in checks:
+            if field in body:
+                validate(body[field])
+                attrs[field] = body[field]
+            elif missing is not None:
+                attrs[field] = missing()
+        return attrs
+    return check
 
 def paginate(query_params, queryset):
     start = query_params.get('start', None)
@@ -98,3 +202,14 @@ def paginate(query_params, queryset):
         qs = queryset[start:stop]
     return qs
 
+
+def paginate_count(query, count):
+    """ Applies pagination parameters of an elasticsearch query to a total count, so that
+        count endpoints agree with the length of the corresponding list response.
+    """
+    start = query.get('from', 0)
+    size = query.get('size', None)
+    count = max(count - start, 0)
+    if size is not None:
+        count = min(count, size)
+    return count
@@ -19,8 +19,16 @@ from ._permissions import ProjectExecutePermission
 logger = logging.getLogger(__name__)
 
 def media_batches(media_list, files_per_job):
-    for i in range(0, len(media_list), files_per_job):
-        yield media_list[i:i + files_per_job]
+    """ Splits an iterable of media IDs into batches without materializing it.
+    """
+    batch = []
+    for media_id in media_list:
+        batch.append(media_id)
+        if len(batch) == files_per_job:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
 
 class AlgorithmLaunchAPI(BaseListView):
     """ Start an algorithm.
@@ -56,13 +64,13 @@ class AlgorithmLaunchAPI(BaseListView):
         media_ids = []
         # Get media IDs
         if 'media_query' in params:
-            media_ids = query_string_to_media_ids(project_id, params['media_query'])
+            media_ids = query_string_to_media_ids(project_id, params['media_query']).iterator()
         elif 'media_ids' in params:
             media_ids = params['media_ids']
         else:
             media = Media.objects.filter(project=project_id)
-            media_ids = list(media.values_list("id", flat=True))
-        media_ids = [str(a) for a in media_ids]
+            media_ids = media.values_list("id", flat=True).iterator()
+        media_ids = (str(a) for a in media_ids)
 
         # Harvest extra parameters to pass into the algorithm if requested
         extra_params = []
@@ -101,13 +101,17 @@ class AttributeTypeListAPI(BaseListView):
     def _delete(self, params: Dict) -> Dict:
         """Delete an existing attribute on a type."""
         attribute_to_delete = params["attribute_to_delete"]
+        task_ids = [] if params.get("async", False) else None
         entity_type, obj_qs = self._get_objects(params)
-        TatorSearch().delete_alias(entity_type, attribute_to_delete).save()
+        TatorSearch().delete_alias(entity_type, attribute_to_delete, task_ids=task_ids).save()
 
         if obj_qs.exists():
             bulk_delete_attributes([attribute_to_delete], obj_qs)
 
-        return {"message": f"Attribute '{attribute_to_delete}' deleted"}
+        response = {"message": f"Attribute '{attribute_to_delete}' deleted"}
+        if task_ids:
+            response["task_ids"] = task_ids
+        return response
 
     def _patch(self, params: Dict) -> Dict:
         """Rename an attribute on a type."""
@@ -119,6 +123,7 @@ class AttributeTypeListAPI(BaseListView):
         new_attribute_type = params["new_attribute_type"]
         new_name = new_attribute_type["name"]
         attribute_renamed = old_name != new_name
+        task_ids = [] if params.get("async", False) else None
 
         # Get the old and new dtypes
         entity_type, obj_qs = self._get_objects(params)
@@ -189,9 +194,9 @@ class AttributeTypeListAPI(BaseListView):
 
         if attribute_mutated:
             # Update entity type attribute type
-            ts.mutate_alias(entity_type, new_name, new_attribute_type).save()
+            ts.mutate_alias(entity_type, new_name, new_attribute_type, task_ids=task_ids).save()
             for instance, _ in related_objects:
-                ts.mutate_alias(instance, new_name, new_attribute_type).save()
+                ts.mutate_alias(instance, new_name, new_attribute_type, task_ids=task_ids).save()
 
             # Convert entity values
             if obj_qs.exists():
@@ -221,7 +226,10 @@ class AttributeTypeListAPI(BaseListView):
                 f"Attribute '{new_name}' mutated from:\n{old_attribute_type}\nto:\n{new_attribute_type}"
             )
 
-        return {"message": "\n".join(messages)}
+        response = {"message": "\n".join(messages)}
+        if task_ids:
+            response["task_ids"] = task_ids
+        return response
 
     def _post(self, params: Dict) -> Dict:
         """Adds an attribute to a type."""
@@ -13,7 +13,8 @@ from ..models import Section
 from ..models import Resource
 from ..search import TatorSearch
 
-from ._media_query import get_media_queryset
+from ._media_query import get_media_querysets
+from ._media_query import get_media_count
 from ._base_views import BaseListView
 from ._permissions import ClonePermission
 
@@ -44,12 +45,10 @@ class CloneMediaListAPI(BaseListView):
         # Make sure destination path exists.
         os.makedirs(os.path.join('/media', str(dest)), exist_ok=True)
 
-        # Retrieve media that will be cloned.
         response_data = []
-        original_medias = get_media_queryset(self.kwargs['project'], params)
 
         # If there are too many Media to create at once, raise an exception.
-        if original_medias.count() > self.MAX_NUM_MEDIA:
+        if get_media_count(self.kwargs['project'], params) > self.MAX_NUM_MEDIA:
             raise Exception('Maximum number of media that can be cloned in one request is '
                            f'{self.MAX_NUM_MEDIA}. Try paginating request with start, stop, '
                             'or after parameters.')
@@ -74,8 +73,11 @@ class CloneMediaListAPI(BaseListView):
             else:
                 section = sections[0]
 
+        # Retrieve media that will be cloned.
         new_objs = []
-        for media in original_medias.iterator():
+        original_medias = (media for qs in get_media_querysets(self.kwargs['project'], params)
+                           for media in qs.iterator())
+        for media in original_medias:
             new_obj = media
             new_obj.pk = None
             new_obj.project = Project.objects.get(pk=dest)
@@ -15,6 +15,8 @@ from ..schema import GetFrameSchema
 from ..schema import parse
 from ._base_views import BaseDetailView
 from ._media_util import MediaUtil
+from ..render_cache import render_key
+from ..render_cache import get_render
 from ._permissions import ProjectViewOnlyPermission
 
 logger = logging.getLogger(__name__)
@@ -93,22 +95,30 @@ class GetFrameAPI(BaseDetailView):
 
 
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            media_util = MediaUtil(video, temp_dir, quality)
-            if len(frames) > 1 and animate:
-                # Default to gif for animate, but mp4 is also supported
-                if any(x is self.request.accepted_renderer.format for x in ['mp4','gif']):
-                    pass
-                else:
-                    self.request.accepted_renderer = GifRenderer()
-                gif_fp = media_util.get_animation(frames, roi_arg, fps=animate,
-                                                  render_format=self.request.accepted_renderer.format)
-                with open(gif_fp, 'rb') as data_file:
-                    response_data = data_file.read()
+        if len(frames) > 1 and animate:
+            # Default to gif for animate, but mp4 is also supported
+            if any(x is self.request.accepted_renderer.format for x in ['mp4','gif']):
+                pass
             else:
-                logger.info(f"Accepted format = {self.request.accepted_renderer.format}")
-                tiled_fp = media_util.get_tile_image(frames, roi_arg, tile_size,
-                                                     render_format=self.request.accepted_renderer.format)
-                with open(tiled_fp, 'rb') as data_file:
-                    response_data = data_file.read()
-        return response_data
+                self.request.accepted_renderer = GifRenderer()
+        render_format = self.request.accepted_renderer.format
+        key = render_key(video, frames=[int(frame) for frame in frames], roi=roi_arg,
+                         tile=tile_size, animate=animate if len(frames) > 1 else None,
+                         quality=quality, format=render_format)
+
+        def _render():
+            with tempfile.TemporaryDirectory() as temp_dir:
+                media_util = MediaUtil(video, temp_dir, quality)
+                if len(frames) > 1 and animate:
+                    gif_fp = media_util.get_animation(frames, roi_arg, fps=animate,
+                                                      render_format=render_format)
+                    with open(gif_fp, 'rb') as data_file:
+                        return data_file.read()
+                else:
+                    logger.info(f"Accepted format = {render_format}")
+                    tiled_fp = media_util.get_tile_image(frames, roi_arg, tile_size,
+                                                         render_format=render_format)
+                    with open(tiled_fp, 'rb') as data_file:
+                        return data_file.read()
+
+        return get_render(self.request, video.pk, key, render_format, _render)
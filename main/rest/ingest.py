@@ -0,0 +1,330 @@
+import csv
+import json
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from ..models import Localization
+from ..models import LocalizationType
+from ..models import Media
+from ..models import State
+from ..models import StateType
+from ..models import Version
+from ..models import index_entities
+from ..models import queue_entity_ids
+from ..schema import LocalizationIngestSchema
+from ..schema import StateIngestSchema
+from ..schema import parse
+
+from ._base_views import BaseListView
+from ._base_views import STREAM_CHUNK_SIZE
+from ._permissions import ProjectEditPermission
+from ._util import chunked
+from ._util import filter_by_ids
+
+logger = logging.getLogger(__name__)
+
+# Size of reads from the request body while copying it into postgres.
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of offending rows reported by a failed check.
+MAX_REPORTED_ROWS = 10
+
+class _WithoutBody:
+    """ Proxy of a request that hides its body, so that parameters can be parsed without
+        reading a body that will be copied into postgres.
+    """
+    body = b''
+
+    def __init__(self, request):
+        self._request = request
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+def _json_value(key_param='%s'):
+    """ SQL expression for a JSON value in a spec. CSV values are always strings, so strings
+        containing JSON arrays or objects are decoded.
+    """
+    return (f"CASE WHEN jsonb_typeof(spec->{key_param}) = 'string' "
+            f"AND left(spec->>{key_param}, 1) IN ('[', '{{') "
+            f"THEN (spec->>{key_param})::jsonb ELSE spec->{key_param} END")
+
+def _attribute_value(attr_type):
+    """ Returns SQL and parameters converting an attribute of a spec to its stored value.
+        Values that cannot be converted to the attribute dtype raise an error in postgres.
+    """
+    name = attr_type['name']
+    dtype = attr_type['dtype']
+    params = [name]
+    if dtype == 'bool':
+        expression = 'to_jsonb((spec->>%s)::boolean)'
+    elif dtype == 'int':
+        expression = 'to_jsonb((spec->>%s)::bigint)'
+    elif dtype == 'float':
+        expression = 'to_jsonb((spec->>%s)::double precision)'
+    elif dtype == 'datetime':
+        expression = 'to_jsonb((spec->>%s)::timestamptz)'
+    elif dtype == 'geopos':
+        expression = _json_value()
+        params = [name] * 4
+    else:
+        expression = 'to_jsonb(spec->>%s)'
+    if dtype == 'datetime':
+        if attr_type.get('use_current', False):
+            expression = f'COALESCE({expression}, to_jsonb(now()))'
+    elif 'default' in attr_type:
+        expression = f'COALESCE({expression}, %s::jsonb)'
+        params.append(json.dumps(attr_type['default']))
+    return f'jsonb_build_object(%s, {expression})', [name] + params
+
+def _attributes(attr_types):
+    """ Returns SQL and parameters building the attributes of a spec.
+    """
+    if not attr_types:
+        return "'{}'::jsonb", []
+    expressions = []
+    params = []
+    for attr_type in attr_types:
+        expression, attr_params = _attribute_value(attr_type)
+        expressions.append(expression)
+        params += attr_params
+    return f"jsonb_strip_nulls({' || '.join(expressions)})", params
+
+def _attribute_checks(attr_types):
+    """ Returns checks of attribute values that are not done by dtype conversion.
+    """
+    checks = []
+    for attr_type in attr_types:
+        name = attr_type['name']
+        if attr_type['dtype'] == 'datetime':
+            required = (not attr_type.get('use_current', False)) and attr_type.get('required', True)
+        else:
+            required = ('default' not in attr_type) and attr_type.get('required', True)
+        if required:
+            checks.append(('NOT spec ? %s', [name], f'Missing attribute value for "{name}"'))
+        if attr_type['dtype'] == 'enum':
+            checks.append(('spec ? %s AND NOT (spec->>%s = ANY(%s))',
+                           [name, name, attr_type['choices']],
+                           f'Invalid value for enum attribute "{name}"'))
+        if attr_type['dtype'] in ['int', 'float']:
+            if 'minimum' in attr_type:
+                checks.append(('(spec->>%s)::double precision < %s', [name, attr_type['minimum']],
+                               f'Value below minimum for attribute "{name}"'))
+            if 'maximum' in attr_type:
+                checks.append(('(spec->>%s)::double precision > %s', [name, attr_type['maximum']],
+                               f'Value above maximum for attribute "{name}"'))
+    return checks
+
+def _ids_in_project(model, project_column, key):
+    """ Returns a condition that is true if a spec contains an array of IDs of which some
+        are not objects of the project.
+    """
+    return (f'EXISTS (SELECT 1 FROM jsonb_array_elements_text({_json_value()}) AS e(id) '
+            f'WHERE NOT EXISTS (SELECT 1 FROM "{model._meta.db_table}" AS obj '
+            f'WHERE obj.id = e.id::integer AND obj."{project_column}" = %s))',
+            [key] * 4)
+
+class _IngestMixin:
+    """ Bulk creation of annotations from newline delimited JSON or CSV.
+
+        The request body is copied into a temporary table with `COPY FROM STDIN`. Checks and
+        foreign key resolution are done with one query each over the whole table, followed
+        by a single insert into the annotation table.
+    """
+    permission_classes = [ProjectEditPermission]
+    http_method_names = ['post']
+
+    def post(self, request, format=None, **kwargs):
+        params = parse(_WithoutBody(request))
+        entity_type = self.type_model.objects.get(pk=params['type'])
+        if entity_type.project_id != params['project']:
+            raise Exception(f"Type {entity_type.pk} is not in project {params['project']}!")
+        with transaction.atomic(), connection.cursor() as cursor:
+            self._copy(cursor, request)
+            self._check(cursor, entity_type)
+            ids = self._insert(cursor, entity_type, _default_version(params['project']))
+            if settings.ASYNC_INDEXING:
+                queue_entity_ids(params['project'], self.entity_name, ids)
+            else:
+                for batch in chunked(ids, STREAM_CHUNK_SIZE):
+                    qs = filter_by_ids(self.entity_model.objects.all(), batch)
+                    index_entities(params['project'], self.entity_name,
+                                   qs.select_related('project', 'meta').iterator())
+            cursor.execute('DROP TABLE ingest_specs')
+        response_data = {'message': f'Successfully created {len(ids)} {self.entity_name}s!',
+                         'id': ids}
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    def _copy(self, cursor, request):
+        """ Copies specs in the request body into the `ingest_specs` table.
+        """
+        cursor.execute('DROP TABLE IF EXISTS ingest_specs')
+        cursor.execute('CREATE TEMPORARY TABLE ingest_specs (line serial PRIMARY KEY, '
+                       'id integer, spec jsonb) ON COMMIT DROP')
+        if request.content_type == 'text/csv':
+            header = request.readline().decode().strip()
+            columns = next(csv.reader([header]))
+            if any(['"' in column for column in columns]):
+                raise Exception("CSV column names may not contain double quotes!")
+            column_list = ', '.join([f'"{column}"' for column in columns])
+            column_defs = ', '.join([f'"{column}" text' for column in columns])
+            cursor.execute('DROP TABLE IF EXISTS ingest_rows')
+            cursor.execute(f'CREATE TEMPORARY TABLE ingest_rows (_line serial, {column_defs}) '
+                           f'ON COMMIT DROP')
+            cursor.cursor.copy_expert(f'COPY ingest_rows ({column_list}) FROM STDIN WITH (FORMAT csv)',
+                                      request, COPY_CHUNK_SIZE)
+            cursor.execute("INSERT INTO ingest_specs (spec) "
+                           "SELECT jsonb_strip_nulls(to_jsonb(r) - '_line') FROM ingest_rows r "
+                           "ORDER BY r._line")
+            cursor.execute('DROP TABLE ingest_rows')
+        else:
+            # Each line is copied as a single CSV field, using quote and delimiter characters
+            # that cannot appear in JSON so that the line is not unescaped.
+            cursor.cursor.copy_expert("COPY ingest_specs (spec) FROM STDIN WITH "
+                                      "(FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')",
+                                      request, COPY_CHUNK_SIZE)
+            cursor.execute('DELETE FROM ingest_specs WHERE spec IS NULL')
+
+    def _check(self, cursor, entity_type):
+        """ Runs each check over all specs, raising with the offending rows if any fail.
+        """
+        checks = self._checks(entity_type.project_id) + _attribute_checks(entity_type.attribute_types)
+        version_table = Version._meta.db_table
+        version_project = Version._meta.get_field('project').column
+        checks.append((f'spec ? %s AND NOT EXISTS (SELECT 1 FROM "{version_table}" AS v '
+                       f'WHERE v.id = (spec->>%s)::integer AND v."{version_project}" = %s)',
+                       ['version', 'version', entity_type.project_id],
+                       'Version does not exist in project'))
+        for condition, params, message in checks:
+            cursor.execute(f'SELECT line FROM ingest_specs WHERE {condition} '
+                           f'ORDER BY line LIMIT {MAX_REPORTED_ROWS}', params)
+            lines = [row[0] for row in cursor.fetchall()]
+            if lines:
+                raise Exception(f"{message} (rows {lines})!")
+
+    def _allocate_ids(self, cursor):
+        """ Assigns IDs from the entity table sequence to the specs, in row order.
+        """
+        table = self.entity_model._meta.db_table
+        cursor.execute(f"UPDATE ingest_specs AS s SET id = n.id FROM ("
+                       f"SELECT line, nextval(pg_get_serial_sequence('\"{table}\"', 'id')) AS id "
+                       f"FROM ingest_specs ORDER BY line) AS n WHERE s.line = n.line")
+        cursor.execute('SELECT id FROM ingest_specs ORDER BY line')
+        return [row[0] for row in cursor.fetchall()]
+
+def _default_version(project):
+    """ Returns the ID of the default version of a project, creating it if necessary.
+    """
+    version, _ = Version.objects.get_or_create(project_id=project, number=0, defaults={
+        'name': 'Baseline',
+        'description': 'Initial version',
+    })
+    return version.pk
+
+class LocalizationIngestAPI(_IngestMixin, BaseListView):
+    """ Bulk create localizations from newline delimited JSON or CSV.
+
+        Each row has the same fields as a localization spec. All localizations in a request
+        are of the type given by the `type` parameter.
+    """
+    schema = LocalizationIngestSchema()
+    type_model = LocalizationType
+    entity_model = Localization
+    entity_name = 'localization'
+
+    def _checks(self, project):
+        media_table = Media._meta.db_table
+        return [
+            ('NOT spec ? %s', ['media_id'], 'Missing required field "media_id"'),
+            (f'NOT EXISTS (SELECT 1 FROM "{media_table}" AS m '
+             f'WHERE m.id = (spec->>%s)::integer AND m.project = %s)',
+             ['media_id', project], 'Media does not exist in project'),
+            (f'spec ? %s AND NOT EXISTS (SELECT 1 FROM "{Localization._meta.db_table}" AS p '
+             f'WHERE p.id = (spec->>%s)::integer)',
+             ['parent', 'parent'], 'Parent localization does not exist'),
+        ]
+
+    def _insert(self, cursor, entity_type, version):
+        ids = self._allocate_ids(cursor)
+        attributes, attr_params = _attributes(entity_type.attribute_types)
+        user = self.request.user.pk
+        cursor.execute(
+            f'INSERT INTO "{Localization._meta.db_table}" (id, project, meta, media, "user", '
+            f'created_by, modified_by, created_datetime, modified_datetime, version, modified, '
+            f'parent, x, y, u, v, width, height, frame, attributes) '
+            f'SELECT id, %s, %s, (spec->>\'media_id\')::integer, %s, %s, %s, now(), now(), '
+            f'COALESCE((spec->>\'version\')::integer, %s), true, (spec->>\'parent\')::integer, '
+            f'(spec->>\'x\')::double precision, (spec->>\'y\')::double precision, '
+            f'(spec->>\'u\')::double precision, (spec->>\'v\')::double precision, '
+            f'(spec->>\'width\')::double precision, (spec->>\'height\')::double precision, '
+            f'(spec->>\'frame\')::integer, {attributes} '
+            f'FROM ingest_specs ORDER BY line',
+            [entity_type.project_id, entity_type.pk, user, user, user, version] + attr_params)
+        return ids
+
+class StateIngestAPI(_IngestMixin, BaseListView):
+    """ Bulk create states from newline delimited JSON or CSV.
+
+        Each row has the same fields as a state spec. In CSV, `media_ids` and
+        `localization_ids` are JSON arrays. All states in a request are of the type given by
+        the `type` parameter.
+    """
+    schema = StateIngestSchema()
+    type_model = StateType
+    entity_model = State
+    entity_name = 'state'
+
+    def _checks(self, project):
+        media_condition, media_params = _ids_in_project(Media, 'project', 'media_ids')
+        loc_condition, loc_params = _ids_in_project(Localization, 'project', 'localization_ids')
+        return [
+            ('NOT spec ? %s', ['media_ids'], 'Missing required field "media_ids"'),
+            (media_condition, media_params + [project], 'Media do not exist in project'),
+            (f'spec ? %s AND {loc_condition}', ['localization_ids'] + loc_params + [project],
+             'Localizations do not exist in project'),
+        ]
+
+    def _insert(self, cursor, entity_type, version):
+        ids = self._allocate_ids(cursor)
+        attributes, attr_params = _attributes(entity_type.attribute_types)
+        user = self.request.user.pk
+        cursor.execute(
+            f'INSERT INTO "{State._meta.db_table}" (id, project, meta, created_by, modified_by, '
+            f'created_datetime, modified_datetime, version, modified, frame, attributes) '
+            f'SELECT id, %s, %s, %s, %s, now(), now(), '
+            f'COALESCE((spec->>\'version\')::integer, %s), true, (spec->>\'frame\')::integer, '
+            f'{attributes} FROM ingest_specs ORDER BY line',
+            [entity_type.project_id, entity_type.pk, user, user, version] + attr_params)
+
+        # Create many to many relations.
+        for field, target, key in [('media', 'media', 'media_ids'),
+                                   ('localizations', 'localization', 'localization_ids')]:
+            through = getattr(State, field).through
+            target = through._meta.get_field(target)
+            cursor.execute(
+                f'INSERT INTO "{through._meta.db_table}" (state_id, "{target.column}") '
+                f'SELECT s.id, e.id::integer FROM ingest_specs AS s, '
+                f'jsonb_array_elements_text({_json_value()}) AS e(id) WHERE s.spec ? %s',
+                [key] * 5)
+
+        # Calculate segments as runs of consecutive localization frames.
+        localizations = State.localizations.through._meta.db_table
+        cursor.execute(
+            f'UPDATE "{State._meta.db_table}" AS s SET segments = seg.segments FROM ('
+            f'SELECT state_id, jsonb_agg(jsonb_build_array(start, stop) ORDER BY start) '
+            f'AS segments FROM ('
+            f'SELECT state_id, min(frame) AS start, max(frame) AS stop FROM ('
+            f'SELECT DISTINCT sl.state_id, l.frame, '
+            f'l.frame - dense_rank() OVER (PARTITION BY sl.state_id ORDER BY l.frame) AS run '
+            f'FROM "{localizations}" AS sl '
+            f'JOIN "{Localization._meta.db_table}" AS l ON l.id = sl.localization_id '
+            f'WHERE sl.state_id = ANY(%s::integer[]) AND l.frame IS NOT NULL) AS f '
+            f'GROUP BY state_id, run) AS r GROUP BY state_id) AS seg '
+            f'WHERE s.id = seg.state_id',
+            [ids])
+        return ids
@@ -6,8 +6,9 @@ from django.db import transaction
 from ..models import Leaf
 from ..models import LeafType
 from ..models import Project
-from ..models import database_qs
-from ..models import database_query_ids
+from ..models import database_query_ids_json
+from ..models import index_entities
+from ..models import database_query_id_json
 from ..search import TatorSearch
 from ..schema import LeafSuggestionSchema
 from ..schema import LeafListSchema
@@ -16,13 +17,15 @@ from ..schema.components import leaf as leaf_schema
 
 from ._base_views import BaseListView
 from ._base_views import BaseDetailView
-from ._leaf_query import get_leaf_queryset
+from ._leaf_query import get_leaf_querysets
 from ._leaf_query import get_leaf_es_query
 from ._attributes import patch_attributes
 from ._attributes import bulk_patch_attributes
 from ._attributes import validate_attributes
 from ._util import computeRequiredFields
 from ._util import check_required_fields
+from ._util import get_fields
+from ._util import iter_values
 from ._permissions import ProjectViewOnlyPermission
 from ._permissions import ProjectFullControlPermission
 
@@ -97,8 +100,8 @@ class LeafListAPI(BaseListView):
     entity_type = LeafType # Needed by attribute filter mixin
 
     def _get(self, params):
-        qs = get_leaf_queryset(params['project'], params)
-        response_data = list(qs.values(*LEAF_PROPERTIES))
+        querysets = get_leaf_querysets(params['project'], params)
+        response_data = list(iter_values(querysets, get_fields(params, LEAF_PROPERTIES)))
         return response_data
 
     def _post(self, params):
@@ -151,44 +154,54 @@ class LeafListAPI(BaseListView):
                 create_buffer = []
         leaves += Leaf.objects.bulk_create(create_buffer)
 
-        # Build ES documents.
-        ts = TatorSearch()
-        documents = []
-        for leaf in leaves:
-            documents += ts.build_document(leaf)
-            if len(documents) > 1000:
-                ts.bulk_add_documents(documents)
-                documents = []
-        ts.bulk_add_documents(documents)
+        # Index the leaves, or queue them for indexing.
+        index_entities(project.pk, 'leaf', leaves, params.get('wait_for_index', False))
 
         # Return created IDs.
         ids = [leaf.id for leaf in leaves]
         return {'message': f'Successfully created {len(ids)} leaves!', 'id': ids}
 
     def _delete(self, params):
-        qs = get_leaf_queryset(params['project'], params)
-        count = qs.count()
-        if count > 0:
+        count = 0
+        for qs in get_leaf_querysets(params['project'], params):
+            count += qs.count()
             qs._raw_delete(qs.db)
+        if count > 0:
             query = get_leaf_es_query(params)
             TatorSearch().delete(self.kwargs['project'], query)
         return {'message': f'Successfully deleted {count} leaves!'}
 
     def _patch(self, params):
-        qs = get_leaf_queryset(params['project'], params)
-        count = qs.count()
-        if count > 0:
-            new_attrs = validate_attributes(params, qs[0])
+        count = 0
+        meta = None
+        task_id = None
+        for qs in get_leaf_querysets(params['project'], params):
+            chunk_count = qs.count()
+            if chunk_count == 0:
+                continue
+            if meta is None:
+                first = qs[0]
+                new_attrs = validate_attributes(params, first)
+                meta = first.meta
             bulk_patch_attributes(new_attrs, qs)
+            count += chunk_count
+        if count > 0:
             query = get_leaf_es_query(params)
-            TatorSearch().update(self.kwargs['project'], qs[0].meta, query, new_attrs)
-        return {'message': f'Successfully updated {count} leaves!'}
+            task_id = TatorSearch().update(self.kwargs['project'], meta, query,
+                                           new_attrs, not params.get('async', False))
+        response = {'message': f'Successfully updated {count} leaves!'}
+        if task_id is not None:
+            response['task_id'] = task_id
+        return response
 
     def _put(self, params):
         """ Retrieve list of leaves by ID.
         """
-        qs = Leaf.objects.filter(pk__in=params['body'])
-        return list(qs.values(*LEAF_PROPERTIES))
+        response_data = []
+        ids = params['body']
+        if len(ids) > 0:
+            response_data = database_query_ids_json('main_leaf', ids, 'id', LEAF_PROPERTIES)
+        return response_data
 
 class LeafDetailAPI(BaseDetailView):
     """ Interact with individual leaf.
@@ -201,11 +214,12 @@ class LeafDetailAPI(BaseDetailView):
     lookup_field = 'id'
 
     def _get(self, params):
-        return database_qs(Leaf.objects.filter(pk=params['id']))[0]
+        return database_query_id_json('main_leaf', params['id'])
 
     @transaction.atomic
     def _patch(self, params):
         obj = Leaf.objects.get(pk=params['id'])
+        obj._wait_for_index = params.get('wait_for_index', False)
 
         # Patch common attributes.
         if 'name' in params:
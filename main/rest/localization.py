@@ -11,7 +11,12 @@ from ..models import User
 from ..models import Project
 from ..models import Version
 from ..models import database_qs
-from ..models import database_query_ids
+from ..models import database_query_ids_json
+from ..models import index_entities
+from ..models import index_bulk_update
+from ..models import database_query_id_json
+from ..registry import get_project_types
+from ..renderers import CsvStream
 from ..search import TatorSearch
 from ..schema import LocalizationListSchema
 from ..schema import LocalizationDetailSchema
@@ -20,18 +25,28 @@ from ..schema.components import localization as localization_schema
 
 from ._base_views import BaseListView
 from ._base_views import BaseDetailView
-from ._annotation_query import get_annotation_queryset
+from ._base_views import STREAM_CHUNK_SIZE
+from ._annotation_query import get_annotation_querysets
+from ._annotation_query import get_annotation_read_model
 from ._annotation_query import get_annotation_es_query
 from ._attributes import patch_attributes
 from ._attributes import bulk_patch_attributes
 from ._attributes import validate_attributes
 from ._util import computeRequiredFields
-from ._util import check_required_fields
+from ._util import make_required_fields_check
+from ._util import get_next_cursor
+from ._util import get_fields
+from ._util import select_fields
+from ._util import chunked
+from ._util import iter_values
+from ._columnar import get_columns
+from ._util import update_lookup
 from ._permissions import ProjectEditPermission
 
 logger = logging.getLogger(__name__)
 
 LOCALIZATION_PROPERTIES = list(localization_schema['properties'].keys())
+COLUMNAR_FIELDS = ['id', 'media', 'frame', 'x', 'y', 'u', 'v', 'width', 'height', 'meta', 'version']
 
 class LocalizationListAPI(BaseListView):
     """ Interact with list of localizations.
@@ -49,38 +64,54 @@ class LocalizationListAPI(BaseListView):
     entity_type = LocalizationType # Needed by attribute filter mixin
 
     def _get(self, params):
-        qs = get_annotation_queryset(self.kwargs['project'], params, 'localization')
-        response_data = list(qs.values(*LOCALIZATION_PROPERTIES))
-
-        # Adjust fields for csv output.
         if self.request.accepted_renderer.format == 'csv':
-            # CSV creation requires a bit more
-            user_ids = set([d['user'] for d in response_data])
-            users = list(User.objects.filter(id__in=user_ids).values('id','email'))
-            email_dict = {}
-            for user in users:
-                email_dict[user['id']] = user['email']
-
-            media_ids = set([d['media'] for d in response_data])
-            medias = list(Media.objects.filter(id__in=media_ids).values('id','name'))
-            filename_dict = {}
-            for media in medias:
-                filename_dict[media['id']] = media['name']
-
-            for element in response_data:
-                del element['meta']
-
-                oldAttributes = element['attributes']
-                del element['attributes']
-                element.update(oldAttributes)
-
-                user_id = element['user']
-                media_id = element['media']
-
-                element['user'] = email_dict[user_id]
-                element['media'] = filename_dict[media_id]
+            return self._get_csv(params)
+        if self.request.accepted_renderer.format == 'columnar':
+            querysets = get_annotation_querysets(self.kwargs['project'], params, 'localization')
+            rows = iter_values(querysets, COLUMNAR_FIELDS + ['attributes'])
+            attribute_names = get_project_types(self.kwargs['project'])\
+                              .get_attribute_names('LocalizationType', params.get('type'))
+            buffer_fields = COLUMNAR_FIELDS if params.get('buffers', False) else None
+            return get_columns(rows, COLUMNAR_FIELDS, attribute_names, buffer_fields)
+        fields = get_fields(params, LOCALIZATION_PROPERTIES)
+        if self._streaming(params):
+            querysets = get_annotation_querysets(self.kwargs['project'], params, 'localization')
+            return iter_values(querysets, fields)
+        response_data = get_annotation_read_model(self.kwargs['project'], params, 'localization')
+        if response_data is None:
+            querysets = get_annotation_querysets(self.kwargs['project'], params, 'localization')
+            response_data = list(iter_values(querysets, fields))
+        elif fields != LOCALIZATION_PROPERTIES:
+            response_data = select_fields(response_data, fields)
+        cursor = get_next_cursor(params, response_data, ['id'])
+        if cursor is not None:
+            self.headers['X-Next-Cursor'] = cursor
+
         return response_data
 
+    def _get_csv(self, params):
+        """ Streams localizations as CSV. Attribute columns are taken from the localization
+            type definitions. User emails and media names are looked up once per chunk of rows.
+        """
+        project = self.kwargs['project']
+        querysets = get_annotation_querysets(project, params, 'localization')
+        fields = [field for field in LOCALIZATION_PROPERTIES if field not in ['meta', 'attributes']]
+        attribute_names = get_project_types(project).get_attribute_names('LocalizationType',
+                                                                          params.get('type'))
+        return CsvStream(fields + attribute_names, self._csv_rows(querysets), STREAM_CHUNK_SIZE)
+
+    def _csv_rows(self, querysets):
+        users = {}
+        media = {}
+        rows = iter_values(querysets, LOCALIZATION_PROPERTIES)
+        for chunk in chunked(rows, STREAM_CHUNK_SIZE):
+            update_lookup(users, User, [row['user'] for row in chunk], ['email'])
+            update_lookup(media, Media, [row['media'] for row in chunk], ['name'])
+            for row in chunk:
+                row['user'] = users.get(row['user'], {}).get('email')
+                row['media'] = media.get(row['media'], {}).get('name')
+                yield row
+
     def _post(self, params):
         # Check that we are getting a localization list.
         if 'body' in params:
@@ -89,6 +120,7 @@ class LocalizationListAPI(BaseListView):
             raise Exception('Localization creation requires list of localizations!')
 
         # Get a default version.
+        project = Project.objects.get(pk=params['project'])
         default_version = Version.objects.filter(project=params['project'], number=0)
         if default_version.exists():
             default_version = default_version[0]
@@ -112,26 +144,31 @@ class LocalizationListAPI(BaseListView):
         version_qs = Version.objects.filter(pk__in=version_ids)
 
         # Construct foreign key dictionaries.
-        project = Project.objects.get(pk=params['project'])
         metas = {obj.id:obj for obj in meta_qs.iterator()}
         medias = {obj.id:obj for obj in media_qs.iterator()}
         versions = {obj.id:obj for obj in version_qs.iterator()}
         versions[None] = default_version
 
+        # Check that all parents exist with a single query.
+        parent_ids = set([loc['parent'] for loc in loc_specs if loc.get('parent', None)])
+        if parent_ids:
+            found = set(Localization.objects.filter(pk__in=parent_ids)
+                        .values_list('id', flat=True))
+            missing = parent_ids - found
+            if missing:
+                raise Localization.DoesNotExist(f"Parent localization(s) {sorted(missing)} "
+                                                f"do not exist!")
+
         # Get required fields for attributes.
         required_fields = {id_:computeRequiredFields(metas[id_]) for id_ in meta_ids}
-        attr_specs = [check_required_fields(required_fields[loc['type']][0],
-                                            required_fields[loc['type']][2],
-                                            loc)
-                      for loc in loc_specs]
-       
+        checks = {id_:make_required_fields_check(fields[0], fields[2])
+                  for id_, fields in required_fields.items()}
+        attr_specs = [checks[loc['type']](loc) for loc in loc_specs]
+
         # Create the localization objects.
         localizations = []
         create_buffer = []
         for loc_spec, attrs in zip(loc_specs, attr_specs):
-            parent = None
-            if loc_spec.get('parent', None):
-                parent = Localization.objects.get(pk=loc_spec.get('parent', None))
             loc = Localization(project=project,
                                meta=metas[loc_spec['type']],
                                media=medias[loc_spec['media_id']],
@@ -140,7 +177,7 @@ class LocalizationListAPI(BaseListView):
                                created_by=self.request.user,
                                modified_by=self.request.user,
                                version=versions[loc_spec.get('version', None)],
-                               parent=parent,
+                               parent_id=loc_spec.get('parent', None) or None,
                                x=loc_spec.get('x', None),
                                y=loc_spec.get('y', None),
                                u=loc_spec.get('u', None),
@@ -154,44 +191,54 @@ class LocalizationListAPI(BaseListView):
                 create_buffer = []
         localizations += Localization.objects.bulk_create(create_buffer)
 
-        # Build ES documents.
-        ts = TatorSearch()
-        documents = []
-        for loc in localizations:
-            documents += ts.build_document(loc)
-            if len(documents) > 1000:
-                ts.bulk_add_documents(documents)
-                documents = []
-        ts.bulk_add_documents(documents)
+        # Index the localizations, or queue them for indexing.
+        index_entities(project.pk, 'localization', localizations,
+                       params.get('wait_for_index', False))
 
         # Return created IDs.
         ids = [loc.id for loc in localizations]
         return {'message': f'Successfully created {len(ids)} localizations!', 'id': ids}
 
     def _delete(self, params):
-        qs = get_annotation_queryset(params['project'], params, 'localization')
-        count = qs.count()
-        if count > 0:
+        count = 0
+        for qs in get_annotation_querysets(params['project'], params, 'localization'):
+            count += qs.count()
+
             # Delete any state many to many relations to these localizations.
             state_qs = State.localizations.through.objects.filter(localization__in=qs)
             state_qs._raw_delete(state_qs.db)
 
             # Delete the localizations.
             qs._raw_delete(qs.db)
+        if count > 0:
             query = get_annotation_es_query(params['project'], params, 'localization')
             TatorSearch().delete(self.kwargs['project'], query)
         return {'message': f'Successfully deleted {count} localizations!'}
 
     def _patch(self, params):
-        qs = get_annotation_queryset(params['project'], params, 'localization')
-        count = qs.count()
-        if count > 0:
-            new_attrs = validate_attributes(params, qs[0])
+        count = 0
+        meta = None
+        task_id = None
+        for qs in get_annotation_querysets(params['project'], params, 'localization'):
+            chunk_count = qs.count()
+            if chunk_count == 0:
+                continue
+            if meta is None:
+                first = qs[0]
+                new_attrs = validate_attributes(params, first)
+                meta = first.meta
             bulk_patch_attributes(new_attrs, qs)
             qs.update(modified_by=self.request.user)
+            index_bulk_update(params['project'], 'localization', qs.values_list('id', flat=True))
+            count += chunk_count
+        if count > 0:
             query = get_annotation_es_query(params['project'], params, 'localization')
-            TatorSearch().update(self.kwargs['project'], qs[0].meta, query, new_attrs)
-        return {'message': f'Successfully updated {count} localizations!'}
+            task_id = TatorSearch().update(self.kwargs['project'], meta, query,
+                                           new_attrs, not params.get('async', False))
+        response = {'message': f'Successfully updated {count} localizations!'}
+        if task_id is not None:
+            response['task_id'] = task_id
+        return response
 
     def _put(self, params):
         """ Retrieve list of localizations by ID.
@@ -199,7 +246,7 @@ class LocalizationListAPI(BaseListView):
         response_data = []
         ids = params['body']
         if len(ids) > 0:
-            response_data = database_query_ids('main_localization', ids, 'id')
+            response_data = database_query_ids_json('main_localization', ids, 'id')
         return response_data
 
 class LocalizationDetailAPI(BaseDetailView):
@@ -215,11 +262,12 @@ class LocalizationDetailAPI(BaseDetailView):
     http_method_names = ['get', 'patch', 'delete']
 
     def _get(self, params):
-        return database_qs(Localization.objects.filter(pk=params['id']))[0]
+        return database_query_id_json('main_localization', params['id'])
 
     @transaction.atomic
     def _patch(self, params):
         obj = Localization.objects.get(pk=params['id'])
+        obj._wait_for_index = params.get('wait_for_index', False)
 
         # Patch common attributes.
         frame = params.get("frame", None)
@@ -17,6 +17,8 @@ from ..schema import LocalizationGraphicSchema
 from ..schema import parse
 from ._base_views import BaseDetailView
 from ._media_util import MediaUtil
+from ..render_cache import render_key
+from ..render_cache import get_render
 from ._permissions import ProjectViewOnlyPermission
 from .temporary_file import TemporaryFileDetailAPI
 
@@ -239,24 +241,31 @@ class LocalizationGraphicAPI(BaseDetailView):
                 media_width=media_util.getWidth(),
                 media_height=media_util.getHeight())
 
-            if media_util.isVideo():
-                # We will only pass a single frame and corresponding roi into this
-                # so the expected output is only one tile instead of many
-                image_path = media_util.get_tile_image(
-                    frames=[obj.frame],
-                    rois=[roi],
-                    tile_size=None,
-                    render_format=self.request.accepted_renderer.format,
-                    force_scale=force_image_size)
-
-                with open(image_path, 'rb') as data_file:
-                    response_data = data_file.read()
-
-            else:
-                # Grab the ROI from the image
-                response_data = media_util.get_cropped_image(
-                    roi=roi,
-                    render_format=self.request.accepted_renderer.format,
-                    force_scale=force_image_size)
+            render_format = self.request.accepted_renderer.format
+            key = render_key(obj.media, frames=[obj.frame], roi=roi,
+                             scale=force_image_size, format=render_format)
+
+            def _render():
+                if media_util.isVideo():
+                    # We will only pass a single frame and corresponding roi into this
+                    # so the expected output is only one tile instead of many
+                    image_path = media_util.get_tile_image(
+                        frames=[obj.frame],
+                        rois=[roi],
+                        tile_size=None,
+                        render_format=render_format,
+                        force_scale=force_image_size)
+
+                    with open(image_path, 'rb') as data_file:
+                        return data_file.read()
+
+                else:
+                    # Grab the ROI from the image
+                    return media_util.get_cropped_image(
+                        roi=roi,
+                        render_format=render_format,
+                        force_scale=force_image_size)
+
+            response_data = get_render(self.request, obj.media.pk, key, render_format, _render)
 
         return response_data
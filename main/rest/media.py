@@ -21,7 +21,12 @@ from ..models import Project
 from ..models import Resource
 from ..models import database_qs
 from ..models import database_query_ids
+from ..models import database_query_ids_json
+from ..models import database_query_id_json
+from ..models import index_bulk_update
 from ..search import TatorSearch
+from ..registry import get_project_types
+from ..renderers import CsvStream
 from ..schema import MediaListSchema
 from ..schema import MediaDetailSchema
 from ..schema import parse
@@ -32,9 +37,15 @@ from ..s3 import TatorS3
 
 from ._util import computeRequiredFields
 from ._util import check_required_fields
+from ._util import get_next_cursor
+from ._util import get_fields
+from ._util import select_fields
+from ._util import iter_values
 from ._base_views import BaseListView
 from ._base_views import BaseDetailView
-from ._media_query import get_media_queryset
+from ._base_views import STREAM_CHUNK_SIZE
+from ._media_query import get_media_querysets
+from ._media_query import get_media_read_model
 from ._media_query import get_media_es_query
 from ._attributes import bulk_patch_attributes
 from ._attributes import patch_attributes
@@ -62,6 +73,9 @@ def _presign(s3, expiration, media, fields=['archival', 'streaming', 'audio', 'i
                         else:
                             logger.warning(f"No segment file in media {media['id']} for file "
                                            f"{media_def['path']}!")
+                        if 'seek_index' in media_def:
+                            media_def['seek_index'] = s3.get_download_url(media_def['seek_index'],
+                                                                          expiration)
                     media['media_files'][field][idx] = media_def
     return media
 
@@ -126,14 +140,44 @@ class MediaListAPI(BaseListView):
             A media may be an image or a video. Media are a type of entity in Tator,
             meaning they can be described by user defined attributes.
         """
-        qs = get_media_queryset(self.kwargs['project'], params)
-        response_data = list(qs.values(*MEDIA_PROPERTIES))
+        if self.request.accepted_renderer.format == 'csv':
+            querysets = get_media_querysets(self.kwargs['project'], params)
+            fields = [field for field in MEDIA_PROPERTIES if field != 'attributes']
+            attribute_names = get_project_types(self.kwargs['project'])\
+                              .get_attribute_names('MediaType', params.get('type'))
+            return CsvStream(fields + attribute_names,
+                             self._stream(querysets, params, MEDIA_PROPERTIES), STREAM_CHUNK_SIZE)
+        # Name and ID are needed for the pagination cursor.
+        fields = get_fields(params, MEDIA_PROPERTIES, ['id', 'name'])
+        if self._streaming(params):
+            querysets = get_media_querysets(self.kwargs['project'], params)
+            return self._stream(querysets, params, fields)
+        response_data = get_media_read_model(self.kwargs['project'], params)
+        if response_data is None:
+            querysets = get_media_querysets(self.kwargs['project'], params)
+            response_data = list(iter_values(querysets, fields))
+        elif fields != MEDIA_PROPERTIES:
+            response_data = select_fields(response_data, fields)
+        cursor = get_next_cursor(params, response_data, ['name', 'id'])
+        if cursor is not None:
+            self.headers['X-Next-Cursor'] = cursor
         presigned = params.get('presigned')
-        if presigned is not None:
+        if (presigned is not None) and ('media_files' in fields):
             s3 = TatorS3()
             response_data = [_presign(s3, presigned, item) for item in response_data]
         return response_data
 
+    def _stream(self, querysets, params, fields):
+        presigned = params.get('presigned')
+        if 'media_files' not in fields:
+            presigned = None
+        if presigned is not None:
+            s3 = TatorS3()
+        for item in iter_values(querysets, fields):
+            if presigned is not None:
+                item = _presign(s3, presigned, item)
+            yield item
+
     def _post(self, params):
 
         # Get common parameters (between video/image).
@@ -330,9 +374,13 @@ class MediaListAPI(BaseListView):
             This method performs a bulk delete on all media matching a query. It is 
             recommended to use a GET request first to check what is being deleted.
         """
-        qs = get_media_queryset(params['project'], params)
-        count = qs.count()
-        if count > 0:
+        count = 0
+        for qs in get_media_querysets(params['project'], params):
+            chunk_count = qs.count()
+            if chunk_count == 0:
+                continue
+            count += chunk_count
+
             # Delete any state many-to-many relations to this media.
             state_media_qs = State.media.through.objects.filter(media__in=qs)
             state_media_qs._raw_delete(state_media_qs.db)
@@ -358,17 +406,19 @@ class MediaListAPI(BaseListView):
                       recycled_from=Project.objects.get(pk=params['project']),
                       modified_datetime=datetime.datetime.now(datetime.timezone.utc))
 
-            # Clear elasticsearch entries for both media and its children.
-            # Note that clearing children cannot be done using has_parent because it does
-            # not accept queries with size, and has_parent also does not accept ids queries.
-            query = get_media_es_query(self.kwargs['project'], params)
-            TatorSearch().delete(self.kwargs['project'], query)
+            # Clear elasticsearch entries for children of these media. Note that clearing
+            # children cannot be done using has_parent because it does not accept queries
+            # with size, and has_parent also does not accept ids queries.
             loc_ids = [f'box_{id_}' for id_ in loc_qs.iterator()] \
                     + [f'line_{id_}' for id_ in loc_qs.iterator()] \
                     + [f'dot_{id_}' for id_ in loc_qs.iterator()]
             TatorSearch().delete(self.kwargs['project'], {'query': {'ids': {'values': loc_ids}}})
             state_ids = [f'state_{_id}' for id_ in state_qs.iterator()]
             TatorSearch().delete(self.kwargs['project'], {'query': {'ids': {'values': state_ids}}})
+        if count > 0:
+            # Clear elasticsearch entries for the media.
+            query = get_media_es_query(self.kwargs['project'], params)
+            TatorSearch().delete(self.kwargs['project'], query)
         return {'message': f'Successfully deleted {count} medias!'}
 
     def _patch(self, params):
@@ -381,24 +431,39 @@ class MediaListAPI(BaseListView):
             recommended to use a GET request first to check what is being updated.
             Only attributes are eligible for bulk patch operations.
         """
-        qs = get_media_queryset(params['project'], params)
-        count = qs.count()
-        if count > 0:
-            new_attrs = validate_attributes(params, qs[0])
+        count = 0
+        meta = None
+        task_id = None
+        for qs in get_media_querysets(params['project'], params):
+            chunk_count = qs.count()
+            if chunk_count == 0:
+                continue
+            if meta is None:
+                first = qs[0]
+                new_attrs = validate_attributes(params, first)
+                meta = first.meta
             bulk_patch_attributes(new_attrs, qs)
+            index_bulk_update(params['project'], 'media', qs.values_list('id', flat=True))
+            count += chunk_count
+        if count > 0:
             query = get_media_es_query(params['project'], params)
-            TatorSearch().update(self.kwargs['project'], qs[0].meta, query, new_attrs)
-        return {'message': f'Successfully patched {count} medias!'}
+            task_id = TatorSearch().update(self.kwargs['project'], meta, query,
+                                           new_attrs, not params.get('async', False))
+        response = {'message': f'Successfully patched {count} medias!'}
+        if task_id is not None:
+            response['task_id'] = task_id
+        return response
 
     def _put(self, params):
         """ Retrieve list of media by ID.
         """
         response_data = []
         media_ids = params['body']
+        presigned = params.get('presigned')
         if len(media_ids) > 0:
+            if presigned is None:
+                return database_query_ids_json('main_media', media_ids, 'name')
             response_data = database_query_ids('main_media', media_ids, 'name')
-        presigned = params.get('presigned')
-        if presigned is not None:
             s3 = TatorS3()
             response_data = [_presign(s3, presigned, item) for item in response_data]
         return response_data
@@ -420,8 +485,10 @@ class MediaDetailAPI(BaseDetailView):
             A media may be an image or a video. Media are a type of entity in Tator,
             meaning they can be described by user defined attributes.
         """
-        response_data = database_qs(Media.objects.filter(pk=params['id']))[0]
         presigned = params.get('presigned')
+        if presigned is None:
+            return database_query_id_json('main_media', params['id'])
+        response_data = database_qs(Media.objects.filter(pk=params['id']))[0]
         if presigned is not None:
             s3 = TatorS3()
             response_data = _presign(s3, presigned, response_data)
@@ -435,6 +502,7 @@ class MediaDetailAPI(BaseDetailView):
             meaning they can be described by user defined attributes.
         """
         obj = Media.objects.select_for_update().get(pk=params['id'])
+        obj._wait_for_index = params.get('wait_for_index', False)
 
         if 'attributes' in params:
             new_attrs = validate_attributes(params, obj)
@@ -0,0 +1,35 @@
+import logging
+
+from django.http import Http404
+
+from ..search import TatorSearch
+from ..schema import SearchTaskDetailSchema
+from ..cache import TatorCache
+
+from ._base_views import BaseDetailView
+from ._permissions import ProjectViewOnlyPermission
+
+logger = logging.getLogger(__name__)
+
+class SearchTaskDetailAPI(BaseDetailView):
+    """ Retrieve progress of a background search index task.
+
+        Bulk operations that update many documents in the search index, such as
+        asynchronous attribute updates, run as elasticsearch tasks. The ID of the
+        task is returned by the endpoint that started it.
+    """
+    schema = SearchTaskDetailSchema()
+    permission_classes = [ProjectViewOnlyPermission]
+    http_method_names = ['get']
+
+    def _get(self, params):
+        task_id = params['task_id']
+        cache = TatorCache().get_search_task(task_id)
+        if cache is None:
+            raise Http404
+        return {
+            'id': task_id,
+            'project': cache['project'],
+            'description': cache['description'],
+            **TatorSearch().get_task(task_id),
+        }
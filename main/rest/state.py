@@ -13,8 +13,12 @@ from ..models import Localization
 from ..models import Project
 from ..models import Version
 from ..models import InterpolationMethods
-from ..models import database_qs
-from ..models import database_query_ids
+from ..models import database_query_ids_json
+from ..models import index_entities
+from ..models import index_bulk_update
+from ..models import database_query_id_json
+from ..registry import get_project_types
+from ..renderers import CsvStream
 from ..search import TatorSearch
 from ..schema import StateListSchema
 from ..schema import StateDetailSchema
@@ -24,13 +28,20 @@ from ..schema.components import state as state_schema
 
 from ._base_views import BaseListView
 from ._base_views import BaseDetailView
-from ._annotation_query import get_annotation_queryset
+from ._base_views import STREAM_CHUNK_SIZE
+from ._annotation_query import get_annotation_querysets
 from ._annotation_query import get_annotation_es_query
 from ._attributes import patch_attributes
 from ._attributes import bulk_patch_attributes
 from ._attributes import validate_attributes
 from ._util import computeRequiredFields
 from ._util import check_required_fields
+from ._util import get_next_cursor
+from ._util import get_fields
+from ._util import chunked
+from ._util import iter_values
+from ._columnar import get_columns
+from ._util import update_lookup
 from ._permissions import ProjectEditPermission
 
 logger = logging.getLogger(__name__)
@@ -38,26 +49,57 @@ logger = logging.getLogger(__name__)
 STATE_PROPERTIES = list(state_schema['properties'].keys())
 STATE_PROPERTIES.pop(STATE_PROPERTIES.index('media'))
 STATE_PROPERTIES.pop(STATE_PROPERTIES.index('localizations'))
+M2M_FIELDS = ['localizations', 'media']
+COLUMNAR_FIELDS = ['id', 'frame', 'meta', 'version', 'media', 'localizations']
 
-def _fill_m2m(response_data):
+def _fill_m2m(response_data, m2m_fields=M2M_FIELDS):
     # Get many to many fields.
     state_ids = [state['id'] for state in response_data]
-    localizations = {obj['state_id']:obj['localizations'] for obj in
-        State.localizations.through.objects\
-        .filter(state__in=state_ids)\
-        .values('state_id').order_by('state_id')\
-        .annotate(localizations=ArrayAgg('localization_id')).iterator()}
-    media = {obj['state_id']:obj['media'] for obj in
-        State.media.through.objects\
-        .filter(state__in=state_ids)\
-        .values('state_id').order_by('state_id')\
-        .annotate(media=ArrayAgg('media_id')).iterator()}
+    localizations = {}
+    media = {}
+    if 'localizations' in m2m_fields:
+        localizations = {obj['state_id']:obj['localizations'] for obj in
+            State.localizations.through.objects\
+            .filter(state__in=state_ids)\
+            .values('state_id').order_by('state_id')\
+            .annotate(localizations=ArrayAgg('localization_id')).iterator()}
+    if 'media' in m2m_fields:
+        media = {obj['state_id']:obj['media'] for obj in
+            State.media.through.objects\
+            .filter(state__in=state_ids)\
+            .values('state_id').order_by('state_id')\
+            .annotate(media=ArrayAgg('media_id')).iterator()}
     # Copy many to many fields into response data.
     for state in response_data:
-        state['localizations'] = localizations.get(state['id'], [])
-        state['media'] = media.get(state['id'], [])
+        if 'localizations' in m2m_fields:
+            state['localizations'] = localizations.get(state['id'], [])
+        if 'media' in m2m_fields:
+            state['media'] = media.get(state['id'], [])
     return response_data
 
+def _set_end_frame(state, end_frame, media):
+    media_obj = media.get(state['media'][0], {}) if state['media'] else {}
+    if end_frame is None:
+        end_frame = media_obj.get('num_frames') or 0
+    fps = media_obj.get('fps')
+    state['media'] = media_obj.get('name')
+    state['endFrame'] = end_frame
+    state['startSeconds'] = int(state['frame']) / fps if fps else None
+    state['endSeconds'] = int(end_frame) / fps if fps else None
+    return state
+
+def _m2m_columns():
+    """ SQL expressions selecting many to many fields of a state as arrays, for use with
+        `database_query_ids_json`.
+    """
+    localizations = State.localizations.through._meta.db_table
+    media = State.media.through._meta.db_table
+    return {
+        'localizations': f'ARRAY(SELECT "localization_id" FROM "{localizations}" '
+                         f'WHERE "state_id" = "main_state"."id")',
+        'media': f'ARRAY(SELECT "media_id" FROM "{media}" WHERE "state_id" = "main_state"."id")',
+    }
+
 class StateListAPI(BaseListView):
     """ Interact with list of states.
 
@@ -80,35 +122,76 @@ class StateListAPI(BaseListView):
     entity_type = StateType # Needed by attribute filter mixin
 
     def _get(self, params):
+        if self.request.accepted_renderer.format == 'csv':
+            return self._get_csv(params)
+        if self.request.accepted_renderer.format == 'columnar':
+            querysets = get_annotation_querysets(self.kwargs['project'], params, 'state')
+            attribute_names = get_project_types(self.kwargs['project'])\
+                              .get_attribute_names('StateType', params.get('type'))
+            # Media and localizations are lists, so they are never encoded as buffers.
+            buffer_fields = COLUMNAR_FIELDS[:4] if params.get('buffers', False) else None
+            return get_columns(self._stream(querysets), COLUMNAR_FIELDS, attribute_names, buffer_fields)
+        fields = get_fields(params, STATE_PROPERTIES + M2M_FIELDS)
+        m2m_fields = [field for field in M2M_FIELDS if field in fields]
+        fields = [field for field in fields if field not in M2M_FIELDS]
+        if self._streaming(params):
+            querysets = get_annotation_querysets(self.kwargs['project'], params, 'state')
+            return self._stream(querysets, fields, m2m_fields)
         t0 = datetime.datetime.now()
-        qs = get_annotation_queryset(self.kwargs['project'], params, 'state')
-        response_data = list(qs.values(*STATE_PROPERTIES))
+        querysets = get_annotation_querysets(self.kwargs['project'], params, 'state')
+        response_data = list(iter_values(querysets, fields))
+        cursor = get_next_cursor(params, response_data, ['id'])
+        if cursor is not None:
+            self.headers['X-Next-Cursor'] = cursor
 
         t1 = datetime.datetime.now()
-        response_data = _fill_m2m(response_data)
-        if (self.request.accepted_renderer.format == 'csv'
-            and 'type' in params):
-            type_object=StateType.objects.get(pk=params['type'])
-            if type_object.association == 'Frame' and type_object.interpolation == InterpolationMethods.LATEST:
-                for idx,el in enumerate(response_data):
-                    mediaEl=Media.objects.get(pk=el['media'])
-                    endFrame=0
-                    if idx + 1 < len(response_data):
-                        next_element=response_data[idx+1]
-                        endFrame=next_element['frame']
-                    else:
-                        endFrame=mediaEl.num_frames
-                    el['media']=mediaEl.name
-
-                    el['endFrame'] = endFrame
-                    el['startSeconds'] = int(el['frame']) * mediaEl.fps
-                    el['endSeconds'] = int(el['endFrame']) * mediaEl.fps
+        response_data = _fill_m2m(response_data, m2m_fields)
         t2 = datetime.datetime.now()
         logger.info(f"Number of states: {len(response_data)}")
         logger.info(f"Time to get states: {t1-t0}")
         logger.info(f"Time to get states many to many fields: {t2-t1}")
         return response_data
 
+    def _stream(self, querysets, fields=STATE_PROPERTIES, m2m_fields=M2M_FIELDS):
+        states = iter_values(querysets, fields)
+        for chunk in chunked(states, STREAM_CHUNK_SIZE):
+            yield from _fill_m2m(chunk, m2m_fields)
+
+    def _get_csv(self, params):
+        """ Streams states as CSV. Attribute columns are taken from the state type definitions.
+            States of a frame type with latest interpolation also get end frames and times.
+        """
+        project = self.kwargs['project']
+        querysets = get_annotation_querysets(project, params, 'state')
+        fields = [field for field in STATE_PROPERTIES if field != 'attributes']
+        fields += ['media', 'localizations']
+        rows = self._stream(querysets)
+        if 'type' in params:
+            type_object = StateType.objects.get(pk=params['type'])
+            if (type_object.association == 'Frame'
+                and type_object.interpolation == InterpolationMethods.LATEST):
+                fields += ['endFrame', 'startSeconds', 'endSeconds']
+                rows = self._add_end_frames(rows)
+        attribute_names = get_project_types(project).get_attribute_names('StateType',
+                                                                          params.get('type'))
+        return CsvStream(fields + attribute_names, rows, STREAM_CHUNK_SIZE)
+
+    def _add_end_frames(self, states):
+        """ Sets the end frame of each state to the frame of the next state, or to the number
+            of frames in its media for the last state. Media are looked up once per chunk.
+        """
+        media = {}
+        previous = None
+        for chunk in chunked(states, STREAM_CHUNK_SIZE):
+            update_lookup(media, Media, [state['media'][0] for state in chunk if state['media']],
+                          ['name', 'num_frames', 'fps'])
+            for state in chunk:
+                if previous is not None:
+                    yield _set_end_frame(previous, state['frame'], media)
+                previous = state
+        if previous is not None:
+            yield _set_end_frame(previous, None, media)
+
     def _post(self, params):
         # Check that we are getting a state list.
         if 'body' in params:
@@ -210,24 +293,18 @@ class StateListAPI(BaseListView):
                 state.segments = [[int(segment[0]), int(segment[-1])] for segment in segments]
         State.objects.bulk_update(states, ['segments'])
 
-        # Build ES documents.
-        ts = TatorSearch()
-        documents = []
-        for state in states:
-            documents += ts.build_document(state)
-            if len(documents) > 1000:
-                ts.bulk_add_documents(documents)
-                documents = []
-        ts.bulk_add_documents(documents)
+        # Index the states, or queue them for indexing.
+        index_entities(project.pk, 'state', states, params.get('wait_for_index', False))
 
         # Return created IDs.
         ids = [state.id for state in states]
         return {'message': f'Successfully created {len(ids)} states!', 'id': ids}
 
     def _delete(self, params):
-        qs = get_annotation_queryset(params['project'], params, 'state')
-        count = qs.count()
-        if count > 0:
+        count = 0
+        for qs in get_annotation_querysets(params['project'], params, 'state'):
+            count += qs.count()
+
             # Delete media many to many
             media_qs = State.media.through.objects.filter(state__in=qs)
             media_qs._raw_delete(media_qs.db)
@@ -238,20 +315,35 @@ class StateListAPI(BaseListView):
 
             # Delete states.
             qs._raw_delete(qs.db)
+        if count > 0:
             query = get_annotation_es_query(params['project'], params, 'state')
             TatorSearch().delete(self.kwargs['project'], query)
         return {'message': f'Successfully deleted {count} states!'}
 
     def _patch(self, params):
-        qs = get_annotation_queryset(params['project'], params, 'state')
-        count = qs.count()
-        if count > 0:
-            new_attrs = validate_attributes(params, qs[0])
+        count = 0
+        meta = None
+        task_id = None
+        for qs in get_annotation_querysets(params['project'], params, 'state'):
+            chunk_count = qs.count()
+            if chunk_count == 0:
+                continue
+            if meta is None:
+                first = qs[0]
+                new_attrs = validate_attributes(params, first)
+                meta = first.meta
             bulk_patch_attributes(new_attrs, qs)
             qs.update(modified_by=self.request.user)
+            index_bulk_update(params['project'], 'state', qs.values_list('id', flat=True))
+            count += chunk_count
+        if count > 0:
             query = get_annotation_es_query(params['project'], params, 'state')
-            TatorSearch().update(self.kwargs['project'], qs[0].meta, query, new_attrs)
-        return {'message': f'Successfully updated {count} states!'}
+            task_id = TatorSearch().update(self.kwargs['project'], meta, query,
+                                           new_attrs, not params.get('async', False))
+        response = {'message': f'Successfully updated {count} states!'}
+        if task_id is not None:
+            response['task_id'] = task_id
+        return response
 
     def _put(self, params):
         """ Retrieve list of states by ID.
@@ -259,8 +351,8 @@ class StateListAPI(BaseListView):
         response_data = []
         ids = params['body']
         if len(ids) > 0:
-            response_data = database_query_ids('main_state', ids, 'id')
-        response_data = _fill_m2m(response_data)
+            response_data = database_query_ids_json('main_state', ids, 'id',
+                                                    extra_columns=_m2m_columns())
         return response_data
 
 class StateDetailAPI(BaseDetailView):
@@ -277,21 +369,13 @@ class StateDetailAPI(BaseDetailView):
     http_method_names = ['get', 'patch', 'delete']
 
     def _get(self, params):
-        state = database_qs(State.objects.filter(pk=params['id']))[0]
-        # Get many to many fields.
-        state['localizations'] = list(State.localizations.through.objects\
-                                      .filter(state_id=state['id'])\
-                                      .aggregate(localizations=ArrayAgg('localization_id'))\
-                                      ['localizations'])
-        state['media'] = list(State.media.through.objects\
-                              .filter(state_id=state['id'])\
-                              .aggregate(media=ArrayAgg('media_id'))\
-                              ['media'])
-        return state
+        return database_query_id_json('main_state', params['id'],
+                                      extra_columns=_m2m_columns())
 
     @transaction.atomic
     def _patch(self, params):
         obj = State.objects.get(pk=params['id'])
+        obj._wait_for_index = params.get('wait_for_index', False)
 
         if 'frame' in params:
             obj.frame = params['frame']
@@ -15,6 +15,8 @@ from ..schema import StateGraphicSchema
 
 from ._base_views import BaseDetailView
 from ._media_util import MediaUtil
+from ..render_cache import render_key
+from ..render_cache import get_render
 from ._permissions import ProjectViewOnlyPermission
 
 logger = logging.getLogger(__name__)
@@ -66,46 +68,53 @@ class StateGraphicAPI(BaseDetailView):
         localizations = state.localizations.order_by('frame')[offset:offset+length]
         frames = [l.frame for l in localizations]
         roi = [(l.width, l.height, l.x, l.y) for l in localizations]
-        with tempfile.TemporaryDirectory() as temp_dir:
-            media_util = MediaUtil(video, temp_dir)
-            if mode == "animate":
-                if any(x is self.request.accepted_renderer.format for x in ['mp4','gif']):
-                    pass
-                else:
-                    self.request.accepted_renderer = GifRenderer()
-                gif_fp = media_util.get_animation(frames, roi, fps,
-                                                  self.request.accepted_renderer.format,
-                                                  force_scale=force_scale)
-                with open(gif_fp, 'rb') as data_file:
-                    self.request.accepted_renderer = GifRenderer()
-                    response_data = data_file.read()
+        if mode == "animate":
+            if any(x is self.request.accepted_renderer.format for x in ['mp4','gif']):
+                pass
             else:
-                max_w = 0
-                max_h = 0
-                for el in roi:
-                    if el[0] > max_w:
-                        max_w = el[0]
-                    if el[1] > max_h:
-                        max_h = el[1]
+                self.request.accepted_renderer = GifRenderer()
+        else:
+            max_w = 0
+            max_h = 0
+            for el in roi:
+                if el[0] > max_w:
+                    max_w = el[0]
+                if el[1] > max_h:
+                    max_h = el[1]
 
-                print(f"{max_w} {max_h}")
-                # rois have to be the same size box for tile to work
-                if force_scale is None:
-                    new_rois = [(max_w,max_h, r[2]+((r[0]-max_w)/2), r[3]+((r[1]-max_h)/2)) for r in roi]
-                    for idx,r in enumerate(roi):
-                        print(f"{r} corrected to {new_rois[idx]}")
-                else:
-                    new_rois = roi
-                    print(f"Using a forced scale")
+            logger.debug(f"{max_w} {max_h}")
+            # rois have to be the same size box for tile to work
+            if force_scale is None:
+                new_rois = [(max_w,max_h, r[2]+((r[0]-max_w)/2), r[3]+((r[1]-max_h)/2)) for r in roi]
+                for idx,r in enumerate(roi):
+                    logger.debug(f"{r} corrected to {new_rois[idx]}")
+            else:
+                new_rois = roi
+                logger.debug("Using a forced scale")
+        render_format = self.request.accepted_renderer.format
+        key = render_key(video, frames=frames, roi=roi, mode=mode, fps=fps,
+                         scale=force_scale, format=render_format)
+        if mode == "animate":
+            self.request.accepted_renderer = GifRenderer()
 
+        def _render():
+            with tempfile.TemporaryDirectory() as temp_dir:
+                media_util = MediaUtil(video, temp_dir)
+                if mode == "animate":
+                    gif_fp = media_util.get_animation(frames, roi, fps,
+                                                      render_format,
+                                                      force_scale=force_scale)
+                    with open(gif_fp, 'rb') as data_file:
+                        return data_file.read()
+                else:
+                    # Get a tiled fp as a film strip
+                    tile_size=f"{len(frames)}x1"
+                    tiled_fp = media_util.get_tile_image(frames,
+                                                         new_rois,
+                                                         tile_size,
+                                                         render_format=render_format,
+                                                         force_scale=force_scale)
+                    with open(tiled_fp, 'rb') as data_file:
+                        return data_file.read()
 
-                # Get a tiled fp as a film strip
-                tile_size=f"{len(frames)}x1"
-                tiled_fp = media_util.get_tile_image(frames,
-                                                     new_rois,
-                                                     tile_size,
-                                                     render_format=self.request.accepted_renderer.format,
-                                                     force_scale=force_scale)
-                with open(tiled_fp, 'rb') as data_file:
-                    response_data = data_file.read()
-        return response_data
+        return get_render(self.request, video.pk, key, render_format, _render)
@@ -47,6 +47,8 @@ class VideoFileListAPI(BaseListView):
         Resource.add_resource(body['path'], media)
         if role == 'streaming':
             Resource.add_resource(body['segment_info'], media)
+            if 'seek_index' in body:
+                Resource.add_resource(body['seek_index'], media)
         return {'message': f"Media file in media object {media.id} created!"}
 
     def get_queryset(self):
@@ -93,6 +95,8 @@ class VideoFileDetailAPI(BaseDetailView):
         if role == 'streaming':
             old_segments = media.media_files[role][index]['segment_info']
             new_segments = body['segment_info']
+            old_seek = media.media_files[role][index].get('seek_index')
+            new_seek = body.get('seek_index')
         media.media_files[role][index] = body
         media.save()
         if old_path != new_path:
@@ -104,6 +108,12 @@ class VideoFileDetailAPI(BaseDetailView):
                 drop_media_from_resource(old_segments, media)
                 safe_delete(old_segments)
                 Resource.add_resource(new_segments, media)
+            if old_seek != new_seek:
+                if old_seek:
+                    drop_media_from_resource(old_seek, media)
+                    safe_delete(old_seek)
+                if new_seek:
+                    Resource.add_resource(new_seek, media)
         return {'message': f"Media file in media object {media.id} successfully updated!"}
 
     @transaction.atomic
@@ -125,6 +135,9 @@ class VideoFileDetailAPI(BaseDetailView):
         if role == 'streaming':
             drop_media_from_resource(deleted['segment_info'], media)
             safe_delete(deleted['segment_info'])
+            if 'seek_index' in deleted:
+                drop_media_from_resource(deleted['seek_index'], media)
+                safe_delete(deleted['seek_index'])
         return {'message': f'Media file in media object {params["id"]} successfully deleted!'}
 
     def get_queryset(self):
@@ -20,6 +20,8 @@ from .get_frame import GetFrameSchema
 from .get_clip import GetClipSchema
 from .image_file import ImageFileListSchema
 from .image_file import ImageFileDetailSchema
+from .ingest import LocalizationIngestSchema
+from .ingest import StateIngestSchema
 from .job import JobListSchema
 from .job import JobDetailSchema
 from .jwt import JwtGatewaySchema
@@ -53,6 +55,7 @@ from .project import ProjectDetailSchema
 from .section import SectionListSchema
 from .section import SectionDetailSchema
 from .section_analysis import SectionAnalysisSchema
+from .search_task import SearchTaskDetailSchema
 from .state import StateListSchema
 from .state import StateDetailSchema
 from .state import StateGraphicSchema
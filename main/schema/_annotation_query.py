@@ -45,4 +45,13 @@ annotation_filter_parameter_schema = [
                        'parameters are relative to this modified range.',
         'schema': {'type': 'integer'},
     },
+    {
+        'name': 'cursor',
+        'in': 'query',
+        'required': False,
+        'description': 'Opaque cursor returned in the `X-Next-Cursor` header of a '
+                       'previous page limited by `stop`. If given, results start '
+                       'after the last annotation of that page and `after` is ignored.',
+        'schema': {'type': 'string'},
+    },
 ]
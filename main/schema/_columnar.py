@@ -0,0 +1,14 @@
+columnar_parameter_schema = [
+    {
+        'name': 'buffers',
+        'in': 'query',
+        'required': False,
+        'description': 'Only used with `format=columnar`, which returns the list as an object '
+                       'containing `count`, `columns` (one array per field) and `attributes` '
+                       '(one array per attribute defined by the type). If true, numeric '
+                       'columns are returned as base64 encoded little endian typed buffers, '
+                       'with their dtypes given in `dtypes`. Missing values are encoded as '
+                       '-1 in integer buffers and NaN in float buffers.',
+        'schema': {'type': 'boolean', 'default': False},
+    },
+]
@@ -0,0 +1,20 @@
+def fields_parameter_schema(component):
+    """ Returns a parameter selecting which properties of a component are returned for
+        each object in a list.
+    """
+    return [
+        {
+            'name': 'fields',
+            'in': 'query',
+            'required': False,
+            'description': 'Comma-separated list of fields to return for each object. Fields '
+                           'that are not requested are not read from the database. The `id` '
+                           'field is always returned. Applies to JSON responses; defaults to '
+                           'all fields.',
+            'explode': False,
+            'schema': {
+                'type': 'array',
+                'items': {'type': 'string', 'enum': list(component['properties'].keys())},
+            },
+        },
+    ]
@@ -102,6 +102,7 @@ class CustomGenerator(SchemaGenerator):
                 'SectionUpdate': section_update,
                 'Section': section,
                 'SectionAnalysis': section_analysis,
+                'SearchTask': search_task,
                 'StateSpec': state_spec,
                 'StateUpdate': state_update,
                 'State': state,
@@ -135,6 +136,8 @@ class CustomGenerator(SchemaGenerator):
                 'CreateResponse': create_response,
                 'CreateListResponse': create_list_response,
                 'MessageResponse': message_response,
+                'MessageWithTaskResponse': message_with_task_response,
+                'MessageWithTaskListResponse': message_with_task_list_response,
                 'NotFoundResponse': not_found_response,
                 'BadRequestResponse': bad_request_response,
                 'Credentials': credentials,
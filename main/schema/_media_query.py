@@ -71,4 +71,13 @@ media_filter_parameter_schema = [
                        'parameters are relative to this modified range.',
         'schema': {'type': 'string'},
     },
+    {
+        'name': 'cursor',
+        'in': 'query',
+        'required': False,
+        'description': 'Opaque cursor returned in the `X-Next-Cursor` header of a '
+                       'previous page limited by `stop`. If given, results start '
+                       'after the last media of that page and `after` is ignored.',
+        'schema': {'type': 'string'},
+    },
 ]
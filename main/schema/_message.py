@@ -6,6 +6,22 @@ def message_schema(action, name):
         }}},
     }
 
+def message_with_task_schema(action, name):
+    return {
+        'description': f'Successful {action} of {name}.',
+        'content': {'application/json': {'schema': {
+            '$ref': '#/components/schemas/MessageWithTaskResponse',
+        }}},
+    }
+
+def message_with_task_list_schema(action, name):
+    return {
+        'description': f'Successful {action} of {name}.',
+        'content': {'application/json': {'schema': {
+            '$ref': '#/components/schemas/MessageWithTaskListResponse',
+        }}},
+    }
+
 def message_with_id_schema(name):
     return {
         'description': f'Successful creation of {name}.',
@@ -0,0 +1,13 @@
+stream_parameter_schema = [
+    {
+        'name': 'stream',
+        'in': 'query',
+        'required': False,
+        'description': 'If true, the list is streamed as a chunked JSON array using a '
+                       'server side cursor, so memory use does not grow with the size of '
+                       'the result. Lists requested as `application/x-ndjson` (or with '
+                       '`format=ndjson`) are always streamed. Streamed responses do not '
+                       'include the `X-Next-Cursor` header.',
+        'schema': {'type': 'boolean', 'default': False},
+    },
+]
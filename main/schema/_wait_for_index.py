@@ -0,0 +1,11 @@
+wait_for_index_parameter_schema = [
+    {
+        'name': 'wait_for_index',
+        'in': 'query',
+        'required': False,
+        'description': 'If true, the request returns once the written entities are visible to '
+                       'searches. By default entities may be indexed asynchronously, so '
+                       'searches issued right after the request may not include them.',
+        'schema': {'type': 'boolean', 'default': False},
+    },
+]
@@ -5,6 +5,7 @@ from rest_framework.schemas.openapi import AutoSchema
 
 from ._errors import error_responses
 from ._message import message_schema
+from ._message import message_with_task_list_schema
 from ._attribute_type import attribute_type_example
 from ._entity_type_mixins import entity_type_filter_parameters_schema
 
@@ -98,9 +99,9 @@ class AttributeTypeListSchema(AutoSchema):
     def _get_responses(self, path, method):
         responses = error_responses()
         if method == "PATCH":
-            responses["200"] = message_schema("update", "attribute")
+            responses["200"] = message_with_task_list_schema("update", "attribute")
         elif method == "POST":
             responses["201"] = message_schema("creation", "attribute")
         elif method == "DELETE":
-            responses["200"] = message_schema("deletion", "attribute")
+            responses["200"] = message_with_task_list_schema("deletion", "attribute")
         return responses
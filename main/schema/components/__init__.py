@@ -66,6 +66,7 @@ from .section import section_spec
 from .section import section_update
 from .section import section
 from .section_analysis import section_analysis
+from .search_task import search_task
 from .state import state_spec
 from .state import state_update
 from .state import state
@@ -108,6 +109,8 @@ from ._color import fill
 from ._common import create_response
 from ._common import create_list_response
 from ._common import message_response
+from ._common import message_with_task_response
+from ._common import message_with_task_list_response
 from ._common import attribute_bulk_update
 from ._errors import not_found_response
 from ._errors import bad_request_response
@@ -37,6 +37,37 @@ message_response = {
     },
 }
 
+message_with_task_response = {
+    'type': 'object',
+    'properties': {
+        'message': {
+            'type': 'string',
+            'description': 'Message explaining response.',
+        },
+        'task_id': {
+            'type': 'string',
+            'description': 'ID of the search index task, if the operation was asynchronous. '
+                           'Progress can be retrieved with the SearchTask endpoint.',
+        },
+    },
+}
+
+message_with_task_list_response = {
+    'type': 'object',
+    'properties': {
+        'message': {
+            'type': 'string',
+            'description': 'Message explaining response.',
+        },
+        'task_ids': {
+            'type': 'array',
+            'description': 'IDs of the search index tasks, if the operation was asynchronous. '
+                           'Progress can be retrieved with the SearchTask endpoint.',
+            'items': {'type': 'string'},
+        },
+    },
+}
+
 attribute_bulk_update = {
     'type': 'object',
     'required': ['attributes'],
@@ -46,6 +77,12 @@ attribute_bulk_update = {
             'type': 'object',
             'additionalProperties': {'$ref': '#/components/schemas/AttributeValue'},
         },
+        'async': {
+            'description': 'If true, the search index is updated in the background and '
+                           'the ID of the update task is returned.',
+            'type': 'boolean',
+            'default': False,
+        },
     },
 }
 
@@ -76,6 +76,12 @@ video_definition = {
                            '`streaming`.',
             'type': 'string',
         },
+        'seek_index': {
+            'description': 'Path to numpy file containing a seek index with one row per '
+                           'fragment. Optional for media role `streaming`; derived from '
+                           'segment info if not given.',
+            'type': 'string',
+        },
         'host': {
             'description': 'If supplied will use this instead of currently connected '
                            'host, e.g. https://example.com',
@@ -111,6 +111,12 @@ attribute_type_update = {
             "description": "The attribute to rename.",
         },
         "new_attribute_type": {'$ref': '#/components/schemas/AttributeType'},
+        "async": {
+            "type": "boolean",
+            "description": "If true, existing values in the search index are converted in the "
+                           "background and the IDs of the search tasks are returned.",
+            "default": False,
+        },
     },
 }
 
@@ -126,5 +132,11 @@ attribute_type_delete = {
             "type": "string",
             "description": "The attribute to delete.",
         },
+        "async": {
+            "type": "boolean",
+            "description": "If true, existing values in the search index are removed in the "
+                           "background and the IDs of the search tasks are returned.",
+            "default": False,
+        },
     },
 }
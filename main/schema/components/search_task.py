@@ -0,0 +1,51 @@
+search_task = {
+    'type': 'object',
+    'description': 'Progress of a background search index task.',
+    'properties': {
+        'id': {
+            'description': 'Unique identifier of the task.',
+            'type': 'string',
+        },
+        'project': {
+            'description': 'Unique integer identifying the project of the task.',
+            'type': 'integer',
+        },
+        'description': {
+            'description': 'Description of the operation performed by the task.',
+            'type': 'string',
+        },
+        'completed': {
+            'description': 'Whether the task has finished.',
+            'type': 'boolean',
+        },
+        'total': {
+            'description': 'Total number of documents the task will process.',
+            'type': 'integer',
+        },
+        'created': {
+            'description': 'Number of documents created so far.',
+            'type': 'integer',
+        },
+        'updated': {
+            'description': 'Number of documents updated so far.',
+            'type': 'integer',
+        },
+        'deleted': {
+            'description': 'Number of documents deleted so far.',
+            'type': 'integer',
+        },
+        'version_conflicts': {
+            'description': 'Number of documents skipped due to version conflicts.',
+            'type': 'integer',
+        },
+        'failures': {
+            'description': 'Number of documents that failed to process.',
+            'type': 'integer',
+        },
+        'error': {
+            'description': 'Reason the task failed, if it failed.',
+            'type': 'string',
+            'nullable': True,
+        },
+    },
+}
@@ -0,0 +1,70 @@
+from textwrap import dedent
+
+from rest_framework.schemas.openapi import AutoSchema
+
+from ._errors import error_responses
+from ._message import message_with_id_list_schema
+
+boilerplate = dedent("""\
+The request body is either newline delimited JSON (the default) or CSV with a header row
+(content type `text/csv`). It is copied into the database with `COPY`, then checked and
+inserted with set based queries, so this endpoint is intended for ingest of very large
+numbers of annotations. Rows have the same fields as in a create request; in CSV, lists
+and geoposition values are written as JSON arrays. All rows are created in a single
+transaction, and if any row fails a check nothing is created. Search indexing happens
+in the background if asynchronous indexing is enabled.
+""")
+
+class _IngestSchema(AutoSchema):
+    entity_name = None
+    operation_id = None
+
+    def get_operation(self, path, method):
+        operation = super().get_operation(path, method)
+        if method == 'POST':
+            operation['operationId'] = self.operation_id
+        operation['tags'] = ['Tator']
+        return operation
+
+    def get_description(self, path, method):
+        return dedent(f"""\
+        Bulk create {self.entity_name}s of one type.
+
+        """) + boilerplate
+
+    def _get_path_parameters(self, path, method):
+        return [{
+            'name': 'project',
+            'in': 'path',
+            'required': True,
+            'description': 'A unique integer identifying a project.',
+            'schema': {'type': 'integer'},
+        }]
+
+    def _get_filter_parameters(self, path, method):
+        return [{
+            'name': 'type',
+            'in': 'query',
+            'required': True,
+            'description': f'Unique integer identifying the {self.entity_name} type of all '
+                           f'{self.entity_name}s in the request.',
+            'schema': {'type': 'integer'},
+        }]
+
+    def _get_request_body(self, path, method):
+        # The body is streamed into the database, so it is not part of the validated spec.
+        return {}
+
+    def _get_responses(self, path, method):
+        responses = error_responses()
+        if method == 'POST':
+            responses['201'] = message_with_id_list_schema(f'{self.entity_name}(s)')
+        return responses
+
+class LocalizationIngestSchema(_IngestSchema):
+    entity_name = 'localization'
+    operation_id = 'IngestLocalizations'
+
+class StateIngestSchema(_IngestSchema):
+    entity_name = 'state'
+    operation_id = 'IngestStates'
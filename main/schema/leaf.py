@@ -4,9 +4,13 @@ from rest_framework.schemas.openapi import AutoSchema
 
 from ._errors import error_responses
 from ._message import message_schema
+from ._message import message_with_task_schema
 from ._message import message_with_id_list_schema
 from ._leaf_query import leaf_filter_parameter_schema
 from ._attributes import attribute_filter_parameter_schema
+from ._fields import fields_parameter_schema
+from ._wait_for_index import wait_for_index_parameter_schema
+from .components.leaf import leaf
 
 boilerplate = dedent("""\
 Leaves are used to define label hierarchies that can be used for autocompletion
@@ -144,6 +148,10 @@ class LeafListSchema(AutoSchema):
             params = leaf_filter_parameter_schema + attribute_filter_parameter_schema
             # Remove search as it is not yet supported.
             params = [p for p in params if p['name'] != 'search']
+        if method == 'GET':
+            params = params + fields_parameter_schema(leaf)
+        if method == 'POST':
+            params = wait_for_index_parameter_schema
         return params
 
     def _get_request_body(self, path, method):
@@ -194,7 +202,7 @@ class LeafListSchema(AutoSchema):
         elif method == 'POST':
             responses['201'] = message_with_id_list_schema('leaf')
         elif method == 'PATCH':
-            responses['200'] = message_schema('update', 'leaf list')
+            responses['200'] = message_with_task_schema('update', 'leaf list')
         elif method == 'DELETE':
             responses['200'] = message_schema('deletion', 'leaf list')
         return responses
@@ -230,7 +238,10 @@ class LeafDetailSchema(AutoSchema):
         }]
 
     def _get_filter_parameters(self, path, method):
-        return []
+        params = []
+        if method == 'PATCH':
+            params = wait_for_index_parameter_schema
+        return params
 
     def _get_request_body(self, path, method):
         body = {}
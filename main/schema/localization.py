@@ -3,10 +3,16 @@ from textwrap import dedent
 from rest_framework.schemas.openapi import AutoSchema
 
 from ._message import message_schema
+from ._message import message_with_task_schema
 from ._message import message_with_id_list_schema
 from ._errors import error_responses
 from ._attributes import attribute_filter_parameter_schema
 from ._annotation_query import annotation_filter_parameter_schema
+from ._stream import stream_parameter_schema
+from ._columnar import columnar_parameter_schema
+from ._fields import fields_parameter_schema
+from ._wait_for_index import wait_for_index_parameter_schema
+from .components.localization import localization
 
 localization_filter_schema = [
     {
@@ -99,6 +105,11 @@ class LocalizationListSchema(AutoSchema):
         params = []
         if method in ['GET', 'PATCH', 'DELETE']:
             params = annotation_filter_parameter_schema + attribute_filter_parameter_schema + localization_filter_schema
+        if method == 'GET':
+            params = params + stream_parameter_schema + columnar_parameter_schema \
+                     + fields_parameter_schema(localization)
+        if method == 'POST':
+            params = wait_for_index_parameter_schema
         return params
 
     def _get_request_body(self, path, method):
@@ -274,7 +285,7 @@ class LocalizationListSchema(AutoSchema):
         elif method == 'POST':
             responses['201'] = message_with_id_list_schema('localization(s)')
         elif method == 'PATCH':
-            responses['200'] = message_schema('update', 'localization list')
+            responses['200'] = message_with_task_schema('update', 'localization list')
         elif method == 'DELETE':
             responses['200'] = message_schema('deletion', 'localization list')
         return responses
@@ -310,7 +321,10 @@ class LocalizationDetailSchema(AutoSchema):
         }]
 
     def _get_filter_parameters(self, path, method):
-        return []
+        params = []
+        if method == 'PATCH':
+            params = wait_for_index_parameter_schema
+        return params
 
     def _get_request_body(self, path, method):
         body = {}
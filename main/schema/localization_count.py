@@ -5,6 +5,7 @@ from rest_framework.schemas.openapi import AutoSchema
 from ._errors import error_responses
 from ._annotation_query import annotation_filter_parameter_schema
 from ._attributes import attribute_filter_parameter_schema
+from .localization import localization_filter_schema
 
 class LocalizationCountSchema(AutoSchema):
     def get_operation(self, path, method):
@@ -34,7 +35,8 @@ class LocalizationCountSchema(AutoSchema):
     def _get_filter_parameters(self, path, method):
         params = []
         if method  == 'GET':
-            params = annotation_filter_parameter_schema + attribute_filter_parameter_schema
+            params = annotation_filter_parameter_schema + attribute_filter_parameter_schema \
+                     + localization_filter_schema
         return params
 
     def _get_request_body(self, path, method):
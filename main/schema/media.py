@@ -3,10 +3,15 @@ from textwrap import dedent
 from rest_framework.schemas.openapi import AutoSchema
 
 from ._message import message_schema
+from ._message import message_with_task_schema
 from ._message import message_with_id_schema
 from ._errors import error_responses
 from ._media_query import media_filter_parameter_schema
+from ._stream import stream_parameter_schema
 from ._attributes import attribute_filter_parameter_schema
+from ._fields import fields_parameter_schema
+from ._wait_for_index import wait_for_index_parameter_schema
+from .components.media import media
 
 boilerplate = dedent("""\
 A media may be an image or a video. Media are a type of entity in Tator,
@@ -88,6 +93,8 @@ class MediaListSchema(AutoSchema):
                            'minimum': 1,
                            'maximum': 86400},
             }]
+        if method == 'GET':
+            params = params + stream_parameter_schema + fields_parameter_schema(media)
         return params
 
     def _get_request_body(self, path, method):
@@ -144,7 +151,7 @@ class MediaListSchema(AutoSchema):
                 }}},
             }
         elif method == 'PATCH':
-            responses['200'] = message_schema('update', 'media list')
+            responses['200'] = message_with_task_schema('update', 'media list')
         elif method == 'DELETE':
             responses['200'] = message_schema('deletion', 'media list')
         return responses
@@ -196,6 +203,8 @@ class MediaDetailSchema(AutoSchema):
                            'minimum': 1,
                            'maximum': 86400},
             }]
+        elif method == 'PATCH':
+            params = wait_for_index_parameter_schema
         return params
 
     def _get_request_body(self, path, method):
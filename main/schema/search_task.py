@@ -0,0 +1,47 @@
+from textwrap import dedent
+
+from rest_framework.schemas.openapi import AutoSchema
+
+from ._errors import error_responses
+
+class SearchTaskDetailSchema(AutoSchema):
+    def get_operation(self, path, method):
+        operation = super().get_operation(path, method)
+        if method == 'GET':
+            operation['operationId'] = 'GetSearchTask'
+        operation['tags'] = ['Tator']
+        return operation
+
+    def get_description(self, path, method):
+        return dedent("""\
+        Get background search index task.
+
+        This method allows the user to get the progress of a search index task using
+        the `task_id` returned by an asynchronous bulk update.
+        """)
+
+    def _get_path_parameters(self, path, method):
+        return [{
+            'name': 'task_id',
+            'in': 'path',
+            'required': True,
+            'description': 'A string identifying a single search index task.',
+            'schema': {'type': 'string'},
+        }]
+
+    def _get_filter_parameters(self, path, method):
+        return []
+
+    def _get_request_body(self, path, method):
+        return {}
+
+    def _get_responses(self, path, method):
+        responses = error_responses()
+        if method == 'GET':
+            responses['200'] = {
+                'description': 'Successful retrieval of search task.',
+                'content': {'application/json': {'schema': {
+                    '$ref': '#/components/schemas/SearchTask',
+                }}},
+            }
+        return responses
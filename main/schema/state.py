@@ -5,8 +5,14 @@ from rest_framework.schemas.openapi import AutoSchema
 from ._errors import error_responses
 from ._message import message_with_id_list_schema
 from ._message import message_schema
+from ._message import message_with_task_schema
 from ._attributes import attribute_filter_parameter_schema
 from ._annotation_query import annotation_filter_parameter_schema
+from ._stream import stream_parameter_schema
+from ._columnar import columnar_parameter_schema
+from ._fields import fields_parameter_schema
+from ._wait_for_index import wait_for_index_parameter_schema
+from .components.state import state
 
 boilerplate = dedent("""\
 A state is a description of a collection of other objects. The objects a state describes
@@ -70,6 +76,11 @@ class StateListSchema(AutoSchema):
         params = []
         if method in ['GET', 'PATCH', 'DELETE']:
             params = annotation_filter_parameter_schema + attribute_filter_parameter_schema
+        if method == 'GET':
+            params = params + stream_parameter_schema + columnar_parameter_schema \
+                     + fields_parameter_schema(state)
+        if method == 'POST':
+            params = wait_for_index_parameter_schema
         return params
 
     def _get_request_body(self, path, method):
@@ -159,7 +170,7 @@ class StateListSchema(AutoSchema):
         elif method == 'POST':
             responses['201'] = message_with_id_list_schema('state(s)')
         elif method == 'PATCH':
-            responses['200'] = message_schema('update', 'state list')
+            responses['200'] = message_with_task_schema('update', 'state list')
         elif method == 'DELETE':
             responses['200'] = message_schema('deletion', 'state list')
         return responses
@@ -195,7 +206,10 @@ class StateDetailSchema(AutoSchema):
         }]
 
     def _get_filter_parameters(self, path, method):
-        return []
+        params = []
+        if method == 'PATCH':
+            params = wait_for_index_parameter_schema
+        return params
 
     def _get_request_body(self, path, method):
         body = {}
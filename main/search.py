@@ -1,13 +1,22 @@
 import logging
 import os
 import datetime
+import time
+import itertools
+from collections import defaultdict
 from copy import deepcopy
 from uuid import uuid1
 
+from django.apps import apps
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 
 from .s3 import TatorS3
+from .cache import TatorCache
+from .registry import get_project_types
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +35,34 @@ ALLOWED_MUTATIONS = {
 id_bits=448
 id_mask=(1 << id_bits) - 1
 
+# Seconds for which the list of indices receiving writes for a project is cached.
+WRITE_INDEX_TTL = 5
+
+# Maps project alias to expiration time and list of indices receiving writes.
+_write_indices = {}
+
+# Maps project alias to cached mapping version and mapping properties.
+_mapping_cache = {}
+
+# Stored script used for bulk attribute updates. Values are passed as parameters so the
+# script is only compiled once.
+UPDATE_SCRIPT_ID = 'tator_update_attributes'
+UPDATE_SCRIPT = """
+for (entry in params.attrs.entrySet()) {
+    ctx._source[entry.getKey()] = entry.getValue();
+}
+"""
+
+# Stored script used to move values of an attribute to a new mapping when its dtype is
+# mutated, or to remove them when the attribute is deleted (new_field is null).
+MOVE_SCRIPT_ID = 'tator_move_attribute'
+MOVE_SCRIPT = """
+def value = ctx._source.remove(params.old_field);
+if (params.new_field != null) {
+    ctx._source[params.new_field] = value;
+}
+"""
+
 def _path_size(path, s3, bucket_name):
     """ Returns the file size of a path.
     """
@@ -93,6 +130,74 @@ def drop_dupes(ids):
     seen_add = seen.add
     return [x for x in ids if not (x in seen or seen_add(x))]
 
+# Maps document dtype to the name of its entity type model.
+TYPE_MODEL_NAMES = {
+    'image': 'MediaType',
+    'video': 'MediaType',
+    'multi': 'MediaType',
+    'box': 'LocalizationType',
+    'line': 'LocalizationType',
+    'dot': 'LocalizationType',
+    'state': 'StateType',
+    'leaf': 'LeafType',
+}
+
+def _deleted_query(dtype, ids):
+    """ Returns a query matching all documents, including duplicates, of deleted entities.
+    """
+    return {'bool': {'filter': [
+        {'term': {'_dtype': dtype}},
+        {'terms': {'_postgres_id': ids}},
+    ]}}
+
+def _read_model_fields(dtype):
+    """ Returns the response fields stored in documents of the read model, or None if
+        documents of this dtype are not served from the read model. Attributes are not
+        stored, they are rebuilt from the attribute mappings.
+    """
+    # Imported here because the schema package depends on django rest framework.
+    from .schema.components import media as media_schema
+    from .schema.components import localization as localization_schema
+    if dtype in ['image', 'video', 'multi']:
+        fields = media_schema['properties'].keys()
+    elif dtype in ['box', 'line', 'dot']:
+        fields = localization_schema['properties'].keys()
+    else:
+        return None
+    return [field for field in fields if field != 'attributes']
+
+def _get_response_values(entity, fields):
+    """ Returns values of model fields as they are returned by the REST API.
+    """
+    values = {}
+    for name in fields:
+        value = entity._meta.get_field(name).value_from_object(entity)
+        if isinstance(value, FieldFile):
+            value = value.name
+        elif isinstance(value, datetime.datetime):
+            value = value.isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+        values[name] = value
+    return values
+
+def _get_attribute_value(attribute_type, value):
+    """ Converts a value stored in an attribute mapping back to its attribute value.
+    """
+    dtype = attribute_type['dtype']
+    if dtype == 'int':
+        value = int(value)
+    elif dtype == 'float':
+        value = float(value)
+    elif dtype in ['enum', 'string']:
+        value = str(value)
+    elif dtype == 'geopos':
+        if isinstance(value, str):
+            # Strings are lat/lon, attribute values are lon/lat.
+            lat, lon = value.split(',')
+            value = [float(lon), float(lat)]
+    return value
+
 def _get_alias_type(attribute_type):
     """
     Maps `dtype` to ES alias type.
@@ -122,12 +227,13 @@ def _get_mapping_values(entity_type, attributes):
     if entity_type.attribute_types is None:
         return mapping_values
 
-    for attribute_type in entity_type.attribute_types:
-        name = attribute_type['name']
+    project_types = get_project_types(entity_type.project_id)
+    attribute_type_uuids = project_types.attribute_type_uuids
+    for name, attribute_type in project_types.get_attribute_types(entity_type).items():
         value = attributes.get(name)
         if value is not None:
             dtype = attribute_type['dtype']
-            uuid = entity_type.project.attribute_type_uuids[name]
+            uuid = attribute_type_uuids[name]
             mapping_type = _get_alias_type(attribute_type)
             mapping_name = f'{uuid}_{mapping_type}'
             if mapping_type == 'boolean':
@@ -170,45 +276,130 @@ class TatorSearch:
             retry_on_timeout=True,
         )
 
+    def put_scripts(self):
+        """ Stores scripts used by bulk operations. Scripts are stored once per process.
+        """
+        if not getattr(TatorSearch, 'scripts_stored', False):
+            self.es.put_script(id=UPDATE_SCRIPT_ID, body={'script': {
+                'lang': 'painless',
+                'source': UPDATE_SCRIPT,
+            }})
+            self.es.put_script(id=MOVE_SCRIPT_ID, body={'script': {
+                'lang': 'painless',
+                'source': MOVE_SCRIPT,
+            }})
+            TatorSearch.scripts_stored = True
+
     def index_name(self, project):
+        """ Returns the alias used to read and write documents for a project. The alias
+            points to a versioned index named `{alias}_v{version}`.
+        """
         return f'{self.prefix}project_{project}'
 
-    def create_index(self, project):
+    def reindex_name(self, project):
+        """ Returns the alias pointing to the index version being built by a reindex.
+        """
+        return f'{self.index_name(project)}_reindex'
+
+    def _write_indices(self, index):
+        """ Returns names of indices that should receive writes sent to the given project
+            alias. While a reindex is in progress this includes the reindex alias.
+        """
+        now = time.time()
+        cached = _write_indices.get(index)
+        if (cached is None) or (cached[0] < now):
+            names = [index]
+            if self.es.indices.exists_alias(name=f'{index}_reindex'):
+                names.append(f'{index}_reindex')
+            cached = (now + WRITE_INDEX_TTL, names)
+            _write_indices[index] = cached
+        return cached[1]
+
+    def _reindexing(self, project):
+        """ Returns true if a reindex of a project is in progress.
+        """
+        return len(self._write_indices(self.index_name(project))) > 1
+
+    def write_index_names(self, project):
+        """ Returns comma separated names of indices that should receive writes for a
+            project, suitable for use with multi-index APIs.
+        """
+        return ','.join(self._write_indices(self.index_name(project)))
+
+    def dual_write(self, docs):
+        """ Generator yielding bulk documents for every index receiving writes.
+        """
+        for doc in docs:
+            for index in self._write_indices(doc['_index']):
+                yield {**doc, '_index': index}
+
+    def get_mapping_properties(self, project):
+        """ Returns mapping properties of a project index. Mappings are cached in process
+            and shared across workers through redis. Each lookup only retrieves the cache
+            version from redis unless the mapping has been invalidated.
+        """
+        index = self.index_name(project)
+        cache = TatorCache()
+        version = cache.get_mapping_version(index)
+        cached = _mapping_cache.get(index)
+        if (cached is not None) and (cached[0] == version):
+            return cached[1]
+        properties = cache.get_mapping_cache(index, version)
+        if properties is None:
+            mapping = self.es.indices.get_mapping(index=index)
+            properties = next(iter(mapping.values()))['mappings'].get('properties', {})
+            cache.set_mapping_cache(index, version, properties)
+        _mapping_cache[index] = (version, properties)
+        return properties
+
+    def invalidate_mapping(self, project):
+        """ Invalidates cached mapping properties of a project index. Must be called after
+            any change to the mapping.
+        """
         index = self.index_name(project)
-        if not self.es.indices.exists(index):
-            self.es.indices.create(
-                index,
-                body={
-                    'settings': {
-                        'number_of_shards': 1,
-                        'number_of_replicas': 1,
-                        'analysis': {
-                            'normalizer': {
-                                'lower_normalizer': {
-                                    'type': 'custom',
-                                    'char_filter': [],
-                                    'filter': ['lowercase', 'asciifolding'],
-                                },
+        TatorCache().invalidate_mapping_cache(index)
+        _mapping_cache.pop(index, None)
+
+    def _create_index_version(self, index, alias, num_shards=1):
+        """ Creates a versioned index with the given alias.
+        """
+        self.es.indices.create(
+            index,
+            body={
+                'settings': {
+                    'number_of_shards': num_shards,
+                    'number_of_replicas': 1,
+                    'analysis': {
+                        'normalizer': {
+                            'lower_normalizer': {
+                                'type': 'custom',
+                                'char_filter': [],
+                                'filter': ['lowercase', 'asciifolding'],
                             },
                         },
                     },
-                    'mappings': {
-                        'properties': {
-                            '_media_relation': {
-                                'type': 'join',
-                                'relations': {
-                                    'media': 'annotation',
-                                }
-                            },
-                            '_exact_name': {'type': 'keyword', 'normalizer': 'lower_normalizer'},
-                            '_md5': {'type': 'keyword'},
-                            '_meta': {'type': 'integer'},
-                            '_dtype': {'type': 'keyword'},
-                            'tator_user_sections': {'type': 'keyword'},
-                        }
-                    },
                 },
-            )
+                'mappings': {
+                    'properties': {
+                        '_media_relation': {
+                            'type': 'join',
+                            'relations': {
+                                'media': 'annotation',
+                            }
+                        },
+                        '_exact_name': {'type': 'keyword', 'normalizer': 'lower_normalizer'},
+                        '_md5': {'type': 'keyword'},
+                        '_meta': {'type': 'integer'},
+                        '_dtype': {'type': 'keyword'},
+                        'tator_user_sections': {'type': 'keyword'},
+                    }
+                },
+                'aliases': {alias: {}},
+            },
+        )
+        self._put_base_mappings(index)
+
+    def _put_base_mappings(self, index):
         # Mappings that were added later
         self.es.indices.put_mapping(
             index=index,
@@ -231,13 +422,115 @@ class TatorSearch:
                 '_gid': {'type': 'keyword'},
                 '_uid': {'type': 'keyword'},
                 'filename': {'type': 'keyword', 'normalizer': 'lower_normalizer'},
+                '_response': {'type': 'object', 'enabled': False},
             }},
         )
 
+    def create_index(self, project, num_shards=1):
+        """ Creates the index for a project if it does not exist. Documents are routed by
+            media ID, so annotations are stored on the same shard as their media.
+        """
+        alias = self.index_name(project)
+        if not self.es.indices.exists(alias):
+            self._create_index_version(f'{alias}_v1', alias, num_shards)
+        self._put_base_mappings(alias)
+        self.invalidate_mapping(project)
+
     def delete_index(self, project):
-        index = self.index_name(project)
-        if self.es.indices.exists(index):
+        alias = self.index_name(project)
+        indices = self.es.indices.get(index=f'{alias},{alias}_v*', ignore_unavailable=True)
+        for index in indices:
             self.es.indices.delete(index)
+        _write_indices.pop(alias, None)
+        self.invalidate_mapping(project)
+
+    def begin_reindex(self, project, num_shards=1):
+        """ Creates a new index version for a project and points the reindex alias at it,
+            so that subsequent writes go to both the live index and the new version. If a
+            reindex is already in progress its index is reused. Returns the name of the
+            new index.
+        """
+        alias = self.index_name(project)
+        reindex = self.reindex_name(project)
+        if self.es.indices.exists_alias(name=reindex):
+            index = next(iter(self.es.indices.get_alias(name=reindex)))
+        else:
+            versions = [int(name.rsplit('_v', 1)[1])
+                        for name in self.es.indices.get(index=f'{alias}_v*')]
+            index = f'{alias}_v{max(versions, default=0) + 1}'
+            self._create_index_version(index, reindex, num_shards)
+            TatorCache().clear_reindex_deletes(project)
+        _write_indices.pop(alias, None)
+        return index
+
+    def replay_reindex_deletes(self, project, index):
+        """ Deletes documents from the index version built by a reindex that were deleted
+            while it was built. Deletes are sent to both index versions during a reindex,
+            but a document read from the database before the delete could still be
+            written to the new version afterwards. Must be called once all documents have
+            been written to the new version and before `finish_reindex`.
+        """
+        for query in TatorCache().get_reindex_deletes(project):
+            self.es.delete_by_query(index=index, body={'query': query}, conflicts='proceed')
+
+    def finish_reindex(self, project):
+        """ Atomically points the project alias at the index version built by a reindex
+            and removes the previous version. The reindex alias is kept until cached write
+            index lists have expired, so no process writes to a removed alias.
+        """
+        alias = self.index_name(project)
+        reindex = self.reindex_name(project)
+        index = next(iter(self.es.indices.get_alias(name=reindex)))
+        old_indices = list(self.es.indices.get(index=alias))
+        if self.es.indices.exists_alias(name=alias):
+            actions = [{'remove': {'index': old, 'alias': alias}} for old in old_indices]
+        else:
+            # Index was created before versioning, replace it with the alias.
+            actions = [{'remove_index': {'index': old}} for old in old_indices]
+            old_indices = []
+        actions.append({'add': {'index': index, 'alias': alias}})
+        self.es.indices.update_aliases(body={'actions': actions})
+        self.invalidate_mapping(project)
+        time.sleep(2 * WRITE_INDEX_TTL)
+        self.es.indices.delete_alias(index=index, name=reindex)
+        _write_indices.pop(alias, None)
+        TatorCache().clear_reindex_deletes(project)
+        for old in old_indices:
+            self.es.indices.delete(old)
+
+    def begin_bulk_load(self, project, index=None):
+        """ Disables refresh and replicas on a project index ahead of a bulk load. The
+            original settings are saved in the index mapping metadata so that the load can
+            be finished by a different process. Calling this while a load is already in
+            progress leaves the saved settings intact. Index defaults to the project alias.
+        """
+        if index is None:
+            index = self.index_name(project)
+        mapping = next(iter(self.es.indices.get_mapping(index=index).values()))['mappings']
+        if 'bulk_load' not in mapping.get('_meta', {}):
+            settings = next(iter(self.es.indices.get_settings(index=index).values()))
+            settings = settings['settings']['index']
+            self.es.indices.put_mapping(index=index, body={'_meta': {'bulk_load': {
+                'refresh_interval': settings.get('refresh_interval'),
+                'number_of_replicas': settings.get('number_of_replicas'),
+            }}})
+        self.es.indices.put_settings(index=index, body={'index': {
+            'refresh_interval': '-1',
+            'number_of_replicas': 0,
+        }})
+
+    def end_bulk_load(self, project, index=None):
+        """ Restores settings saved by begin_bulk_load and refreshes the index.
+        """
+        if index is None:
+            index = self.index_name(project)
+        mapping = next(iter(self.es.indices.get_mapping(index=index).values()))['mappings']
+        saved = mapping.get('_meta', {}).get('bulk_load')
+        if saved is not None:
+            # A setting of None resets it to the cluster default.
+            self.es.indices.put_settings(index=index, body={'index': saved})
+            self.es.indices.put_mapping(index=index, body={'_meta': {}})
+        self.es.indices.refresh(index=index)
 
     def check_addition(self, entity_type, new_attribute_type):
         """
@@ -260,10 +553,7 @@ class TatorSearch:
             return
 
         # Fetch existing mappings
-        index_name = self.index_name(entity_type.project.pk)
-        existing_mappings = self.es.indices.get_mapping(index=index_name)
-        mappings = existing_mappings[index_name].get("mappings",{})
-        properties = mappings.get("properties",{})
+        properties = self.get_mapping_properties(entity_type.project.pk)
 
         # This should not happen if the uuid exists, but if it does, then no mapping exists and it
         # is valid to create one
@@ -284,12 +574,18 @@ class TatorSearch:
         if not entity_type.attribute_types:
             return
 
-        # Fetch existing mappings
-        index_name = self.index_name(entity_type.project.pk)
-        existing_mappings = self.es.indices.get_mapping(index=index_name)
-        mappings = existing_mappings[index_name].get("mappings",{})
-        properties = mappings.get("properties",{})
-        existing_prop_names = properties.keys()
+        # Fetch existing mappings. During a reindex a mapping is only skipped if every
+        # index receiving writes has it.
+        index_name = self.write_index_names(entity_type.project.pk)
+        if index_name == self.index_name(entity_type.project.pk):
+            existing_prop_names = self.get_mapping_properties(entity_type.project.pk).keys()
+        else:
+            existing_mappings = self.es.indices.get_mapping(index=index_name)
+            existing_prop_names = set.intersection(*[
+                set(mappings.get("mappings",{}).get("properties",{}).keys())
+                for mappings in existing_mappings.values()
+            ])
+        created = False
         for attribute_type in entity_type.attribute_types:
             # Skip over existing mappings
             if attribute_type["name"] in existing_prop_names:
@@ -316,9 +612,12 @@ class TatorSearch:
 
             # Create mappings.
             self.es.indices.put_mapping(
-                index=self.index_name(entity_type.project.pk),
+                index=index_name,
                 body={"properties": {**mapping, **alias}},
             )
+            created = True
+        if created:
+            self.invalidate_mapping(entity_type.project.pk)
 
     def check_rename(self, entity_type, old_name, new_name):
         """
@@ -385,9 +684,10 @@ class TatorSearch:
         alias_type = _get_alias_type(new_attribute_type)
         alias = {new_name: {"type": "alias", "path": f"{uuid}_{alias_type}"}}
         self.es.indices.put_mapping(
-            index=self.index_name(entity_type.project.pk),
+            index=self.write_index_names(entity_type.project.pk),
             body={"properties": alias},
         )
+        self.invalidate_mapping(entity_type.project.pk)
 
         # Update entity type object with new values.
         entity_type.project.attribute_type_uuids[
@@ -433,7 +733,40 @@ class TatorSearch:
 
         return uuid, replace_idx, old_mapping_name
 
-    def mutate_alias(self, entity_type, name, new_attribute_type, new_style=None):
+    def _move_attribute(self, entity_type, old_mapping_name, new_mapping_name, task_ids,
+                        description):
+        """
+        Moves values of an attribute mapping to a new mapping, or removes them if the new
+        mapping name is None. Only documents of the given entity type that have a value in
+        the old mapping are updated. If task_ids is a list, the update runs in the background
+        and its task ID is appended to the list.
+        """
+        self.put_scripts()
+        body = {
+            'query': {'bool': {'filter': [
+                {'exists': {'field': old_mapping_name}},
+                {'term': {'_meta': entity_type.pk}},
+                {'term': {'_dtype': entity_type.dtype}},
+            ]}},
+            'script': {
+                'id': MOVE_SCRIPT_ID,
+                'params': {'old_field': old_mapping_name, 'new_field': new_mapping_name},
+            },
+        }
+        wait = task_ids is None
+        response = self.es.update_by_query(
+            index=self.write_index_names(entity_type.project.pk),
+            body=body,
+            conflicts='proceed',
+            slices='auto',
+            wait_for_completion=wait,
+        )
+        if not wait:
+            TatorCache().set_search_task(response['task'], entity_type.project.pk, description)
+            task_ids.append(response['task'])
+
+    def mutate_alias(self, entity_type, name, new_attribute_type, new_style=None,
+                     task_ids=None):
         """
         Sets alias to new mapping type.
 
@@ -444,6 +777,8 @@ class TatorSearch:
         :param new_attribute_type: New attribute type for the attribute being mutated.
         :param new_style: [Optional] New display style of attribute type. Used to determine if
                           string attributes should be indexed as keyword or text.
+        :param task_ids: [Optional] If given, existing values are converted in the background
+                         and the ID of the search task is appended to this list.
         :returns: Entity type with updated attribute_types.
         """
         # Check mutation before applying atomically
@@ -461,25 +796,15 @@ class TatorSearch:
         mapping = {mapping_name: {'type': mapping_type}}
         # Create new mapping.
         self.es.indices.put_mapping(
-            index=self.index_name(entity_type.project.pk),
+            index=self.write_index_names(entity_type.project.pk),
             body={'properties': {**mapping, **alias}},
         )
+        self.invalidate_mapping(entity_type.project.pk)
 
-        # Copy values from old mapping to new mapping.
-        body = {'script': f"ctx._source['{mapping_name}']=ctx._source['{old_mapping_name}'];"}
-        self.es.update_by_query(
-            index=self.index_name(entity_type.project.pk),
-            body=body,
-            conflicts='proceed',
-        )
-
-        # Replace values in old mapping with null.
-        body = {'script': f"ctx._source['{old_mapping_name}']=null;"}
-        self.es.update_by_query(
-            index=self.index_name(entity_type.project.pk),
-            body=body,
-            conflicts='proceed',
-        )
+        # Move values from old mapping to new mapping.
+        if mapping_name != old_mapping_name:
+            self._move_attribute(entity_type, old_mapping_name, mapping_name, task_ids,
+                                 f"Mutate attribute {name} of {entity_type.name}")
 
         # Update entity type object with new values.
         entity_type.attribute_types[replace_idx] = new_attribute_type
@@ -510,42 +835,50 @@ class TatorSearch:
 
         return uuid, delete_idx, mapping_name
 
-    def delete_alias(self, entity_type, name):
+    def delete_alias(self, entity_type, name, task_ids=None):
         """
         Deletes existing alias.
 
         :param entity_type: *Type object.
         :param name: Name of attribute type being deleted.
+        :param task_ids: [Optional] If given, existing values are removed in the background
+                         and the ID of the search task is appended to this list.
         :returns: Entity type with updated attribute_types.
         """
         # Check deletion before performing atomically
         uuid, delete_idx, mapping_name = self.check_deletion(entity_type, name)
 
-        # Replace values in mapping with null.
-        body = {'script': f"ctx._source['{mapping_name}']=null;"}
-        self.es.update_by_query(
-            index=self.index_name(entity_type.project.pk),
-            body=body,
-            conflicts='proceed',
-        )
+        # Remove values in mapping.
+        self._move_attribute(entity_type, mapping_name, None, task_ids,
+                             f"Delete attribute {name} of {entity_type.name}")
+        self.invalidate_mapping(entity_type.project.pk)
 
         # Remove attribute from entity type object.
         del entity_type.attribute_types[delete_idx]
         return entity_type
 
-    def bulk_add_documents(self, listOfDocs):
-        bulk(self.es, listOfDocs, raise_on_error=False)
+    def bulk_add_documents(self, listOfDocs, wait=False):
+        """ Writes documents in bulk. If wait is true, returns once the documents are
+            visible to searches. Returns the per-document errors reported by elasticsearch.
+        """
+        refresh = 'wait_for' if wait else False
+        _, errors = bulk(self.es, self.dual_write(listOfDocs), raise_on_error=False,
+                         refresh=refresh)
+        return errors
 
     def create_document(self, entity, wait=False):
-        """ Indicies an element into ES """
+        """ Indicies an element into ES. If wait is true, returns once the document is
+            visible to searches.
+        """
         docs = self.build_document(entity, 'single')
         for doc in docs:
-            logger.info(f"Making Doc={doc}")
-            res = self.es.index(index=self.index_name(entity.project.pk),
-                                id=doc['_id'],
-                                refresh=wait,
-                                routing=1,
-                                body={**doc['_source']})
+            logger.debug(f"Making Doc={doc}")
+            for index in self._write_indices(doc['_index']):
+                res = self.es.index(index=index,
+                                    id=doc['_id'],
+                                    refresh='wait_for' if wait else 'false',
+                                    routing=doc['_routing'],
+                                    body={**doc['_source']})
 
     def build_document(self, entity, mode='index'):
         """ Returns a list of documents representing the entity to be
@@ -565,6 +898,10 @@ class TatorSearch:
         tzinfo = entity.created_datetime.tzinfo
         aux['_indexed_datetime'] = datetime.datetime.now(tzinfo).isoformat()
         duplicates = []
+        # Documents are routed by media ID so that annotations are on the same shard as
+        # their parent media, as required by the join field.
+        routing = entity.pk
+        duplicate_routing = []
         if entity.meta.dtype in ['image', 'video', 'multi']:
             aux['_media_relation'] = 'media'
             aux['filename'] = entity.name
@@ -593,6 +930,7 @@ class TatorSearch:
                 'name': 'annotation',
                 'parent': f"{entity.media.meta.dtype}_{entity.media.pk}",
             }
+            routing = entity.media.pk
             if entity.version:
                 aux['_annotation_version'] = entity.version.pk
             aux['_modified'] = entity.modified
@@ -615,19 +953,21 @@ class TatorSearch:
             elif entity.meta.dtype == 'dot':
                 pass
         elif entity.meta.dtype in ['state']:
-            media = entity.media.all()
-            if media.exists():
+            media = list(entity.media.order_by('id').select_related('meta'))
+            if media:
                 aux['_media_relation'] = {
                     'name': 'annotation',
                     'parent': f"{media[0].meta.dtype}_{media[0].pk}",
                 }
-                for media_idx in range(1, media.count()):
+                routing = media[0].pk
+                for media_idx in range(1, len(media)):
                     duplicate = deepcopy(aux)
                     duplicate['_media_relation'] = {
                         'name': 'annotation',
                         'parent': f"{media[media_idx].meta.dtype}_{media[media_idx].pk}",
                     }
                     duplicates.append(duplicate)
+                    duplicate_routing.append(media[media_idx].pk)
             try:
                 # If the state has an extracted image, its a
                 # duplicated entry in ES.
@@ -639,6 +979,7 @@ class TatorSearch:
                         'parent': f"{extracted_image.meta.dtype}_{extracted_image.pk}",
                     }
                     duplicates.append(duplicate)
+                    duplicate_routing.append(extracted_image.pk)
             except:
                 pass
             if entity.version:
@@ -649,6 +990,10 @@ class TatorSearch:
             aux['tator_treeleaf_name'] = entity.name
             aux['_treeleaf_depth'] = entity.depth()
             aux['_treeleaf_path'] = entity.computePath()
+        if settings.READ_MODEL:
+            fields = _read_model_fields(entity.meta.dtype)
+            if fields is not None:
+                aux['_response'] = _get_response_values(entity, fields)
         if entity.attributes is None:
             entity.attributes = {}
             entity.save()
@@ -665,7 +1010,7 @@ class TatorSearch:
                 **aux,
             },
             '_id': f"{aux['_dtype']}_{entity.pk}",
-            '_routing': 1,
+            '_routing': routing,
         })
 
         # Load in duplicates, if any
@@ -684,7 +1029,7 @@ class TatorSearch:
                 **duplicate,
             },
             '_id': f"{aux['_dtype']}_{duplicate_id}",
-            '_routing': 1,
+            '_routing': duplicate_routing[idx],
             })
         return results
 
@@ -692,9 +1037,31 @@ class TatorSearch:
     def delete_document(self, entity):
         # If project is null, the entire index should have been deleted.
         if not entity.project is None:
-            index = self.index_name(entity.project.pk)
-            if self.es.exists(index=index, id=f'{entity.meta.dtype}_{entity.pk}'):
-                self.es.delete(index=index, id=f'{entity.meta.dtype}_{entity.pk}')
+            if self._reindexing(entity.project.pk):
+                TatorCache().add_reindex_deletes(entity.project.pk,
+                                                 [_deleted_query(entity.meta.dtype,
+                                                                 [entity.pk])])
+            index = self.write_index_names(entity.project.pk)
+            if entity.meta.dtype == 'state':
+                # States may have duplicates routed to the shards of several media, and the
+                # media of a state may have changed since it was indexed.
+                self.es.delete_by_query(
+                    index=index,
+                    body={'query': {'bool': {'filter': [
+                        {'term': {'_postgres_id': entity.pk}},
+                        {'term': {'_dtype': 'state'}},
+                    ]}}},
+                    conflicts='proceed',
+                )
+            else:
+                if entity.meta.dtype in ['box', 'line', 'dot']:
+                    routing = entity.media_id
+                else:
+                    routing = entity.pk
+                for index in self._write_indices(self.index_name(entity.project.pk)):
+                    doc_id = f'{entity.meta.dtype}_{entity.pk}'
+                    if self.es.exists(index=index, id=doc_id, routing=routing):
+                        self.es.delete(index=index, id=doc_id, routing=routing)
 
     def search_raw(self, project, query):
         return self.es.search(
@@ -704,34 +1071,17 @@ class TatorSearch:
         )
 
     def search(self, project, query):
-        if 'sort' not in query:
-            query['sort'] = {'_doc': 'asc'}
+        """ Returns a list of unique IDs matching a query and a count. Meant for small,
+            bounded queries; the results of an unbounded query are held in memory at once,
+            so such results should be consumed one page at a time with `iter_ids`.
+        """
         size = query.get('size', None)
         if (size is None) or (size >= 10000):
-            query['size'] = 10000
-            result = self.es.search(
-                index=self.index_name(project),
-                body=query,
-                scroll='1m',
-                stored_fields=[],
-            )
-            scroll_id = result['_scroll_id']
-            result = result['hits']
-            data = result['hits']
-            count = result['total']['value']
-
-            if size:
-                count = size
-            ids = drop_dupes([int(obj['_id'].split('_')[1]) & id_mask for obj in data])
-            while len(ids) < count:
-                result = self.es.scroll(
-                    scroll_id=scroll_id,
-                    scroll='1m',
-                )
-                ids += drop_dupes([int(obj['_id'].split('_')[1]) & id_mask for obj in result['hits']['hits']])
-            ids = ids[:count]
-            self.es.clear_scroll(scroll_id)
+            ids = list(itertools.chain.from_iterable(self.iter_ids(project, query)))
+            count = len(ids)
         else:
+            if 'sort' not in query:
+                query['sort'] = {'_doc': 'asc'}
             # TODO: This will NOT return the requested number of results if there are
             # duplicates in the dataset.
             result = self.search_raw(project, query)
@@ -741,13 +1091,159 @@ class TatorSearch:
             ids = drop_dupes([int(obj['_id'].split('_')[1]) & id_mask for obj in data])
         return ids, count
 
-    def count(self, project, query):
+    def iter_ids(self, project, query, chunk_size=10000):
+        """ Generator yielding lists of unique IDs matching a query, in sort order. See
+            `iter_hits`.
+        """
+        for hits in self.iter_hits(project, query, chunk_size):
+            yield [int(hit['_id'].split('_')[1]) & id_mask for hit in hits]
+
+    def iter_hits(self, project, query, chunk_size=10000, source=False):
+        """ Generator yielding lists of hits with unique IDs matching a query, in sort order.
+
+            Results are paged with `search_after`, so no scroll context is held open and only
+            one page of hits is in memory at a time. `_postgres_id` is appended to the sort as
+            a tie breaker; duplicate documents of a state share this value and are therefore
+            returned once. The `from` and `size` fields of the query are applied to the
+            stream of unique hits. Document sources are only retrieved if source is true.
+        """
+        body = {key: value for key, value in query.items()
+                if key not in ['from', 'size', 'sort', 'search_after']}
+        sort = query.get('sort', [])
+        if isinstance(sort, dict):
+            sort = [{key: value} for key, value in sort.items()]
+        sort = [field for field in sort if '_doc' not in field]
+        if not any('_postgres_id' in field for field in sort):
+            sort.append({'_postgres_id': 'asc'})
+        body['sort'] = sort
+        body['size'] = chunk_size
+        body['track_total_hits'] = False
+
+        # Route every page to the same shard copies so the sort order is consistent.
+        preference = str(uuid1())
+        skip = query.get('from', 0)
+        remaining = query.get('size', None)
+        while (remaining is None) or (remaining > 0):
+            if source:
+                result = self.es.search(
+                    index=self.index_name(project),
+                    body=body,
+                    preference=preference,
+                )
+            else:
+                result = self.es.search(
+                    index=self.index_name(project),
+                    body=body,
+                    stored_fields=[],
+                    preference=preference,
+                )
+            hits = result['hits']['hits']
+            if len(hits) == 0:
+                break
+            seen = set()
+            unique = []
+            for hit in hits:
+                id_ = int(hit['_id'].split('_')[1]) & id_mask
+                if id_ not in seen:
+                    seen.add(id_)
+                    unique.append(hit)
+            num_skipped = min(skip, len(unique))
+            unique = unique[num_skipped:]
+            skip -= num_skipped
+            if remaining is not None:
+                unique = unique[:remaining]
+                remaining -= len(unique)
+            if len(unique) > 0:
+                yield unique
+            if len(hits) < chunk_size:
+                break
+            body['search_after'] = hits[-1]['sort']
+
+    def is_read_model_fresh(self, project):
+        """ Returns true if list requests for a project may be served from the read model.
+            This is the case if the read model is enabled and no queued index write of the
+            project is older than READ_MODEL_MAX_LAG seconds.
+        """
+        if not settings.READ_MODEL:
+            return False
+        IndexQueue = apps.get_model('main', 'IndexQueue')
+        oldest = IndexQueue.objects.filter(project=project)\
+                                   .order_by('created_datetime')\
+                                   .values_list('created_datetime', flat=True)\
+                                   .first()
+        if oldest is None:
+            return True
+        return (timezone.now() - oldest).total_seconds() <= settings.READ_MODEL_MAX_LAG
+
+    def search_read_model(self, project, query):
+        """ Returns REST API representations of the entities matching a query, read from
+            the sources of their documents. Returns None if any matching document was
+            indexed without the read model, in which case the request should be served from
+            postgres.
+        """
+        project_types = get_project_types(project)
+        uuids = project_types.attribute_type_uuids
+        response_data = []
+        for hits in self.iter_hits(project, query, source=True):
+            for hit in hits:
+                source = hit['_source']
+                if '_response' not in source:
+                    return None
+                key = (TYPE_MODEL_NAMES[source['_dtype']], source['_meta'])
+                attribute_types = project_types.attribute_types.get(key)
+                if attribute_types is None:
+                    return None
+                attributes = {}
+                if 'tator_user_sections' in source:
+                    attributes['tator_user_sections'] = source['tator_user_sections']
+                for name, attribute_type in attribute_types.items():
+                    mapping_name = f'{uuids.get(name)}_{_get_alias_type(attribute_type)}'
+                    value = source.get(mapping_name)
+                    if value is not None:
+                        attributes[name] = _get_attribute_value(attribute_type, value)
+                response_data.append({**source['_response'], 'attributes': attributes})
+        return response_data
+
+    def count(self, project, query, unique=False):
+        """ Returns the number of documents matching a query without retrieving hits.
+            Pagination parameters (`from`, `size`) and aggregations in the query are ignored.
+
+        :param unique: If true, documents that share a `_postgres_id` (duplicates created for
+                       states associated with multiple media) are only counted once.
+        """
         index = self.index_name(project)
-        count_query = dict(query)
-        count_query.pop('sort', None)
-        count_query.pop('aggs', None)
-        count_query.pop('size', None)
-        return self.es.count(index=index, body=count_query)['count']
+        count_query = {}
+        if 'query' in query:
+            count_query['query'] = query['query']
+        count = self.es.count(index=index, body=count_query)['count']
+        if unique and count > 1:
+            count = sum(len(ids) for ids in self.unique_id_pages(project, query))
+        return count
+
+    def unique_id_pages(self, project, query, page_size=10000):
+        """ Generator yielding pages of unique postgres IDs matching a query, in ascending
+            order. Uses a composite aggregation, so no hits or scroll contexts are retrieved
+            and duplicate documents are collapsed by elasticsearch.
+        """
+        body = {
+            'size': 0,
+            'aggs': {'ids': {'composite': {
+                'size': page_size,
+                'sources': [{'id': {'terms': {'field': '_postgres_id'}}}],
+            }}},
+        }
+        if 'query' in query:
+            body['query'] = query['query']
+        while True:
+            result = self.es.search(index=self.index_name(project), body=body)
+            agg = result['aggregations']['ids']
+            ids = [bucket['key']['id'] for bucket in agg['buckets']]
+            if len(ids) == 0:
+                break
+            yield ids
+            if 'after_key' not in agg:
+                break
+            body['aggs']['ids']['composite']['after'] = agg['after_key']
 
     def refresh(self, project):
         """Force refresh on an index.
@@ -757,32 +1253,70 @@ class TatorSearch:
     def delete(self, project, query):
         """Bulk delete on search results.
         """
+        if self._reindexing(project):
+            # Record the deleted entities for replay on the index version being built.
+            ids_by_dtype = defaultdict(list)
+            for hits in self.iter_hits(project, query):
+                for hit in hits:
+                    dtype, id_ = hit['_id'].split('_')
+                    ids_by_dtype[dtype].append(int(id_) & id_mask)
+            TatorCache().add_reindex_deletes(project, [
+                _deleted_query(dtype, ids[idx:idx+10000])
+                for dtype, ids in ids_by_dtype.items()
+                for idx in range(0, len(ids), 10000)
+            ])
         self.es.delete_by_query(
-            index=self.index_name(project),
+            index=self.write_index_names(project),
             body=query,
             conflicts='proceed',
         )
 
-    def update(self, project, entity_type, query, attrs):
-        """Bulk update on search results.
+    def update(self, project, entity_type, query, attrs, wait=True):
+        """Bulk update on search results. Attribute values are passed as parameters to a
+           stored script and the update is sliced across shards. If wait is false, returns
+           the ID of an elasticsearch task that can be polled for progress.
         """
-        query['script'] = ''
-        mapping_values = _get_mapping_values(entity_type, attrs)
-        for key in mapping_values:
-            val = mapping_values[key]
-            if isinstance(val, bool):
-                if val:
-                    val = 'true'
-                else:
-                    val = 'false'
-            if isinstance(val, list): # This is a list geopos type
-                lon, lat = val # Lists are lon first
-                val = f'{lat},{lon}' # Convert to string geopos type, lat first
-            query['script'] += f"ctx._source['{key}']='{val}';"
-        self.es.update_by_query(
-            index=self.index_name(project),
-            body=query,
+        self.put_scripts()
+        body = {'query': query.get('query', {'match_all': {}})}
+        if ('from' in query) or ('size' in query):
+            # Update by query does not support pagination, so restrict the update to the
+            # documents on the requested page.
+            ids = list(itertools.chain.from_iterable(self.iter_ids(project, query)))
+            body['query'] = {'bool': {'filter': [
+                body['query'],
+                {'terms': {'_postgres_id': ids}},
+            ]}}
+        body['script'] = {
+            'id': UPDATE_SCRIPT_ID,
+            'params': {'attrs': _get_mapping_values(entity_type, attrs)},
+        }
+        response = self.es.update_by_query(
+            index=self.write_index_names(project),
+            body=body,
             conflicts='proceed',
+            slices='auto',
+            wait_for_completion=wait,
         )
+        if not wait:
+            task_id = response['task']
+            TatorCache().set_search_task(task_id, project,
+                                         f"Update attributes of {entity_type.name}")
+            return task_id
+
+    def get_task(self, task_id):
+        """ Returns progress of an elasticsearch task started by a bulk operation.
+        """
+        result = self.es.tasks.get(task_id=task_id)
+        status = result.get('response', result['task']['status'])
+        return {
+            'completed': result['completed'],
+            'total': status.get('total', 0),
+            'created': status.get('created', 0),
+            'updated': status.get('updated', 0),
+            'deleted': status.get('deleted', 0),
+            'version_conflicts': status.get('version_conflicts', 0),
+            'failures': len(status.get('failures', [])),
+            'error': result.get('error', {}).get('reason'),
+        }
 
 TatorSearch.setup_elasticsearch()
@@ -0,0 +1,160 @@
+""" Shared cache of parsed streaming segment and seek indexes.
+
+    The segment info file of a streaming video is parsed into a numpy structured array
+    with one row per mp4 box. The seek index has one row per fragment sorted by first
+    frame, so frames can be resolved to fragments with `numpy.searchsorted`. It is
+    derived from the segment index, unless the streaming file definition points to a
+    seek index file, e.g. one that marks fragments not starting on a keyframe.
+
+    Arrays are stored in redis under a hash per media, keyed by quality and file paths,
+    which expires SEGMENT_INDEX_TTL seconds after it was last written. They are kept in a
+    small per-process LRU in front of redis. Local copies are rechecked against a
+    per-media version in redis, which is bumped when media files of a media are changed
+    or the media is deleted.
+"""
+from collections import OrderedDict
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from django.db import transaction
+
+from .cache import TatorCache
+from .s3 import TatorS3
+
+# Seconds between checks of the segment index version in redis.
+SEGMENT_INDEX_CHECK_INTERVAL = 1
+
+# Maximum number of segment indexes kept in memory by each process.
+SEGMENT_INDEX_CACHE_SIZE = 256
+
+# Seconds segment indexes of a media are kept in redis after the last one was stored.
+SEGMENT_INDEX_TTL = 24 * 3600
+
+# Columns of a segment index. Frame columns are -1 for boxes other than moof.
+SEGMENT_DTYPE = np.dtype([
+    ('offset', '<i8'),
+    ('size', '<i8'),
+    ('frame_start', '<i8'),
+    ('frame_samples', '<i8'),
+    ('moof', '?'),
+])
+
+# Columns of a seek index. Segment is the index of the fragment's moof in the segment
+# index and size covers the moof and its mdat.
+SEEK_DTYPE = np.dtype([
+    ('frame_start', '<i8'),
+    ('frame_samples', '<i8'),
+    ('segment', '<i4'),
+    ('offset', '<i8'),
+    ('size', '<i8'),
+    ('keyframe', '?'),
+])
+
+# Maps (media ID, field) to segment index version, time of last version check and array.
+_segment_indexes = OrderedDict()
+_lock = threading.Lock()
+
+def _field(media_def):
+    return f"{media_def['resolution'][0]}:{media_def['path']}:{media_def['segment_info']}"
+
+def _read_file(path):
+    """ Reads a file from disk or object storage.
+    """
+    if path.startswith('/'):
+        with open(path, 'rb') as f_p:
+            return f_p.read()
+    f_p = io.BytesIO()
+    TatorS3().s3.download_fileobj(os.getenv('BUCKET_NAME'), path, f_p)
+    return f_p.getvalue()
+
+def parse_segment_info(segment_info):
+    """ Converts parsed segment info into a segment index array.
+    """
+    segments = segment_info['segments']
+    index = np.empty(len(segments), dtype=SEGMENT_DTYPE)
+    for idx, segment in enumerate(segments):
+        index[idx] = (segment['offset'],
+                      segment['size'],
+                      segment.get('frame_start', -1),
+                      segment.get('frame_samples', -1),
+                      segment['name'] == 'moof')
+    return index
+
+def make_seek_index(segments):
+    """ Derives a seek index from a segment index. Fragments are assumed to start with a
+        keyframe, as the transcoder fragments on keyframes.
+    """
+    moofs = np.flatnonzero(segments['moof'])
+    mdats = np.minimum(moofs + 1, len(segments) - 1)
+    seek = np.empty(len(moofs), dtype=SEEK_DTYPE)
+    seek['frame_start'] = segments['frame_start'][moofs]
+    seek['frame_samples'] = segments['frame_samples'][moofs]
+    seek['segment'] = moofs
+    seek['offset'] = segments['offset'][moofs]
+    seek['size'] = segments['size'][moofs] + np.where(mdats > moofs, segments['size'][mdats], 0)
+    seek['keyframe'] = True
+    return seek[np.argsort(seek['frame_start'], kind='stable')]
+
+def _get_cached(media_id, field, dtype, load):
+    """ Returns an array from the local cache or redis, calling `load` on a miss.
+    """
+    key = (media_id, field)
+    now = time.time()
+    with _lock:
+        cached = _segment_indexes.get(key)
+        if (cached is not None) and (now - cached[1] < SEGMENT_INDEX_CHECK_INTERVAL):
+            _segment_indexes.move_to_end(key)
+            return cached[2]
+    cache = TatorCache()
+    version = cache.get_segment_index_version(media_id)
+    if (cached is None) or (cached[0] != version):
+        versioned_field = f'{version}:{field}'
+        val = cache.get_segment_index(media_id, versioned_field)
+        if val is None:
+            index = load()
+            cache.set_segment_index(media_id, versioned_field, index.tobytes(),
+                                    SEGMENT_INDEX_TTL)
+        else:
+            index = np.frombuffer(val, dtype=dtype)
+        cached = (version, now, index)
+    else:
+        cached = (version, now, cached[2])
+    with _lock:
+        _segment_indexes[key] = cached
+        _segment_indexes.move_to_end(key)
+        while len(_segment_indexes) > SEGMENT_INDEX_CACHE_SIZE:
+            _segment_indexes.popitem(last=False)
+    return cached[2]
+
+def get_segment_index(media_id, media_def):
+    """ Returns the segment index array of a streaming file definition.
+    """
+    def _load():
+        return parse_segment_info(json.loads(_read_file(media_def['segment_info'])))
+    return _get_cached(media_id, f'segments:{_field(media_def)}', SEGMENT_DTYPE, _load)
+
+def get_seek_index(media_id, media_def):
+    """ Returns the seek index array of a streaming file definition.
+    """
+    def _load():
+        if media_def.get('seek_index'):
+            data = io.BytesIO(_read_file(media_def['seek_index']))
+            return np.load(data, allow_pickle=False).astype(SEEK_DTYPE)
+        return make_seek_index(get_segment_index(media_id, media_def))
+    field = f"seek:{_field(media_def)}:{media_def.get('seek_index')}"
+    return _get_cached(media_id, field, SEEK_DTYPE, _load)
+
+def invalidate_segment_indexes(media_id):
+    """ Invalidates segment indexes of a media in all processes once the current
+        transaction commits.
+    """
+    def _invalidate():
+        with _lock:
+            for key in [key for key in _segment_indexes if key[0] == media_id]:
+                _segment_indexes.pop(key)
+        TatorCache().invalidate_segment_index(media_id)
+    transaction.on_commit(_invalidate)
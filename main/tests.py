@@ -1,5 +1,6 @@
 import os
 import json
+import base64
 import random
 import datetime
 import logging
@@ -9,19 +10,37 @@ import time
 from uuid import uuid1
 from math import sin, cos, sqrt, atan2, radians
 import re
+import struct
+import tempfile
+import unittest
+from unittest import mock
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.files.base import ContentFile
 from django.contrib.gis.geos import Point
+from django.test import RequestFactory
+from django.test import override_settings
 from rest_framework import status
 from rest_framework.test import APITestCase
 from dateutil.parser import parse as dateutil_parse
 from botocore.errorfactory import ClientError
+from elasticsearch.helpers import bulk
+import numpy as np
 
 from .models import *
 from .s3 import TatorS3
 from .search import TatorSearch
 from .search import ALLOWED_MUTATIONS
+from .segment_index import get_segment_index
+from .segment_index import get_seek_index
+from .render_cache import render_key
+from .render_cache import get_render
+from .render_cache import get_render_cache_stats
+from .rest._decoder_pool import av
+from .rest._decoder_pool import DecoderPool
+from .rest._media_util import MediaUtil
+from .util import processIndexQueue
+from .util import MAX_INDEX_ATTEMPTS
 
 logger = logging.getLogger(__name__)
 
@@ -580,6 +599,36 @@ class AttributeMediaTestMixin:
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+class CountTestMixin:
+    def test_count(self):
+        test_vals = [random.random() > 0.5 for _ in range(len(self.entities))]
+        for idx, test_val in enumerate(test_vals):
+            pk = self.entities[idx].pk
+            response = self.client.patch(f'/rest/{self.detail_uri}/{pk}',
+                                         {'attributes': {'Bool Test': test_val}},
+                                         format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        TatorSearch().refresh(self.project.pk)
+        for force_es in [0, 1]:
+            response = self.client.get(
+                f'/rest/{self.count_uri}/{self.project.pk}'
+                f'?attribute=Bool Test::true'
+                f'&type={self.entity_type.pk}'
+                f'&force_es={force_es}'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data, sum(test_vals))
+            response = self.client.get(
+                f'/rest/{self.count_uri}/{self.project.pk}'
+                f'?attribute=Bool Test::true'
+                f'&type={self.entity_type.pk}'
+                f'&force_es={force_es}'
+                f'&start=1'
+                f'&stop=4'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data, max(0, min(sum(test_vals) - 1, 3)))
+
 class AttributeTestMixin:
     def test_query_no_attributes(self):
         response = self.client.get(
@@ -1081,6 +1130,81 @@ class FileMixin:
         self.assertEqual(len(response.data), 0)
 
 
+class StreamTestMixin:
+    def test_stream(self):
+        response = self.client.get(
+            f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}&format=json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = [obj['id'] for obj in response.data]
+        for query in ['format=json&stream=true', 'format=ndjson']:
+            response = self.client.get(
+                f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}&{query}'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            content = b''.join(response.streaming_content).decode()
+            if query == 'format=ndjson':
+                data = [json.loads(line) for line in content.splitlines()]
+            else:
+                data = json.loads(content)
+            self.assertEqual([obj['id'] for obj in data], expected)
+
+class FieldsTestMixin:
+    def test_fields(self):
+        response = self.client.get(
+            f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}'
+            f'&fields=attributes&format=json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for obj in response.data:
+            self.assertIn('id', obj)
+            self.assertIn('attributes', obj)
+            self.assertNotIn('meta', obj)
+        response = self.client.get(
+            f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}'
+            f'&fields=not_a_field&format=json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class IngestTestMixin:
+    def test_ingest(self):
+        url = f'/rest/{self.ingest_uri}/{self.project.pk}?type={self.entity_type.pk}'
+        body = ''.join([json.dumps(spec) + '\n' for spec in self.create_json * 3])
+        response = self.client.post(url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['id']), 3 * len(self.create_json))
+        response = self.client.get(f'/rest/{self.detail_uri}/{response.data["id"][0]}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for key in ['Bool Test', 'Int Test', 'Enum Test', 'String Test']:
+            self.assertEqual(response.data['attributes'][key], self.create_json[0][key])
+        invalid = dict(self.create_json[0], **{'Enum Test': 'not_a_choice'})
+        response = self.client.post(url, json.dumps(invalid) + '\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ColumnarTestMixin:
+    def test_columnar(self):
+        response = self.client.get(
+            f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}&format=json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = [obj['id'] for obj in response.data]
+        response = self.client.get(
+            f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}&format=columnar'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], len(expected))
+        self.assertEqual(response.data['columns']['id'], expected)
+        for values in response.data['attributes'].values():
+            self.assertEqual(len(values), len(expected))
+        response = self.client.get(
+            f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}'
+            f'&format=columnar&buffers=true'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = np.frombuffer(base64.b64decode(response.data['columns']['id']), dtype='<i4')
+        self.assertEqual(ids.tolist(), expected)
+
 class CurrentUserTestCase(APITestCase):
     def test_get(self):
         self.user = create_test_user()
@@ -1171,6 +1295,9 @@ class AlgorithmTestCase(
 class VideoTestCase(
         APITestCase,
         AttributeTestMixin,
+        CountTestMixin,
+        StreamTestMixin,
+        FieldsTestMixin,
         AttributeMediaTestMixin,
         PermissionListMembershipTestMixin,
         PermissionDetailMembershipTestMixin,
@@ -1192,6 +1319,7 @@ class VideoTestCase(
         ]
         self.media_entities = self.entities
         self.list_uri = 'Medias'
+        self.count_uri = 'MediaCount'
         self.detail_uri = 'Media'
         self.create_entity = functools.partial(
             create_test_video, self.user, 'asdfa', self.entity_type, self.project)
@@ -1202,9 +1330,30 @@ class VideoTestCase(
     def tearDown(self):
         self.project.delete()
 
+    def test_name_order(self):
+        for name in ['Bcd', 'abc', 'ABd', 'b_a', 'Abc']:
+            create_test_video(self.user, name, self.entity_type, self.project)
+        TatorSearch().refresh(self.project.pk)
+        names = {}
+        for force_es in [0, 1]:
+            for after in [None, 'abc']:
+                url = f'/rest/{self.list_uri}/{self.project.pk}?force_es={force_es}&format=json'
+                if after is not None:
+                    url += f'&after={after}'
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                names[(force_es, after)] = [media['name'] for media in response.data]
+        # Postgres and elasticsearch agree on a case insensitive order.
+        self.assertEqual(names[(0, None)], names[(1, None)])
+        self.assertEqual(names[(0, 'abc')], names[(1, 'abc')])
+        lower = [name.lower() for name in names[(0, None)]]
+        self.assertEqual(lower, sorted(lower))
+        self.assertTrue(all(name.lower() > 'abc' for name in names[(0, 'abc')]))
+
 class ImageTestCase(
         APITestCase,
         AttributeTestMixin,
+        CountTestMixin,
         AttributeMediaTestMixin,
         PermissionListMembershipTestMixin,
         PermissionDetailMembershipTestMixin,
@@ -1226,6 +1375,7 @@ class ImageTestCase(
         ]
         self.media_entities = self.entities
         self.list_uri = 'Medias'
+        self.count_uri = 'MediaCount'
         self.detail_uri = 'Media'
         self.create_entity = functools.partial(
             create_test_image, self.user, 'asdfa', self.entity_type, self.project)
@@ -1239,6 +1389,11 @@ class ImageTestCase(
 class LocalizationBoxTestCase(
         APITestCase,
         AttributeTestMixin,
+        CountTestMixin,
+        StreamTestMixin,
+        FieldsTestMixin,
+        ColumnarTestMixin,
+        IngestTestMixin,
         AttributeMediaTestMixin,
         DefaultCreateTestMixin,
         PermissionCreateTestMixin,
@@ -1272,7 +1427,9 @@ class LocalizationBoxTestCase(
             for idx in range(random.randint(6, 10))
         ]
         self.list_uri = 'Localizations'
+        self.count_uri = 'LocalizationCount'
         self.detail_uri = 'Localization'
+        self.ingest_uri = 'IngestLocalizations'
         self.create_entity = functools.partial(
             create_test_box, self.user, self.entity_type, self.project, self.media_entities[0], 0)
         self.create_json = [{
@@ -1299,9 +1456,25 @@ class LocalizationBoxTestCase(
     def tearDown(self):
         self.project.delete()
 
+    def test_count_exclude_parents(self):
+        url = (f'/rest/{self.count_uri}/{self.project.pk}?type={self.entity_type.pk}'
+               f'&force_es=1&excludeParents=1')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, len(self.entities))
+        # Pagination is rejected as it is by the list endpoint.
+        response = self.client.get(url + '&start=1&stop=4')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            f'/rest/{self.list_uri}/{self.project.pk}?type={self.entity_type.pk}'
+            f'&force_es=1&excludeParents=1&start=1&stop=4'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 class LocalizationLineTestCase(
         APITestCase,
         AttributeTestMixin,
+        CountTestMixin,
         AttributeMediaTestMixin,
         DefaultCreateTestMixin,
         PermissionCreateTestMixin,
@@ -1335,6 +1508,7 @@ class LocalizationLineTestCase(
             for idx in range(random.randint(6, 10))
         ]
         self.list_uri = 'Localizations'
+        self.count_uri = 'LocalizationCount'
         self.detail_uri = 'Localization'
         self.create_entity = functools.partial(
             create_test_line, self.user, self.entity_type, self.project, self.media_entities[0], 0)
@@ -1365,6 +1539,7 @@ class LocalizationLineTestCase(
 class LocalizationDotTestCase(
         APITestCase,
         AttributeTestMixin,
+        CountTestMixin,
         AttributeMediaTestMixin,
         DefaultCreateTestMixin,
         PermissionCreateTestMixin,
@@ -1398,6 +1573,7 @@ class LocalizationDotTestCase(
             for idx in range(random.randint(6, 10))
         ]
         self.list_uri = 'Localizations'
+        self.count_uri = 'LocalizationCount'
         self.detail_uri = 'Localization'
         self.create_entity = functools.partial(
             create_test_dot, self.user, self.entity_type, self.project, self.media_entities[0], 0)
@@ -1426,6 +1602,11 @@ class LocalizationDotTestCase(
 class StateTestCase(
         APITestCase,
         AttributeTestMixin,
+        CountTestMixin,
+        StreamTestMixin,
+        FieldsTestMixin,
+        ColumnarTestMixin,
+        IngestTestMixin,
         AttributeMediaTestMixin,
         DefaultCreateTestMixin,
         PermissionCreateTestMixin,
@@ -1466,7 +1647,9 @@ class StateTestCase(
                 state.media.add(media)
             self.entities.append(state)
         self.list_uri = 'States'
+        self.count_uri = 'StateCount'
         self.detail_uri = 'State'
+        self.ingest_uri = 'IngestStates'
         self.create_entity = functools.partial(State.objects.create,
             meta=self.entity_type,
             project=self.project,
@@ -1491,9 +1674,20 @@ class StateTestCase(
     def tearDown(self):
         self.project.delete()
 
+    def test_search_after_media_add(self):
+        query = {'query': {'bool': {'filter': [{'match': {'_dtype': 'state'}}]}}}
+        ids, _ = TatorSearch().search(self.project.pk, query)
+        self.assertEqual(set(ids), set(state.pk for state in self.entities))
+        state = self.entities[0]
+        state.media.add(*self.media_entities)
+        TatorSearch().refresh(self.project.pk)
+        ids, _ = TatorSearch().search(self.project.pk, query)
+        self.assertEqual(set(ids), set(state.pk for state in self.entities))
+
 class LeafTestCase(
         APITestCase,
         AttributeTestMixin,
+        CountTestMixin,
         DefaultCreateTestMixin,
         PermissionCreateTestMixin,
         PermissionListTestMixin,
@@ -1514,6 +1708,7 @@ class LeafTestCase(
             for idx in range(random.randint(6, 10))
         ]
         self.list_uri = 'Leaves'
+        self.count_uri = 'LeafCount'
         self.detail_uri = 'Leaf'
         self.create_entity = functools.partial(
             create_test_leaf, 'leafasdf', self.entity_type, self.project)
@@ -2214,6 +2409,369 @@ class AudioFileTestCase(APITestCase, FileMixin):
     def test_audio(self):
         self._test_methods('audio')
 
+class SegmentIndexTestCase(APITestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.project = create_test_project(self.user)
+        self.entity_type = MediaType.objects.create(
+            name="video",
+            dtype='video',
+            project=self.project,
+        )
+        self.media = create_test_video(self.user, 'asdf', self.entity_type, self.project)
+        self.segment_path = f'/tmp/{uuid1()}.json'
+        segments = [{'name': 'ftyp', 'offset': 0, 'size': 24},
+                    {'name': 'moov', 'offset': 24, 'size': 800}]
+        for idx in range(10):
+            segments += [{'name': 'moof', 'offset': 824 + 2000 * idx, 'size': 100,
+                          'frame_start': 30 * idx, 'frame_samples': 30},
+                         {'name': 'mdat', 'offset': 924 + 2000 * idx, 'size': 1900}]
+        with open(self.segment_path, 'w') as f:
+            json.dump({'file': {'start': 0}, 'segments': segments}, f)
+        self.media_def = {'path': '/tmp/asdf.mp4', 'resolution': [480, 640],
+                          'segment_info': self.segment_path}
+
+    def tearDown(self):
+        if os.path.exists(self.segment_path):
+            os.remove(self.segment_path)
+        self.project.delete()
+
+    def test_segment_index(self):
+        index = get_segment_index(self.media.pk, self.media_def)
+        self.assertEqual(len(index), 22)
+        self.assertEqual(index['offset'][2], 824)
+        self.assertEqual(index['size'][3], 1900)
+        self.assertEqual(np.flatnonzero(index['moof']).tolist(), list(range(2, 22, 2)))
+        self.assertEqual(index['frame_start'][4], 30)
+        self.assertEqual(index['frame_start'][5], -1)
+        # Cached indexes are reused without reading the segment info file.
+        os.remove(self.segment_path)
+        cached = get_segment_index(self.media.pk, self.media_def)
+        self.assertTrue(np.array_equal(index, cached))
+
+    def test_media_files_changed(self):
+        media = Media.objects.get(pk=self.media.pk)
+        self.assertFalse(media.media_files_changed())
+        # Saves that do not change media files keep cached segment indexes.
+        media.name = 'asdf1'
+        media.save()
+        self.assertFalse(media.media_files_changed())
+        media.media_files = {'streaming': [self.media_def]}
+        self.assertTrue(media.media_files_changed())
+        media.save()
+        self.assertFalse(media.media_files_changed())
+        media.media_files['streaming'][0]['path'] = '/tmp/asdf1.mp4'
+        self.assertTrue(media.media_files_changed())
+
+    def test_seek_index(self):
+        seek = get_seek_index(self.media.pk, self.media_def)
+        self.assertEqual(seek['segment'].tolist(), list(range(2, 22, 2)))
+        self.assertEqual(seek['frame_start'].tolist(), list(range(0, 300, 30)))
+        self.assertTrue(np.all(seek['size'] == 2000))
+        self.assertTrue(np.all(seek['keyframe']))
+        # Seek indexes generated at transcode time are used when available.
+        seek_path = f'/tmp/{uuid1()}.npy'
+        generated = seek.copy()
+        generated['keyframe'][1::2] = False
+        np.save(seek_path, generated, allow_pickle=False)
+        media_def = {**self.media_def, 'seek_index': seek_path}
+        try:
+            seek = get_seek_index(self.media.pk, media_def)
+        finally:
+            os.remove(seek_path)
+        self.assertEqual(seek['keyframe'].tolist(), [True, False] * 5)
+
+class RenderCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.project = create_test_project(self.user)
+        self.entity_type = MediaType.objects.create(
+            name="video",
+            dtype='video',
+            project=self.project,
+        )
+        self.media = create_test_video(self.user, 'asdf', self.entity_type, self.project)
+        self.renders = 0
+
+    def tearDown(self):
+        self.project.delete()
+
+    def _render(self):
+        self.renders += 1
+        return b'asdf'
+
+    def test_render_cache(self):
+        key = render_key(self.media, frames=[0], roi=[(0.1, 0.1, 0.2, 0.2)], format='png')
+        other = render_key(self.media, frames=[1], roi=[(0.1, 0.1, 0.2, 0.2)], format='png')
+        self.assertNotEqual(key, other)
+        request = RequestFactory().get('/')
+        with override_settings(RENDER_CACHE_DIR=f'/tmp/{uuid1()}', RENDER_CACHE_STORAGE=False):
+            data = get_render(request, self.media.pk, key, 'png', self._render)
+            self.assertEqual(data, b'asdf')
+            data = get_render(request, self.media.pk, key, 'png', self._render)
+            self.assertEqual(data, b'asdf')
+            self.assertEqual(self.renders, 1)
+            request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=data.etag)
+            data = get_render(request, self.media.pk, key, 'png', self._render)
+            self.assertTrue(data.not_modified)
+            self.assertEqual(self.renders, 1)
+
+    def test_render_cache_stats(self):
+        key = render_key(self.media, frames=[0], format='png')
+        request = RequestFactory().get('/')
+        before = get_render_cache_stats()
+        with override_settings(RENDER_CACHE_DIR=f'/tmp/{uuid1()}', RENDER_CACHE_STORAGE=False):
+            get_render(request, self.media.pk, key, 'png', self._render)
+            get_render(request, self.media.pk, key, 'png', self._render)
+        after = get_render_cache_stats()
+        self.assertEqual(after.get('miss', 0) - before.get('miss', 0), 1)
+        self.assertEqual(after.get('local_hit', 0) - before.get('local_hit', 0), 1)
+
+@unittest.skipIf(av is None, "PyAV is not installed")
+class DecoderPoolTestCase(APITestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.project = create_test_project(self.user)
+        self.entity_type = MediaType.objects.create(
+            name="video",
+            dtype='video',
+            project=self.project,
+        )
+        self.media = create_test_video(self.user, 'asdf', self.entity_type, self.project)
+        self.video_path = f'/tmp/{uuid1()}.mp4'
+        self.segment_path = f'/tmp/{uuid1()}.json'
+        self.gop = 10
+        self._make_video(40)
+        self.media.media_files = {'streaming': [{'path': self.video_path,
+                                                 'resolution': [64, 64],
+                                                 'segment_info': self.segment_path}]}
+        self.media.save()
+
+    def tearDown(self):
+        for path in [self.video_path, self.segment_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        self.project.delete()
+
+    def _make_video(self, num_frames):
+        """ Writes a fragmented mp4 with a fragment per GOP, where frame N has pixel value
+            5 * N, and its segment info.
+        """
+        options = {'movflags': 'frag_keyframe+empty_moov+default_base_moof'}
+        with av.open(self.video_path, 'w', format='mp4', options=options) as container:
+            stream = container.add_stream('libx264', rate=30)
+            stream.width = 64
+            stream.height = 64
+            stream.pix_fmt = 'yuv420p'
+            stream.options = {'g': str(self.gop), 'keyint_min': str(self.gop),
+                              'sc_threshold': '0', 'bf': '0'}
+            for idx in range(num_frames):
+                array = np.full((64, 64, 3), 5 * idx, dtype=np.uint8)
+                frame = av.VideoFrame.from_ndarray(array, format='rgb24')
+                for packet in stream.encode(frame):
+                    container.mux(packet)
+            for packet in stream.encode():
+                container.mux(packet)
+        with open(self.video_path, 'rb') as f:
+            self.data = f.read()
+        segments = []
+        offset = 0
+        frame_start = 0
+        while offset < len(self.data):
+            size, name = struct.unpack('>I4s', self.data[offset:offset+8])
+            segment = {'name': name.decode(), 'offset': offset, 'size': size}
+            if segment['name'] == 'moof':
+                segment.update(frame_start=frame_start, frame_samples=self.gop)
+                frame_start += self.gop
+            segments.append(segment)
+            offset += size
+        with open(self.segment_path, 'w') as f:
+            json.dump({'file': {'start': 0}, 'segments': segments}, f)
+
+    def _assert_frames(self, arrays, frames):
+        self.assertEqual(len(arrays), len(frames))
+        for array, frame in zip(arrays, frames):
+            self.assertEqual(array.shape, (64, 64, 3))
+            self.assertLess(abs(array.mean() - 5 * frame), 4)
+
+    def test_decoder_pool(self):
+        loads = []
+        def _load():
+            loads.append(1)
+            return self.data
+        pool = DecoderPool(10 * len(self.data), 2)
+        frames = [5, 1, 39, 20]
+        arrays = pool.decode([('a', _load, frame) for frame in frames] + [('b', _load, 3)])
+        self._assert_frames(arrays, frames + [3])
+        self.assertEqual(len(loads), 2)
+        self.assertEqual(pool.get_data('a'), self.data)
+        # Open decoders are reused, including for earlier frames.
+        self._assert_frames(pool.decode([('a', _load, 2)]), [2])
+        self.assertEqual(len(loads), 2)
+        # Least recently used decoders are evicted once the pool is full.
+        pool = DecoderPool(len(self.data), 2)
+        pool.decode([('a', _load, 0), ('b', _load, 0)])
+        self.assertIsNone(pool.get_data('a'))
+        self.assertEqual(pool.get_data('b'), self.data)
+        self._assert_frames(pool.decode([('a', _load, 12)]), [12])
+
+    def test_get_frame_arrays(self):
+        with override_settings(DECODER_POOL=True), tempfile.TemporaryDirectory() as temp_dir:
+            media_util = MediaUtil(self.media, temp_dir)
+            frames = [0, 13, 29, 39]
+            self._assert_frames(media_util.get_frame_arrays(frames), frames)
+            with self.assertRaises(ValueError):
+                media_util.get_frame_arrays([40])
+
+class ReindexTestCase(APITestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.project = create_test_project(self.user)
+        media_entity_type = MediaType.objects.create(
+            name="video",
+            dtype='video',
+            project=self.project,
+        )
+        self.entity_type = LocalizationType.objects.create(
+            name="boxes",
+            dtype='box',
+            project=self.project,
+            attribute_types=create_test_attribute_types(),
+        )
+        self.entity_type.media.add(media_entity_type)
+        self.media = create_test_video(self.user, 'asdf', media_entity_type, self.project)
+        self.boxes = [create_test_box(self.user, self.entity_type, self.project, self.media, 0)
+                      for _ in range(3)]
+
+    def tearDown(self):
+        self.project.delete()
+
+    def _count(self, ts, index, box):
+        ts.es.indices.refresh(index=index)
+        query = {'query': {'bool': {'filter': [{'term': {'_postgres_id': box.pk}},
+                                               {'term': {'_dtype': 'box'}}]}}}
+        return ts.es.count(index=index, body=query)['count']
+
+    def test_replay_deletes(self):
+        ts = TatorSearch()
+        index = ts.begin_reindex(self.project.pk)
+        deleted, bulk_deleted, kept = self.boxes
+        # Documents read from the database before their entities were deleted.
+        documents = [doc for box in self.boxes for doc in ts.build_document(box)]
+        deleted.delete()
+        ts.delete(self.project.pk, {'query': {'bool': {'filter': [
+            {'term': {'_postgres_id': bulk_deleted.pk}},
+            {'term': {'_dtype': 'box'}},
+        ]}}})
+        bulk(ts.es, [{**doc, '_index': index} for doc in documents])
+        self.assertEqual(self._count(ts, index, deleted), 1)
+        ts.replay_reindex_deletes(self.project.pk, index)
+        self.assertEqual(self._count(ts, index, deleted), 0)
+        self.assertEqual(self._count(ts, index, bulk_deleted), 0)
+        self.assertEqual(self._count(ts, index, kept), 1)
+
+class IndexQueueTestCase(APITestCase):
+    def setUp(self):
+        self.user = create_test_user()
+        self.client.force_authenticate(self.user)
+        self.project = create_test_project(self.user)
+        self.membership = create_test_membership(self.user, self.project)
+        media_entity_type = MediaType.objects.create(
+            name="video",
+            dtype='video',
+            project=self.project,
+        )
+        self.entity_type = LocalizationType.objects.create(
+            name="boxes",
+            dtype='box',
+            project=self.project,
+            attribute_types=create_test_attribute_types(),
+        )
+        self.entity_type.media.add(media_entity_type)
+        self.media = create_test_video(self.user, 'asdf', media_entity_type, self.project)
+        self.query = {'query': {'bool': {'filter': [{'match': {'_dtype': 'box'}}]}}}
+
+    def tearDown(self):
+        self.project.delete()
+
+    def _create_box(self):
+        box = create_test_box(self.user, self.entity_type, self.project, self.media, 0)
+        # Set attributes without a save, so building the document does not save the box.
+        Localization.objects.filter(pk=box.pk).update(attributes={})
+        box.attributes = {}
+        return box
+
+    def _search(self):
+        TatorSearch().refresh(self.project.pk)
+        ids, _ = TatorSearch().search(self.project.pk, self.query)
+        return set(ids)
+
+    def test_process_queue(self):
+        with override_settings(ASYNC_INDEXING=True):
+            boxes = [self._create_box() for _ in range(5)]
+            # Repeated saves are queued and coalesced into one document write.
+            boxes[0].save()
+        ids = set(box.pk for box in boxes)
+        queued = IndexQueue.objects.filter(project=self.project.pk, entity_type='localization')
+        self.assertEqual(queued.count(), 6)
+        self.assertEqual(self._search(), set())
+        while processIndexQueue() > 0:
+            pass
+        self.assertFalse(IndexQueue.objects.filter(project=self.project.pk).exists())
+        self.assertEqual(self._search(), ids)
+
+    def test_retry_failed(self):
+        with override_settings(ASYNC_INDEXING=True):
+            boxes = [self._create_box() for _ in range(2)]
+        failed_id = f'box_{boxes[0].pk}'
+        bulk_add_documents = TatorSearch.bulk_add_documents
+        def _fail_first(ts, docs, wait=False):
+            bulk_add_documents(ts, [doc for doc in docs if doc['_id'] != failed_id], wait)
+            return [{'index': {'_id': failed_id, 'status': 429, 'error': 'rejected'}}]
+        queued = IndexQueue.objects.filter(project=self.project.pk, entity_type='localization')
+        with mock.patch.object(TatorSearch, 'bulk_add_documents', _fail_first):
+            processIndexQueue()
+            # Only the row of the failed entity is kept for a retry.
+            self.assertEqual(list(queued.values_list('entity_id', 'attempts')),
+                             [(boxes[0].pk, 1)])
+            for _ in range(MAX_INDEX_ATTEMPTS - 1):
+                processIndexQueue()
+        # The row is dropped once it runs out of attempts.
+        self.assertFalse(queued.exists())
+        self.assertEqual(self._search(), {boxes[1].pk})
+
+    def test_bulk_update_read_model(self):
+        boxes = [self._create_box() for _ in range(3)]
+        with override_settings(ASYNC_INDEXING=True, READ_MODEL=True):
+            response = self.client.patch(
+                f'/rest/Localizations/{self.project.pk}?media_id={self.media.pk}',
+                {'attributes': {'Bool Test': True}},
+                format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Bulk updates bypass the save signals, so the entities are queued explicitly.
+        queued = IndexQueue.objects.filter(project=self.project.pk, entity_type='localization')
+        self.assertEqual(set(queued.values_list('entity_id', flat=True)),
+                         set(box.pk for box in boxes))
+
+    def test_wait_for_index(self):
+        with override_settings(ASYNC_INDEXING=True):
+            box = self._create_box()
+            self.assertEqual(self._search(), set())
+            response = self.client.patch(f'/rest/Localization/{box.pk}?wait_for_index=true',
+                                         {'name': 'asdf'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # Visible without a refresh or the index worker.
+            ids, _ = TatorSearch().search(self.project.pk, self.query)
+            self.assertEqual(set(ids), {box.pk})
+            response = self.client.post(
+                f'/rest/Localizations/{self.project.pk}?wait_for_index=true',
+                [{'type': self.entity_type.pk, 'media_id': self.media.pk, 'frame': 0,
+                  'x': 0, 'y': 0, 'width': 0.5, 'height': 0.5}],
+                format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            ids, _ = TatorSearch().search(self.project.pk, self.query)
+            self.assertEqual(set(ids), {box.pk, *response.data['id']})
+
 class ResourceTestCase(APITestCase):
 
     MEDIA_ROLES = {'streaming': 'VideoFiles',
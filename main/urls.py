@@ -188,6 +188,10 @@ urlpatterns += [
         'rest/LocalizationCount/<int:project>',
         LocalizationCountAPI.as_view(),
     ),
+    path(
+        'rest/IngestLocalizations/<int:project>',
+        LocalizationIngestAPI.as_view(),
+    ),
     path(
         'rest/LocalizationTypes/<int:project>',
         LocalizationTypeListAPI.as_view(),
@@ -280,11 +284,19 @@ urlpatterns += [
         SectionAnalysisAPI.as_view(),
         name='SectionAnalysis',
     ),
+    path(
+        'rest/SearchTask/<str:task_id>',
+        SearchTaskDetailAPI.as_view(),
+    ),
     path(
         'rest/States/<int:project>',
         StateListAPI.as_view(),
         name='States'
     ),
+    path(
+        'rest/IngestStates/<int:project>',
+        StateIngestAPI.as_view(),
+    ),
     path(
         'rest/StateCount/<int:project>',
         StateCountAPI.as_view(),
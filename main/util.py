@@ -6,8 +6,9 @@ import json
 import datetime
 import shutil
 import math
+import multiprocessing
 
-from progressbar import progressbar,ProgressBar
+from progressbar import progressbar
 from dateutil.parser import parse
 from boto3.s3.transfer import S3Transfer
 from PIL import Image
@@ -15,14 +16,18 @@ from PIL import Image
 from main.models import *
 from main.models import Resource
 from main.search import TatorSearch
+from main.search import WRITE_INDEX_TTL
 from main.search import mediaFileSizes
 from main.s3 import TatorS3
 
 from django.conf import settings
+from django.db import connections
+from django.db import transaction
 from django.db.models import F
+from django.utils import timezone
 
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import streaming_bulk
+from elasticsearch.helpers import parallel_bulk
 
 logger = logging.getLogger(__name__)
 
@@ -105,32 +110,95 @@ def waitForMigrations():
             time.sleep(10)
 
 INDEX_CHUNK_SIZE = 50000
+INDEX_BULK_SIZE = 500
+INDEX_THREADS = 4
 CLASS_MAPPING = {'media': Media,
                  'localizations': Localization,
                  'states': State,
                  'treeleaves': Leaf}
 
-def get_num_index_chunks(project_number, section, max_age_days=None):
-    """ Returns number of chunks for parallel indexing operation.
+def get_num_shards(project_number):
+    """ Returns number of primary shards for a project index, sized from current row
+        counts.
     """
-    count = 1
-    if section in CLASS_MAPPING:
-        qs = CLASS_MAPPING[section].objects.filter(project=project_number, meta__isnull=False)
-        if max_age_days:
-            min_modified = datetime.datetime.now() - datetime.timedelta(days=max_age_days)
-            qs = qs.filter(modified_datetime__gte=min_modified)
-        count = math.ceil(qs.count() / INDEX_CHUNK_SIZE)
+    count = sum(model.objects.filter(project=project_number).count()
+                for model in CLASS_MAPPING.values())
+    return max(1, min(settings.MAX_SHARDS, math.ceil(count / settings.DOCS_PER_SHARD)))
+
+def _index_queryset(project_number, section, max_age_days=None):
+    """ Returns queryset of entities to be indexed for a section.
+    """
+    qs = CLASS_MAPPING[section].objects.filter(project=project_number, meta__isnull=False)
+    if max_age_days:
+        min_modified = datetime.datetime.now() - datetime.timedelta(days=max_age_days)
+        qs = qs.filter(modified_datetime__gte=min_modified)
+    return qs
+
+def get_index_chunks(project_number, section, max_age_days=None):
+    """ Returns list of inclusive ID ranges (min_id, max_id) for parallel indexing, each
+        containing up to INDEX_CHUNK_SIZE entities. Boundaries are found by walking the
+        primary key index, so the cost of each chunk does not grow with its position.
+        Sections that do not index entities return a single placeholder chunk.
+    """
+    if section not in CLASS_MAPPING:
+        return [(0, 0)]
+    ids = _index_queryset(project_number, section, max_age_days) \
+          .order_by('id').values_list('id', flat=True)
+    chunks = []
+    min_id = ids.first()
+    while min_id is not None:
+        next_id = list(ids.filter(id__gte=min_id)[INDEX_CHUNK_SIZE:INDEX_CHUNK_SIZE+1])
+        if next_id:
+            chunks.append((min_id, next_id[0] - 1))
+            min_id = next_id[0]
+        else:
+            chunks.append((min_id, ids.last()))
+            min_id = None
+    return chunks
+
+def _index_chunk(args):
+    """ Indexes the entities in one ID range. Runs in a worker process. If an index is
+        given, documents are created in that index only and existing documents, which
+        were written more recently by dual writes, are left alone.
+    """
+    project_number, section, mode, min_id, max_id, max_age_days, index = args
+    qs = _index_queryset(project_number, section, max_age_days) \
+         .filter(id__gte=min_id, id__lte=max_id).select_related('meta')
+    ts = TatorSearch()
+    docs = (doc for entity in qs.iterator() for doc in ts.build_document(entity, mode))
+    if index is None:
+        docs = ts.dual_write(docs)
+    else:
+        docs = ({**doc, '_index': index, '_op_type': 'create'} for doc in docs)
+    count = 0
+    for ok, result in parallel_bulk(ts.es, docs, thread_count=INDEX_THREADS,
+                                    chunk_size=INDEX_BULK_SIZE, raise_on_error=False):
+        if not ok:
+            action, result = result.popitem()
+            if result.get('status') != 409:
+                logger.warning(f"Failed to {action} document! {result}")
+        count += 1
     return count
 
-def buildSearchIndices(project_number, section, mode='index', chunk=None, max_age_days=None):
+def _setup_index_worker():
+    # Connections inherited from the parent process cannot be shared.
+    connections.close_all()
+    TatorSearch.setup_elasticsearch()
+
+def buildSearchIndices(project_number, section, mode='index', chunk=None, max_age_days=None,
+                       processes=1):
     """ Builds search index for a project.
         section must be one of:
         'index' - create the index for the project if it does not exist
         'mappings' - create mappings for the project if they do not exist
+        'begin_bulk' - disable refresh and replicas ahead of document creation
         'media' - create documents for media
         'states' - create documents for states
         'localizations' - create documents for localizations
         'treeleaves' - create documents for treeleaves
+        'end_bulk' - restore refresh and replicas after document creation
+        If chunk is given it must be an ID range from get_index_chunks, otherwise all
+        chunks are built using a pool of processes with refresh disabled.
     """
     project_name = Project.objects.get(pk=project_number).name
     logger.info(f"Building search indices for project {project_number}: {project_name}")
@@ -138,7 +206,7 @@ def buildSearchIndices(project_number, section, mode='index', chunk=None, max_ag
     if section == 'index':
         # Create indices
         logger.info("Building index...")
-        TatorSearch().create_index(project_number)
+        TatorSearch().create_index(project_number, get_num_shards(project_number))
         logger.info("Build index complete!")
         return
 
@@ -159,43 +227,145 @@ def buildSearchIndices(project_number, section, mode='index', chunk=None, max_ag
         logger.info("Build mappings complete!")
         return
 
-    class DeferredCall:
-        def __init__(self, qs):
-            self._qs = qs
-        def __call__(self):
-            for entity in self._qs.iterator():
-                for doc in TatorSearch().build_document(entity, mode):
-                    yield doc
-
-    # Get queryset based on selected section.
-    logger.info(f"Building documents for {section}...")
-    qs = CLASS_MAPPING[section].objects.filter(project=project_number, meta__isnull=False)
+    if section == 'begin_bulk':
+        TatorSearch().begin_bulk_load(project_number)
+        return
 
-    # Apply max age filter.
-    if max_age_days:
-        min_modified = datetime.datetime.now() - datetime.timedelta(days=max_age_days)
-        qs = qs.filter(modified_datetime__gte=min_modified)
+    if section == 'end_bulk':
+        TatorSearch().end_bulk_load(project_number)
+        return
 
-    # Apply limit/offset if chunk parameter given.
-    if chunk is not None:
-        offset = INDEX_CHUNK_SIZE * chunk
-        qs = qs.order_by('id')[offset:offset+INDEX_CHUNK_SIZE]
+    logger.info(f"Building documents for {section}...")
+    if chunk is None:
+        chunks = get_index_chunks(project_number, section, max_age_days)
+        TatorSearch().begin_bulk_load(project_number)
+        try:
+            _build_chunks(project_number, section, mode, chunks, max_age_days, processes)
+        finally:
+            TatorSearch().end_bulk_load(project_number)
+    else:
+        _build_chunks(project_number, section, mode, [chunk], max_age_days, processes)
 
-    batch_size = 500
+def _build_chunks(project_number, section, mode, chunks, max_age_days, processes, index=None):
+    """ Indexes a list of ID range chunks, in a process pool if processes > 1.
+    """
+    args = [(project_number, section, mode, min_id, max_id, max_age_days, index)
+            for min_id, max_id in chunks]
+    start = time.time()
     count = 0
-    bar = ProgressBar(redirect_stderr=True, redirect_stdout=True)
-    dc = DeferredCall(qs)
-    total = qs.count()
-    bar.start(max_value=total)
-    for ok, result in streaming_bulk(TatorSearch().es, dc(),chunk_size=batch_size, raise_on_error=False):
-        action, result = result.popitem()
-        if not ok:
-            print(f"Failed to {action} document! {result}")
-        bar.update(min(count, total))
-        count += 1
-        if count > total:
-            print(f"Count exceeds list size by {total - count}")
-    bar.finish()
+    if processes > 1:
+        connections.close_all()
+        with multiprocessing.Pool(processes, initializer=_setup_index_worker) as pool:
+            for chunk_count in pool.imap_unordered(_index_chunk, args):
+                count += chunk_count
+                logger.info(f"Indexed {count} {section}...")
+    else:
+        for chunk_args in args:
+            count += _index_chunk(chunk_args)
+            logger.info(f"Indexed {count} {section}...")
+    elapsed = time.time() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    logger.info(f"Indexed {count} {section} documents in {elapsed:.1f}s "
+                f"({rate:.0f} documents/s).")
+
+def reindexProject(project_number, processes=1, num_shards=None):
+    """ Rebuilds the search index for a project without interrupting searches. A new
+        index version is built from the database while writes go to both versions,
+        then the project alias is atomically switched to the new version. If not given,
+        the number of shards is computed from row counts.
+    """
+    if num_shards is None:
+        num_shards = get_num_shards(project_number)
+    ts = TatorSearch()
+    ts.create_index(project_number)
+    index = ts.begin_reindex(project_number, num_shards)
+    logger.info(f"Reindexing project {project_number} into {index} with {num_shards} "
+                f"shards...")
+
+    # Wait for cached write index lists to expire so every process is dual writing
+    # before documents are copied.
+    time.sleep(2 * WRITE_INDEX_TTL)
+    buildSearchIndices(project_number, 'mappings')
+    ts.begin_bulk_load(project_number, index)
+    try:
+        for section in ['media', 'treeleaves', 'states', 'localizations']:
+            chunks = get_index_chunks(project_number, section)
+            _build_chunks(project_number, section, 'index', chunks, None, processes, index)
+    finally:
+        ts.end_bulk_load(project_number, index)
+    ts.replay_reindex_deletes(project_number, index)
+    ts.finish_reindex(project_number)
+    logger.info(f"Reindex of project {project_number} complete!")
+
+QUEUE_MAPPING = {'media': Media,
+                 'localization': Localization,
+                 'state': State,
+                 'leaf': Leaf}
+
+# Number of times the index worker tries to index a queued entity before dropping it.
+MAX_INDEX_ATTEMPTS = 5
+
+def processIndexQueue(batch_size=1000):
+    """ Writes a batch of queued entities to elasticsearch and removes them from the queue.
+        Repeated saves of the same entity are coalesced into one document write. Rows are
+        locked with SKIP LOCKED so multiple workers can drain the queue concurrently.
+        Rows of entities that fail to index are kept for a retry, up to MAX_INDEX_ATTEMPTS
+        times. Returns the number of queue rows removed.
+    """
+    with transaction.atomic():
+        rows = list(IndexQueue.objects.select_for_update(skip_locked=True)
+                    .order_by('id')[:batch_size])
+        if not rows:
+            return 0
+        ids_by_type = {}
+        for row in rows:
+            ids_by_type.setdefault(row.entity_type, set()).add(row.entity_id)
+        ts = TatorSearch()
+        documents = []
+        entity_by_doc = {}
+        for entity_type, ids in ids_by_type.items():
+            # Entities deleted since they were queued are skipped; their documents are
+            # removed by the delete signals.
+            qs = QUEUE_MAPPING[entity_type].objects.filter(pk__in=ids,
+                                                           project__isnull=False,
+                                                           meta__isnull=False)
+            for entity in qs.select_related('project', 'meta').iterator():
+                for doc in ts.build_document(entity):
+                    entity_by_doc[doc['_id']] = (entity_type, entity.pk)
+                    documents.append(doc)
+        failed = {}
+        for error in ts.bulk_add_documents(documents):
+            item = next(iter(error.values()))
+            key = entity_by_doc.get(item.get('_id'))
+            if key is not None:
+                failed[key] = item.get('error')
+        retry = []
+        for row in rows:
+            key = (row.entity_type, row.entity_id)
+            if key not in failed:
+                continue
+            if row.attempts + 1 < MAX_INDEX_ATTEMPTS:
+                retry.append(row.pk)
+            else:
+                logger.error(f"Dropping {row.entity_type} {row.entity_id} from the index "
+                             f"queue after {MAX_INDEX_ATTEMPTS} attempts: {failed[key]}")
+        if retry:
+            IndexQueue.objects.filter(pk__in=retry).update(attempts=F('attempts') + 1)
+        retry = set(retry)
+        IndexQueue.objects.filter(pk__in=[row.pk for row in rows if row.pk not in retry])\
+                          .delete()
+    return len(rows) - len(retry)
+
+def getIndexQueueLag():
+    """ Returns the age in seconds of the oldest queued index write, or zero if the queue
+        is empty.
+    """
+    oldest = IndexQueue.objects.order_by('created_datetime')\
+                               .values_list('created_datetime', flat=True)\
+                               .first()
+    if oldest is None:
+        return 0.0
+    return (timezone.now() - oldest).total_seconds()
 
 def makeDefaultVersion(project_number):
     """ Creates a default version for a project and sets all localizations
@@ -211,6 +381,7 @@ def makeDefaultVersion(project_number):
     logger.info("Updating localizations...")
     qs = Localization.objects.filter(project=project)
     qs.update(version=version)
+    index_bulk_update(project.pk, 'localization', qs.values_list('id', flat=True))
     logger.info("Updating states...")
     qs = State.objects.filter(project=project)
     qs.update(version=version)
@@ -365,6 +536,8 @@ def make_resources():
                             paths += [f['segment_info'] for f in media.media_files[key]]
                         except:
                             logger.info(f"Media {media.id} does not have a segment file!")
+                        paths += [f['seek_index'] for f in media.media_files[key]
+                                  if 'seek_index' in f]
         if media.original:
             paths.append(media.original)
         return paths
@@ -235,6 +235,8 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
         'main.renderers.CsvRenderer',
         'main.renderers.PprintRenderer',
+        'main.renderers.NdjsonRenderer',
+        'main.renderers.ColumnarRenderer',
     ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.openapi.AutoSchema',
     'DEFAULT_THROTTLE_CLASSES': [
@@ -263,6 +265,41 @@ if TATOR_EMAIL_ENABLED == 'true':
     TATOR_EMAIL_AWS_ACCESS_KEY_ID = os.getenv('TATOR_EMAIL_AWS_ACCESS_KEY_ID')
     TATOR_EMAIL_AWS_SECRET_ACCESS_KEY = os.getenv('TATOR_EMAIL_AWS_SECRET_ACCESS_KEY')
 
+# Search indexing. If asynchronous indexing is enabled, entity saves are queued and written
+# to elasticsearch in batches by the index worker. The worker polls an empty queue every
+# MAX_INDEX_LAG / 2 seconds and logs a warning when the oldest queued write is older than
+# MAX_INDEX_LAG seconds.
+ASYNC_INDEXING = os.getenv('ASYNC_INDEXING', 'false').lower() == 'true'
+MAX_INDEX_LAG = float(os.getenv('MAX_INDEX_LAG', '2.0'))
+
+# Read model. If enabled, documents store the REST representation of media and localizations
+# and ES-routed list requests are served from the search results. Requests for a project fall
+# back to postgres while it has queued index writes older than READ_MODEL_MAX_LAG seconds.
+READ_MODEL = os.getenv('ELASTICSEARCH_READ_MODEL', 'false').lower() == 'true'
+READ_MODEL_MAX_LAG = float(os.getenv('ELASTICSEARCH_READ_MODEL_MAX_LAG', '5.0'))
+
+# Sizing of project search indices. Shard counts are computed from the number of
+# documents in a project when its index is built.
+DOCS_PER_SHARD = int(os.getenv('ELASTICSEARCH_DOCS_PER_SHARD', '20000000'))
+MAX_SHARDS = int(os.getenv('ELASTICSEARCH_MAX_SHARDS', '32'))
+
+# Render cache for frames and graphics. Renders are kept in a local disk LRU of at most
+# RENDER_CACHE_MAX_BYTES and, if RENDER_CACHE_STORAGE is enabled, in object storage under
+# render_cache/, where they are deleted with their media. Storage is not otherwise bounded,
+# so enable it with a lifecycle rule expiring that prefix. Responses may be cached by
+# browsers for RENDER_CACHE_MAX_AGE seconds.
+RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR', '/tmp/render_cache')
+RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+RENDER_CACHE_STORAGE = os.getenv('RENDER_CACHE_STORAGE', 'false').lower() == 'true'
+RENDER_CACHE_MAX_AGE = int(os.getenv('RENDER_CACHE_MAX_AGE', '3600'))
+
+# In-process frame decoding. If enabled and PyAV is installed, each process keeps up to
+# DECODER_POOL_MAX_BYTES of video segments open in decoders and decodes frames with
+# DECODER_POOL_WORKERS threads. Otherwise frames are extracted with ffmpeg subprocesses.
+DECODER_POOL = os.getenv('DECODER_POOL', 'true').lower() == 'true'
+DECODER_POOL_MAX_BYTES = int(os.getenv('DECODER_POOL_MAX_BYTES', str(256 * 1024 ** 2)))
+DECODER_POOL_WORKERS = int(os.getenv('DECODER_POOL_WORKERS', '4'))
+
 SILENCED_SYSTEM_CHECKS = ['fields.W342']
 
 # Cognito configuration